@@ -0,0 +1,289 @@
+import argparse
+import sys
+from os import path, cpu_count, remove
+from time import perf_counter
+from numpy import zeros
+import tiffFunctions as tiffF
+import threshFunctions as threshF
+import curveFitData as cFD
+import exportFunctions as exportF
+import cacheFunctions as cacheF
+import stackAnalysis as stackA
+import histogramFunctions as histF
+import instrumentFunctions as instrumentF
+
+# default inputs, matching the GUI
+DEFAULT_THRESH = 1000
+DEFAULT_GOL_ITERATIONS = 1
+DEFAULT_GOL_FACTOR = 4
+
+# measures a whole stack and writes the data file that the GUI exports,
+# returning the number of measured frames
+# (numWorkers above 1 measures frames in that many processes)
+# thresh is one threshold or a sequence with one per frame
+# fileFormat is one of exportF.EXPORT_FORMATS (by default going by the
+# extension of outFileName), and settings are more metadata for it
+# stream also writes every frame to a CSV file as soon as it is measured
+# (see exportF.CsvStream): the data file itself if it is a CSV file,
+# otherwise a partial file next to it (see partialFileName) that is only
+# removed once the data file is written, so a run that fails keeps it
+# frames in the resultCache (a cacheFunctions.ResultCache) aren't measured
+# again, and those that are get stored in it
+# the frames of a hyperstack are its time points, projected over Z as given
+# (one of tiffF.PROJECTIONS)
+# tracking follows the spindle from frame to frame (see
+# stackA.measureStack), which measures in this process whatever numWorkers
+# is, since every frame needs the one before it
+def analyzeStack(fileName, outFileName, thresh, gOLI, gOLF, skipFrames=(),
+                 golMode=threshF.GOL_LEGACY, numWorkers=1,
+                 rotationMode=cFD.ROTATE_RESAMPLE, fileFormat=None,
+                 stream=False, settings=None, resultCache=None,
+                 projection=tiffF.PROJECT_MAX, tracking=False):
+    if fileFormat is None:
+        fileFormat = exportF.exportFormat(outFileName)
+    exportF.checkFormat(fileFormat)
+
+    stack = tiffF.openTiffStack(fileName, projection)
+    numFrames = stack.numFrames
+    dataTableArray = zeros((numFrames, len(cFD.DATA_NAMES)))
+    frameParams = exportF.emptyFrameParams(numFrames)
+    tossedFrames = sorted(f for f in set(skipFrames) if 1 <= f <= numFrames)
+    settings = dict(settings or {})
+    if stack.isHyperstack():
+        settings["projection"] = projection
+    settings["tracking"] = tracking
+    metadata = exportF.runMetadata(fileName, golMode=golMode,
+                                   rotationMode=rotationMode, **settings)
+
+    if numWorkers > 1 and not tracking:
+        frameResults = stackA.measureStackParallel(
+                fileName, thresh, gOLI, gOLF, tossedFrames, golMode,
+                numWorkers, rotationMode=rotationMode,
+                resultCache=resultCache, projection=projection)
+    else:
+        frameResults = stackA.measureStack(fileName, thresh, gOLI, gOLF,
+                                           tossedFrames, golMode,
+                                           rotationMode=rotationMode,
+                                           resultCache=resultCache,
+                                           projection=projection,
+                                           tracking=tracking)
+
+    csvStream = None
+    streamFileName = None
+    if stream:
+        streamFileName = (outFileName if fileFormat == exportF.EXPORT_CSV
+                          else partialFileName(outFileName))
+        csvStream = exportF.CsvStream(streamFileName, numFrames,
+                                      tossedFrames, metadata)
+
+    # the rows are collected and the data file is written once at the end,
+    # only if every frame was measured (a run that fails part way leaves no
+    # data file that could pass for a finished one)
+    measured = 0
+    complete = False
+    try:
+        for frameIndex, data, doesSpindleExist in frameResults:
+            if doesSpindleExist:
+                dataTableArray[frameIndex] = data
+            frameParams[frameIndex] = (stackA.frameThresh(thresh, frameIndex),
+                                       gOLI, gOLF)
+            if csvStream is not None:
+                csvStream.writeFrame(frameIndex, dataTableArray[frameIndex],
+                                     frameParams[frameIndex])
+            measured += 1
+        complete = True
+    finally:
+        if csvStream is not None:
+            csvStream.close(complete)
+        tiffF.closeTiffStack(fileName)
+
+    if streamFileName != outFileName:
+        with instrumentF.frame(fileName, None):
+            exportF.writeData(outFileName, dataTableArray, tossedFrames,
+                              frameParams, metadata, fileFormat)
+
+        # the frames streamed so far are only dropped once they are safely
+        # in the data file
+        if streamFileName is not None:
+            remove(streamFileName)
+
+    return measured
+
+# returns the data file name for a stack
+def outputFileName(fileName, outputDir=None, fileFormat=exportF.EXPORT_TEXT):
+    stem = path.splitext(path.basename(fileName))[0]
+    directory = outputDir if outputDir else path.dirname(fileName)
+    return path.join(directory,
+                     stem + "_data" + exportF.EXPORT_EXTENSIONS[fileFormat])
+
+# the file a stack is streamed into before its data file is written
+def partialFileName(outFileName):
+    return outFileName + ".partial.csv"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Measure the spindle in every frame of .tiff "
+                        "stacks and write the data files the GUI exports.")
+    parser.add_argument("tiffs", nargs="+", metavar="TIFF",
+                        help="stacks to measure")
+    parser.add_argument("-t", "--thresh", type=int, default=DEFAULT_THRESH,
+                        help="threshold (default %(default)s)")
+    parser.add_argument("-a", "--auto", choices=histF.THRESH_METHODS,
+                        help="choose each frame's threshold from its "
+                             "histogram instead of using --thresh")
+    parser.add_argument("-p", "--percentile", type=float,
+                        default=histF.DEFAULT_PERCENTILE,
+                        help="percentile of the percentile method (default "
+                             "%(default)s)")
+    parser.add_argument("-i", "--gol-iterations", type=int,
+                        default=DEFAULT_GOL_ITERATIONS,
+                        help="game of life iterations (default %(default)s)")
+    parser.add_argument("-f", "--gol-factor", type=int,
+                        default=DEFAULT_GOL_FACTOR,
+                        help="game of life factor (default %(default)s)")
+    parser.add_argument("-s", "--skip", type=int, nargs="+", default=[],
+                        metavar="FRAME",
+                        help="frame numbers (from 1) to skip and list as "
+                             "bad frames")
+    parser.add_argument("--gol-mode", choices=threshF.GOL_MODES,
+                        default=threshF.GOL_LEGACY,
+                        help="game of life update mode (default "
+                             "%(default)s)")
+    parser.add_argument("--rotation", choices=cFD.ROTATION_MODES,
+                        default=cFD.ROTATE_RESAMPLE,
+                        help="how the spindle is rotated before fitting: "
+                             "resample the image (default, the original "
+                             "method) or rotate only its pixel coordinates "
+                             "(faster, measurements differ slightly)")
+    parser.add_argument("-z", "--projection", choices=tiffF.PROJECTIONS,
+                        default=tiffF.PROJECT_MAX,
+                        help="how the Z slices of each time point of a "
+                             "hyperstack (ImageJ or OME-TIFF) are projected "
+                             "into the frame that is measured: the brightest "
+                             "value, the mean or the slice most in focus "
+                             "(default %(default)s)")
+    parser.add_argument("--track", action="store_true",
+                        help="follow the spindle from frame to frame, "
+                             "looking for it near where it was in the frame "
+                             "before and searching the whole frame only "
+                             "when it is lost (much faster on large frames "
+                             "of time lapses; measures in this process, "
+                             "ignoring --workers)")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of worker processes (default "
+                             "%(default)s, 0 for one per core)")
+    parser.add_argument("--profile", action="store_true",
+                        help="print how long each stage took and the "
+                             "slowest frames of each stack (measures in "
+                             "this process, ignoring --workers)")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="like --profile, also tracing the peak "
+                             "allocation of each stage (slower)")
+    parser.add_argument("--profile-out", metavar="FILE",
+                        help="write the per-frame stage records to FILE "
+                             "(CSV if it ends in .csv, otherwise JSON)")
+    parser.add_argument("--format", choices=exportF.EXPORT_FORMATS,
+                        help="data file format (default: going by the "
+                             "--output extension, otherwise text, the "
+                             "GUI's layout). the others add the inputs of "
+                             "every frame and the run settings")
+    parser.add_argument("--stream", action="store_true",
+                        help="also write every frame to a CSV file as soon "
+                             "as it is measured, so nothing is lost if the "
+                             "run dies part way")
+    parser.add_argument("--cache", metavar="FILE",
+                        help="result cache file, so frames measured before "
+                             "with the same inputs aren't measured again "
+                             F"(default: ${cacheF.ENVIRONMENT_VARIABLE} "
+                             F"or {cacheF.DEFAULT_CACHE_FILE})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="measure every frame, without the cache")
+    parser.add_argument("-o", "--output",
+                        help="data file name (only with a single stack)")
+    parser.add_argument("-d", "--output-dir",
+                        help="directory for the data files (default: next "
+                             "to each stack)")
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.tiffs) > 1:
+        parser.error("--output can only be used with a single stack")
+    if args.workers < 0:
+        parser.error("--workers cannot be negative")
+    if not 0 <= args.percentile <= 100:
+        parser.error("--percentile must be between 0 and 100")
+    numWorkers = args.workers if args.workers else (cpu_count() or 1)
+
+    # an --output with an extension of another format picks that format
+    fileFormat = args.format
+    if fileFormat is None:
+        extension = path.splitext(args.output or "")[1].lower()
+        fileFormat = exportF.EXTENSION_FORMATS.get(extension,
+                                                   exportF.EXPORT_TEXT)
+    try:
+        exportF.checkFormat(fileFormat)
+    except ImportError as e:
+        parser.error(str(e))
+
+    settings = {"autoThreshold": args.auto}
+    if args.auto == histF.THRESH_PERCENTILE:
+        settings["percentile"] = args.percentile
+
+    # stages are only recorded in this process
+    profile = args.profile or args.profile_memory or args.profile_out
+    if profile:
+        instrumentF.enable(traceMemory=args.profile_memory)
+        numWorkers = 1
+
+    resultCache = None
+    if not args.no_cache:
+        resultCache = cacheF.openResultCache(args.cache)
+
+    failures = 0
+    for fileName in args.tiffs:
+        if args.output:
+            outFileName = args.output
+        else:
+            outFileName = outputFileName(fileName, args.output_dir,
+                                         fileFormat)
+
+        # keep going with the other stacks if one of them fails
+        start = perf_counter()
+        try:
+            thresh = args.thresh
+            if args.auto:
+                thresh = histF.stackHistograms(
+                        fileName, args.projection).thresholds(
+                                args.auto, args.percentile)
+            measured = analyzeStack(fileName, outFileName, thresh,
+                                    args.gol_iterations, args.gol_factor,
+                                    args.skip, args.gol_mode, numWorkers,
+                                    args.rotation, fileFormat, args.stream,
+                                    settings, resultCache, args.projection,
+                                    args.track)
+        except Exception as e:
+            failures += 1
+            print(F"{fileName}: failed ({e})", file=sys.stderr)
+            if args.stream and path.exists(partialFileName(outFileName)):
+                print(F"{fileName}: the frames measured are in "
+                      F"{partialFileName(outFileName)}", file=sys.stderr)
+            continue
+        seconds = perf_counter() - start
+
+        rate = measured / seconds if seconds > 0 else 0.0
+        print(F"{fileName}: {measured} frames in {seconds:.1f} s "
+              F"({rate:.2f} frames/s) -> {outFileName}")
+
+        if profile:
+            print(instrumentF.breakdownText(fileName))
+            for stack, frameIndex, frameSeconds, slowestStage in (
+                    instrumentF.slowestFrames(3, fileName)):
+                print(F"  slow frame {frameIndex + 1}: "
+                      F"{1000 * frameSeconds:.1f} ms, mostly {slowestStage}")
+
+    if args.profile_out:
+        instrumentF.writeRecords(args.profile_out)
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
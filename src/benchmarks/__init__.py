@@ -0,0 +1,7 @@
+# benchmarks for the analysis functions
+# run the modules from the src directory, e.g.
+#     python -m benchmarks.golBenchmark
+# syntheticStack makes test stacks with known spindles, and stageBenchmark
+# times every stage on one and adds the results to its history file
+# (~/.cache/mitotic-spindle-tool/benchmark-history.jsonl unless --history
+# names another, see stageBenchmark.HISTORY_FILE)
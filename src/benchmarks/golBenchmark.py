@@ -0,0 +1,96 @@
+import argparse
+from time import perf_counter
+from numpy import uint16
+from numpy import sum as npsum
+from numpy.random import default_rng
+import threshFunctions as threshF
+
+# the original per-pixel game of life loop, kept as the reference that the
+# legacy mode has to reproduce exactly
+def loopThreshToArr(arr, thresh, gOLI, gOLF):
+    output = arr > thresh
+
+    output[0, :] = False
+    output[:, 0] = False
+    output[len(output) - 1, :] = False
+    output[:, len(output[0]) - 1] = False
+
+    for i in range(0, gOLI):
+        for r in range(1, len(output) - 1):
+            for c in range(1, len(output[r]) - 1):
+                if (npsum(output[r-1:r+2, c-1:c+2]) < gOLF):
+                    output[r][c] = False
+
+    return output
+
+# checks that the legacy mode matches the loop on many small random images
+def checkParity(trials, seed=0):
+    rng = default_rng(seed)
+    for trial in range(trials):
+        rows, cols = rng.integers(1, 40, size=2)
+        arr = rng.integers(0, 2000, size=(rows, cols)).astype(uint16)
+        thresh = int(rng.integers(0, 2000))
+        gOLI = int(rng.integers(1, 6))
+        gOLF = int(rng.integers(0, 9))
+
+        expected = loopThreshToArr(arr, thresh, gOLI, gOLF)
+        result = threshF.applyThreshToArr(arr, thresh, gOLI, gOLF,
+                                          threshF.GOL_LEGACY)
+        if not (expected == result).all():
+            raise AssertionError(F"legacy mode differs from the loop for "
+                                 F"shape {arr.shape}, thresh {thresh}, "
+                                 F"iterations {gOLI}, factor {gOLF}")
+
+    # a stack has to give the same answer as its frames one at a time
+    stack = rng.integers(0, 2000, size=(3, 50, 60)).astype(uint16)
+    for mode in threshF.GOL_MODES:
+        stackResult = threshF.applyThreshToArr(stack, 1000, 2, 4, mode)
+        for f in range(len(stack)):
+            frameResult = threshF.applyThreshToArr(stack[f], 1000, 2, 4, mode)
+            if not (stackResult[f] == frameResult).all():
+                raise AssertionError(F"{mode} mode differs between a stack "
+                                     F"and its frame {f}")
+
+# returns the best of several run times of func in seconds
+def bestTime(func, repeats):
+    times = []
+    for i in range(repeats):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Compare the game of life modes with the loop.")
+    parser.add_argument("--size", type=int, default=256,
+                        help="side length of the square test frame")
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--factor", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--parity-trials", type=int, default=200)
+    args = parser.parse_args()
+
+    checkParity(args.parity_trials)
+    print(F"parity: legacy mode matches the loop "
+          F"({args.parity_trials} random images)")
+
+    rng = default_rng(1)
+    arr = rng.integers(0, 2000, size=(args.size, args.size)).astype(uint16)
+
+    def runLoop():
+        loopThreshToArr(arr, 1000, args.iterations, args.factor)
+
+    def runMode(mode):
+        return lambda: threshF.applyThreshToArr(arr, 1000, args.iterations,
+                                                args.factor, mode)
+
+    loopTime = bestTime(runLoop, 1)
+    print(F"{'loop':>12}: {1000 * loopTime:10.2f} ms")
+    for mode in threshF.GOL_MODES:
+        modeTime = bestTime(runMode(mode), args.repeats)
+        print(F"{mode:>12}: {1000 * modeTime:10.2f} ms "
+              F"({loopTime / modeTime:.0f}x)")
+
+if __name__ == "__main__":
+    main()
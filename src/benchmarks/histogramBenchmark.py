@@ -0,0 +1,108 @@
+import argparse
+from time import perf_counter
+from numpy import arange, array, bincount, percentile as nppercentile, uint16
+from numpy.random import default_rng
+import histogramFunctions as histF
+
+# one frame at a time references for the vectorized threshold methods,
+# written straight from their textbook definitions
+def loopOtsu(values, counts):
+    total = counts.sum()
+    totalSum = (values * counts).sum()
+    best = -1.0
+    bestValue = values[0]
+    lowWeight = 0
+    lowSum = 0
+    for value, count in zip(values, counts):
+        lowWeight += count
+        lowSum += value * count
+        highWeight = total - lowWeight
+        if lowWeight == 0 or highWeight == 0:
+            continue
+        lowMean = lowSum / lowWeight
+        highMean = (totalSum - lowSum) / highWeight
+        variance = lowWeight * highWeight * (lowMean - highMean)**2
+        if variance > best:
+            best = variance
+            bestValue = value
+    return bestValue
+
+def loopTriangle(values, counts):
+    peak = int(counts.argmax())
+    nonzero = counts.nonzero()[0]
+    first, last = nonzero[0], nonzero[-1]
+    if last - peak >= peak - first:
+        end, span = last + 1, range(peak, last + 1)
+    else:
+        end, span = first - 1, range(first, peak + 1)
+
+    # distance from the line through (peak, counts[peak]) and (end, 0)
+    height = counts[peak]
+    best = -1.0
+    bestBin = peak
+    for b in span:
+        distance = abs((end - peak) * (counts[b] - height)
+                       + height * (b - peak))
+        if distance > best:
+            best = distance
+            bestBin = b
+    return values[bestBin]
+
+# frames with a dim, drifting background and a bright blob
+def randomFrames(rng, numFrames, size):
+    frames = []
+    for f in range(numFrames):
+        background = 600 * (1 - 0.3 * f / numFrames)
+        frame = rng.normal(background, 40, (size, size))
+        y, x = rng.integers(size // 4, 3 * size // 4, 2)
+        frame[y - 5:y + 5, x - 15:x + 15] += rng.uniform(1000, 3000)
+        frames.append(frame.clip(0, 65535).astype(uint16))
+    return frames
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Check the vectorized automatic thresholds against "
+                        "one frame at a time references and time them.")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--size", type=int, default=256)
+    args = parser.parse_args()
+
+    frames = randomFrames(default_rng(0), args.frames, args.size)
+
+    start = perf_counter()
+    histograms = histF.computeHistograms(frames)
+    histogramTime = perf_counter() - start
+
+    values = histograms.values()
+    for f in (0, len(frames) - 1):
+        expected = bincount(frames[f].ravel(), minlength=values[-1] + 1)
+        if (histograms.counts[f] != expected[histograms.offset:]).any():
+            raise AssertionError(F"histogram of frame {f} is wrong")
+
+    references = {
+        histF.THRESH_OTSU: lambda counts: loopOtsu(values, counts),
+        histF.THRESH_TRIANGLE: lambda counts: loopTriangle(values, counts)}
+
+    print(F"{args.frames} histograms of {args.size} x {args.size}: "
+          F"{1000 * histogramTime:.1f} ms")
+    for method in histF.THRESH_METHODS:
+        start = perf_counter()
+        thresholds = histograms.thresholds(method)
+        vectorTime = perf_counter() - start
+
+        if method == histF.THRESH_PERCENTILE:
+            expected = array([nppercentile(frame, histF.DEFAULT_PERCENTILE,
+                                           method="inverted_cdf")
+                              for frame in frames])
+        else:
+            expected = array([references[method](counts.astype(float))
+                              for counts in histograms.counts])
+        mismatches = arange(len(frames))[thresholds != expected]
+        if len(mismatches):
+            raise AssertionError(F"{method} thresholds differ in frames "
+                                 F"{mismatches[:10]}")
+        print(F"{method:>12}: {1000 * vectorTime:.2f} ms, matches the "
+              F"reference")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+from time import perf_counter
+from numpy import zeros
+from numpy.random import default_rng
+import labelFunctions as labelF
+import threshFunctions as threshF
+import tiffFunctions as tiffF
+
+# the original point-by-point clustering from getSpindleImg, kept as the
+# reference for the labeling. returns a list of objects, each a list of
+# (x, y) points
+def loopGroupPoints(threshArr):
+    r2, c2 = threshArr.nonzero()
+    if len(c2) == 0:
+        return []
+
+    tObjects = [[[c2[0]], [r2[0]]]]
+
+    for i in range(0, len(c2)):
+        noMatch = True
+        o = 0
+        while noMatch and o < len(tObjects):
+            j = len(tObjects[o][0]) - 1
+            while noMatch and j >= 0:
+                if (abs(tObjects[o][0][j] - c2[i]) <= 2
+                        and abs(tObjects[o][1][j] - r2[i]) <= 2):
+                    tObjects[o][0].append(c2[i])
+                    tObjects[o][1].append(r2[i])
+                    noMatch = False
+                else:
+                    j -= 1
+            o += 1
+        if noMatch:
+            tObjects.append([[c2[i]], [r2[i]]])
+
+    tObjects.sort(key=lambda o: len(o[0]), reverse=True)
+
+    startLength = len(tObjects) + 1
+    while startLength != len(tObjects):
+        startLength = len(tObjects)
+        o1 = 0
+        while o1 < len(tObjects):
+            o2 = o1 + 1
+            while o2 < len(tObjects):
+                noMatch = True
+                i = len(tObjects[o1][0]) - 1
+                while noMatch and i >= 0:
+                    xs, ys = tObjects[o2]
+                    if any(abs(x - tObjects[o1][0][i]) < 10
+                           and abs(y - tObjects[o1][1][i]) < 10
+                           for x, y in zip(xs, ys)):
+                        noMatch = False
+                        tObjects[o1][0].extend(xs)
+                        tObjects[o1][1].extend(ys)
+                        tObjects.pop(o2)
+                    i -= 1
+                o2 += 1
+            o1 += 1
+
+    return [list(zip(xs, ys)) for xs, ys in tObjects]
+
+# turns the label image into the same grouping as loopGroupPoints
+def labelGroupPoints(threshArr):
+    labelArr, objectSizes, objectBoxes = labelF.labelThreshArr(threshArr)
+    groups = []
+    for o in range(len(objectSizes)):
+        ys, xs = (labelArr == o + 1).nonzero()
+        groups.append(list(zip(xs, ys)))
+    return groups
+
+# raises an error if the two clusterings group the points differently
+def compareGroups(threshArr, description):
+    start = perf_counter()
+    expected = loopGroupPoints(threshArr)
+    loopTime = perf_counter() - start
+
+    start = perf_counter()
+    result = labelGroupPoints(threshArr)
+    labelTime = perf_counter() - start
+
+    if (set(frozenset(g) for g in expected)
+            != set(frozenset(g) for g in result)):
+        raise AssertionError(F"labeling differs from the loop on "
+                             F"{description}")
+    sizes = [len(g) for g in result]
+    if sizes != sorted(sizes, reverse=True):
+        raise AssertionError(F"labels are not ordered by size on "
+                             F"{description}")
+    return loopTime, labelTime
+
+# random sparse points and blobs on a small frame
+def randomThreshArr(rng, rows, cols):
+    threshArr = rng.random((rows, cols)) < rng.uniform(0.001, 0.02)
+    for b in range(int(rng.integers(0, 6))):
+        y, x = rng.integers(0, rows), rng.integers(0, cols)
+        h, w = rng.integers(1, 15, size=2)
+        threshArr[y:y + h, x:x + w] = True
+    return threshArr
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Check the labeling against the original "
+                        "clustering and compare their speed.")
+    parser.add_argument("--trials", type=int, default=50,
+                        help="number of random frames to compare")
+    parser.add_argument("--tiff", help="recorded stack to compare on")
+    parser.add_argument("--thresh", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--factor", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = default_rng(0)
+    totals = zeros(2)
+    for trial in range(args.trials):
+        threshArr = randomThreshArr(rng, 120, 160)
+        totals += compareGroups(threshArr, F"random frame {trial}")
+    print(F"random frames: {args.trials} match, loop {totals[0]:.2f} s, "
+          F"labeling {totals[1]:.3f} s")
+
+    if args.tiff:
+        totals = zeros(2)
+        numFrames = tiffF.framesInTiff(args.tiff)
+        for frame in range(numFrames):
+            imageArr = tiffF.arrFromTiff(args.tiff, frame)
+            threshArr = threshF.applyThreshToArr(imageArr, args.thresh,
+                                                 args.iterations,
+                                                 args.factor)
+            totals += compareGroups(threshArr, F"frame {frame + 1}")
+        print(F"{args.tiff}: {numFrames} frames match, loop "
+              F"{totals[0]:.2f} s, labeling {totals[1]:.3f} s")
+
+if __name__ == "__main__":
+    main()
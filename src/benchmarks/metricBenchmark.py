@@ -0,0 +1,92 @@
+import argparse
+from time import perf_counter
+from numpy import sqrt as npsqrt
+from numpy import abs as npabs, array, maximum
+from numpy.random import default_rng
+from scipy.integrate import quad
+import metricFunctions as metricF
+
+# the original quad based metrics from spindleMeasurements, kept as the
+# reference for the closed forms
+def quadMetrics(a, b, c, lineSlope, minX, maxX):
+    poleSeparation = npsqrt(lineSlope**2 + 1) * (maxX - minX)
+
+    def arcFunc(t):
+        return npsqrt(4 * a**2 * t**2 + 4 * a * b * t + b**2 + 1)
+    arcLength = quad(arcFunc, minX, maxX)[0]
+
+    def spindleFunc(x):
+        return a * x**2 + b * x + c
+
+    x1 = minX
+    x2 = maxX
+    y1 = spindleFunc(x1)
+    y2 = spindleFunc(x2)
+    m1 = (y2 - y1) / (x2 - x1)
+
+    def poleFunc(x):
+        return m1 * (x - x1) + y1
+
+    areaCurve = abs(quad(poleFunc, x1, x2)[0] - quad(spindleFunc, x1, x2)[0])
+
+    maxCurve = abs(2*a)
+
+    def curvatureFunc(x):
+        return (2 * a) / ((4 * a**2 * x**2 + 4 * a * b * x + b**2 + 1)**(3/2))
+
+    avgCurve = abs(quad(curvatureFunc, x1, x2)[0] / (x2 - x1))
+
+    return [poleSeparation, arcLength, areaCurve, maxCurve, avgCurve]
+
+# random fits shaped like the ones found in rotated spindle images, from
+# nearly straight to strongly curved
+def randomFits(rng, numFits):
+    minX = rng.uniform(0, 400, numFits).round()
+    maxX = minX + rng.uniform(1, 300, numFits).round()
+    a = rng.choice([-1, 1], numFits) * 10 ** rng.uniform(-12, -1, numFits)
+    b = rng.uniform(-2, 2, numFits) - a * (minX + maxX)
+    c = rng.uniform(0, 500, numFits)
+    lineSlope = rng.uniform(-0.5, 0.5, numFits)
+    return a, b, c, lineSlope, minX, maxX
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Check the closed form metrics against the quad "
+                        "integrals and compare their speed.")
+    parser.add_argument("--fits", type=int, default=2000)
+    parser.add_argument("--rtol", type=float, default=1e-7,
+                        help="allowed relative difference")
+    args = parser.parse_args()
+
+    a, b, c, lineSlope, minX, maxX = randomFits(default_rng(0), args.fits)
+
+    start = perf_counter()
+    expected = array([quadMetrics(*fit) for fit in
+                      zip(a, b, c, lineSlope, minX, maxX)])
+    quadTime = perf_counter() - start
+
+    start = perf_counter()
+    result = metricF.spindleMetrics(a, b, lineSlope, minX, maxX)
+    closedTime = perf_counter() - start
+
+    # the area metric is the difference of two integrals that quad only
+    # computes to about 1e-8 of their size, so that sets its scale
+    scale = maximum(npabs(expected), 1e-300)
+    integralSize = (npabs(a) * maxX**2 + npabs(b) * maxX + npabs(c)) * (
+            maxX - minX)
+    scale[:, 2] = maximum(scale[:, 2], 1e-8 * integralSize)
+    worst = (npabs(result - expected) / scale).max(axis=0)
+    print("largest relative differences:")
+    for name, difference in zip(("pole separation", "arc length",
+                                 "area metric", "max curvature",
+                                 "avg curvature"), worst):
+        print(F"{name:>16}: {difference:.2e}")
+    if (worst > args.rtol).any():
+        raise AssertionError(F"closed forms differ from quad by more than "
+                             F"{args.rtol}")
+
+    print(F"{args.fits} fits: quad {quadTime:.2f} s, closed form "
+          F"{1000 * closedTime:.2f} ms")
+
+if __name__ == "__main__":
+    main()
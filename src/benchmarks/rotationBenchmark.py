@@ -0,0 +1,88 @@
+import argparse
+from time import perf_counter
+from numpy import array, abs as npabs, maximum, percentile
+import threshFunctions as threshF
+import curveFitData as cFD
+from benchmarks import syntheticStack as synthS
+
+# documented agreement of the coordinates rotation mode with the resampled
+# one, as the largest difference relative to the resampled value for each
+# of the data names. a value is taken to be at least its floor, since the
+# area and curvatures of a nearly straight spindle are mostly noise.
+# spindles shorter than MIN_LENGTH pixels are fitted on too few pixels to
+# hold to this, so they're only reported
+TOLERANCES = (0.05, 0.05, 0.1, 0.15, 0.15)
+FLOORS = (0.0, 0.0, 500.0, 0.005, 0.005)
+MIN_LENGTH = 60
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Compare the coordinates rotation mode of the "
+                        "spindle analysis with the resampled one on "
+                        "synthetic frames, and time both.")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--thresh", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    frames, spindles = synthS.syntheticFrames(args.frames, args.size,
+                                              args.size, seed=args.seed)
+    threshArrs = [threshF.applyThreshToArr(frame, args.thresh, 1, 4)
+                  for frame in frames]
+
+    results = {}
+    for mode in cFD.ROTATION_MODES:
+        start = perf_counter()
+        analyses = cFD.analyzeSpindles(frames, threshArrs,
+                                       rotationMode=mode)
+        seconds = perf_counter() - start
+        results[mode] = analyses
+        print(F"{mode:>12}: {1000 * seconds / args.frames:.2f} ms per frame")
+
+    found = [a.doesSpindleExist and b.doesSpindleExist
+             for a, b in zip(results[cFD.ROTATE_RESAMPLE],
+                             results[cFD.ROTATE_COORDINATES])]
+    resampled = array([a.data for a, f in
+                       zip(results[cFD.ROTATE_RESAMPLE], found) if f])
+    coordinates = array([a.data for a, f in
+                         zip(results[cFD.ROTATE_COORDINATES], found) if f])
+    print(F"spindle found by both modes in {len(resampled)} of "
+          F"{args.frames} frames")
+    if not len(resampled):
+        return
+
+    long = resampled[:, 0] >= MIN_LENGTH
+    failed = compareModes(resampled[long], coordinates[long],
+                          F"spindles of {MIN_LENGTH} px or more")
+    if (~long).any():
+        compareModes(resampled[~long], coordinates[~long],
+                     "shorter spindles (not checked)")
+
+    if failed:
+        raise AssertionError("the rotation modes differ by more than the "
+                             "documented tolerance")
+
+# prints how far the coordinates mode's data is from the resampled one's
+# relative to the tolerances, returns whether any of it is beyond them
+def compareModes(resampled, coordinates, description):
+    if not len(resampled):
+        return False
+
+    scale = maximum(maximum(npabs(resampled), FLOORS), 1e-300)
+    relative = npabs(coordinates - resampled) / scale
+
+    print(F"relative differences from the resampled mode, "
+          F"{len(resampled)} {description}")
+    print("(median / 95th percentile / largest / tolerance):")
+    failed = False
+    for i, (name, tolerance) in enumerate(zip(cFD.DATA_NAMES, TOLERANCES)):
+        values = relative[:, i]
+        print(F"{name:>24}: {percentile(values, 50):.4f} / "
+              F"{percentile(values, 95):.4f} / {values.max():.4f} / "
+              F"{tolerance}")
+        failed |= values.max() > tolerance
+    return failed
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+from os import cpu_count, path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from numpy import allclose
+import stackAnalysis as stackA
+from benchmarks import syntheticStack as synthS
+
+# returns the worker counts to try: powers of two up to the core count,
+# and the core count itself
+def workerCounts(maxWorkers):
+    counts = []
+    n = 1
+    while n < maxWorkers:
+        counts.append(n)
+        n *= 2
+    counts.append(maxWorkers)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Time measureStackParallel on a synthetic stack "
+                        "from one worker up to every core.")
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--side", type=int, default=256,
+                        help="side length of the square frames")
+    parser.add_argument("--max-workers", type=int, default=cpu_count() or 1)
+    parser.add_argument("--thresh", type=int, default=1500)
+    args = parser.parse_args()
+
+    # an uncompressed stack is memory mapped, a compressed one is decoded
+    # by every worker through its own file handle. the parent has the stack
+    # open (from the serial run) when the workers start, like a batch run
+    with TemporaryDirectory() as directory:
+        for compression in (None, "tiff_lzw"):
+            fileName = path.join(directory, F"scaling_{compression}.tif")
+            synthS.writeSyntheticStack(fileName, args.frames, args.side,
+                                       args.side, compression=compression)
+            print(F"{compression or 'uncompressed'}:")
+            timeStack(fileName, args)
+
+def timeStack(fileName, args):
+    start = perf_counter()
+    expected = list(stackA.measureStack(fileName, args.thresh, 1, 4))
+    serialTime = perf_counter() - start
+    print(F"{'serial':>10}: {args.frames / serialTime:8.2f} frames/s")
+
+    # at least two workers, where they could get in each other's way
+    for numWorkers in workerCounts(max(args.max_workers, 2)):
+        start = perf_counter()
+        results = list(stackA.measureStackParallel(
+                fileName, args.thresh, 1, 4, numWorkers=numWorkers))
+        seconds = perf_counter() - start
+
+        # results have to come back complete and in frame order
+        if ([r[0] for r in results] != [r[0] for r in expected]
+                or not allclose([r[1] for r in results],
+                                [e[1] for e in expected], rtol=1e-9)):
+            raise AssertionError(F"{numWorkers} workers gave different "
+                                 F"results than the serial run")
+        print(F"{numWorkers:>3} workers: {args.frames / seconds:8.2f} "
+              F"frames/s ({serialTime / seconds:.2f}x serial)")
+
+if __name__ == "__main__":
+    main()
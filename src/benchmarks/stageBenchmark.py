@@ -0,0 +1,227 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from os import environ, makedirs, path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from numpy import array, median, zeros, abs as npabs
+import numpy
+import tiffFunctions as tiffF
+import threshFunctions as threshF
+import curveFitData as cFD
+import exportFunctions as exportF
+from benchmarks import syntheticStack as synthS
+
+# the stages timed, in the order a frame goes through them
+STAGES = ("openTiffStack", "arrFromTiff", "pixFromArr", "applyThreshToArr",
+          "getSpindleImg", "spindleMeasurements", "plotSpindle", "export")
+
+# default history file, one JSON record per line, kept out of the source
+# tree (--history names another, e.g. one that is checked in)
+HISTORY_FILE = path.join(path.expanduser("~"), ".cache",
+                         "mitotic-spindle-tool", "benchmark-history.jsonl")
+
+# a stage is reported as a regression when its median time per call is
+# this much slower than in the previous run with the same parameters
+REGRESSION_TOLERANCE = 0.2
+
+# runs every frame of a stack through the stages repeats times
+# returns ({stage: [seconds per call]}, data table, doesSpindleExist list)
+def timeStages(fileName, thresh, gOLI, gOLF, repeats=1):
+    # imported here so the rest of the module works without a display
+    import pixFunctions as pixF
+    import plotSpindle as pS
+
+    times = {stage: [] for stage in STAGES}
+
+    def timed(stage, func, *args):
+        start = perf_counter()
+        result = func(*args)
+        times[stage].append(perf_counter() - start)
+        return result
+
+    with TemporaryDirectory() as directory:
+        exportName = path.join(directory, "export.txt")
+        for r in range(repeats):
+
+            # start from a closed file so frames are really read
+            tiffF.closeTiffStack(fileName)
+            stack = timed("openTiffStack", tiffF.openTiffStack, fileName)
+            dataTable = zeros((stack.numFrames, len(cFD.DATA_NAMES)))
+            exists = []
+
+            for f in range(stack.numFrames):
+                imageArr = timed("arrFromTiff", tiffF.arrFromTiff, fileName,
+                                 f)
+                timed("pixFromArr", pixF.pixFromArr, imageArr)
+                threshArr = timed("applyThreshToArr",
+                                  threshF.applyThreshToArr, imageArr, thresh,
+                                  gOLI, gOLF)
+                timed("getSpindleImg", cFD.getSpindleImg, imageArr,
+                      threshArr)
+                data, doesSpindleExist = timed(
+                        "spindleMeasurements", cFD.spindleMeasurements,
+                        imageArr, threshArr)
+                plotData = cFD.spindlePlot(imageArr, threshArr)
+                timed("plotSpindle", pS.plotSpindle, *plotData)
+
+                if doesSpindleExist:
+                    dataTable[f] = data
+                exists.append(doesSpindleExist)
+
+            timed("export", exportF.writeDataText, exportName, dataTable, [])
+
+    tiffF.closeTiffStack(fileName)
+    return times, dataTable, exists
+
+# calls and milliseconds per call of each stage
+def stageSummary(times):
+    summary = {}
+    for stage, seconds in times.items():
+        ms = 1000 * array(seconds)
+        summary[stage] = {"calls": len(ms),
+                          "totalMs": float(ms.sum()),
+                          "meanMs": float(ms.mean()),
+                          "medianMs": float(median(ms)),
+                          "minMs": float(ms.min())}
+    return summary
+
+# how far the measurements are from the synthetic ground truth: the median
+# relative error of each DATA_NAMES value over the frames with a spindle
+def accuracySummary(dataTable, exists, spindles):
+    found = array(exists)
+    accuracy = {"foundFraction": float(found.mean())}
+    if not found.any():
+        return accuracy
+
+    truth = array([spindle.data for spindle in spindles])[found]
+    errors = npabs(dataTable[found] - truth) / npabs(truth)
+    for name, error in zip(cFD.DATA_NAMES, median(errors, axis=0)):
+        accuracy[name] = float(error)
+    return accuracy
+
+# the git description of the checked out code, if it is a git checkout
+def codeVersion():
+    try:
+        return subprocess.run(
+                ["git", "describe", "--always", "--dirty"],
+                cwd=path.dirname(path.abspath(__file__)),
+                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# returns the last record in a history file run with params, or None
+def previousRecord(historyName, params):
+    if not path.exists(historyName):
+        return None
+    previous = None
+    with open(historyName, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("params") == params:
+                    previous = record
+    return previous
+
+def appendHistory(historyName, record):
+    makedirs(path.dirname(path.abspath(historyName)), exist_ok=True)
+    with open(historyName, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+# the stages whose median time grew by more than tolerance since previous
+def regressions(record, previous, tolerance=REGRESSION_TOLERANCE):
+    slower = []
+    for stage, stats in record["stages"].items():
+        before = previous["stages"].get(stage)
+        if before and stats["medianMs"] > (1 + tolerance) * before[
+                "medianMs"]:
+            slower.append((stage, before["medianMs"], stats["medianMs"]))
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Time each stage of the analysis on a synthetic "
+                        "spindle stack, check the measurements against the "
+                        "ground truth and record the results.")
+    parser.add_argument("--frames", type=int, default=16)
+    parser.add_argument("--height", type=int, default=256)
+    parser.add_argument("--width", type=int, default=256)
+    parser.add_argument("--noise", type=float, default=synthS.NOISE)
+    parser.add_argument("--clutter", type=float, default=synthS.CLUTTER)
+    parser.add_argument("--blobs", type=int, default=synthS.NUM_BLOBS)
+    parser.add_argument("--compression",
+                        help="PIL tiff compression, e.g. tiff_deflate "
+                             "(default: uncompressed)")
+    parser.add_argument("--thresh", type=int, default=1500)
+    parser.add_argument("--gol-iterations", type=int, default=1)
+    parser.add_argument("--gol-factor", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history", default=HISTORY_FILE,
+                        help="JSON lines file the results are added to "
+                             "(default %(default)s)")
+    parser.add_argument("--no-history", action="store_true",
+                        help="don't record this run")
+    parser.add_argument("--tolerance", type=float,
+                        default=REGRESSION_TOLERANCE,
+                        help="slowdown reported as a regression (default "
+                             "%(default)s)")
+    args = parser.parse_args(argv)
+
+    # pixmaps need a Qt application, which doesn't need a screen here
+    environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtGui import QGuiApplication
+    app = QGuiApplication.instance() or QGuiApplication([])
+
+    params = {"frames": args.frames, "height": args.height,
+              "width": args.width, "noise": args.noise,
+              "clutter": args.clutter, "blobs": args.blobs,
+              "compression": args.compression, "thresh": args.thresh,
+              "golIterations": args.gol_iterations,
+              "golFactor": args.gol_factor, "seed": args.seed}
+
+    with TemporaryDirectory() as directory:
+        fileName = path.join(directory, "synthetic.tif")
+        spindles = synthS.writeSyntheticStack(
+                fileName, args.frames, args.height, args.width, args.noise,
+                args.clutter, args.blobs, seed=args.seed,
+                compression=args.compression)
+        times, dataTable, exists = timeStages(
+                fileName, args.thresh, args.gol_iterations, args.gol_factor,
+                args.repeats)
+
+    record = {"time": datetime.now(timezone.utc).isoformat(),
+              "version": codeVersion(),
+              "python": platform.python_version(),
+              "numpy": numpy.__version__,
+              "machine": platform.platform(),
+              "params": params,
+              "stages": stageSummary(times),
+              "accuracy": accuracySummary(dataTable, exists, spindles)}
+
+    print(F"{'stage':>20} {'calls':>6} {'median ms':>10} {'total ms':>10}")
+    for stage, stats in record["stages"].items():
+        print(F"{stage:>20} {stats['calls']:>6} {stats['medianMs']:>10.3f} "
+              F"{stats['totalMs']:>10.1f}")
+    print("median relative error against the ground truth:")
+    for name, value in record["accuracy"].items():
+        print(F"{name:>24}: {value:.4f}")
+
+    slower = []
+    if not args.no_history:
+        previous = previousRecord(args.history, params)
+        if previous is not None:
+            slower = regressions(record, previous, args.tolerance)
+            for stage, before, after in slower:
+                print(F"REGRESSION {stage}: {before:.3f} ms -> "
+                      F"{after:.3f} ms (since {previous['version']})")
+        appendHistory(args.history, record)
+        print(F"recorded in {args.history}")
+
+    return 1 if slower else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+from typing import NamedTuple
+from numpy import (arange, linspace, zeros, ones, exp, sin, cos, pi, clip,
+                   rint, uint16, float64, stack, array)
+from numpy.random import default_rng
+from scipy.ndimage import distance_transform_edt, gaussian_filter
+from PIL import Image
+import metricFunctions as metricF
+
+# default look of a synthetic frame (intensities in 16-bit counts)
+BACKGROUND = 400
+SPINDLE_BRIGHTNESS = 3000
+SPINDLE_WIDTH = 2.5
+NOISE = 60
+CLUTTER = 300
+NUM_BLOBS = 4
+
+# the spindle drawn in one synthetic frame and its true measurements
+# center: (x, y) of the spindle's vertex in the frame
+# angle: angle (radians) of the spindle's axis from the x axis
+# halfLength: half the pole separation along the axis
+# curve: the spindle follows y = curve * x^2 across its axis, so its
+#        maximum curvature is |2 * curve|
+# data: the DATA_NAMES values of the curve (curveFitData.DATA_NAMES)
+class SyntheticSpindle(NamedTuple):
+    center: tuple
+    angle: float
+    halfLength: float
+    curve: float
+    data: tuple
+
+# returns the measurements of the curve y = curve * x^2 from -halfLength to
+# halfLength, computed the same way as those of a fit curve
+def spindleData(curve, halfLength):
+    return tuple(float(d) for d in metricF.spindleMetrics(
+            curve, 0.0, 0.0, -halfLength, halfLength))
+
+# draws one synthetic frame: a smooth uneven background (clutter), bright
+# gaussian distractor blobs, a curved spindle and gaussian noise
+# returns (uint16 frame, SyntheticSpindle)
+def syntheticFrame(rng, height, width, curve, noise=NOISE, clutter=CLUTTER,
+                   numBlobs=NUM_BLOBS, halfLength=None, angle=None,
+                   center=None):
+    if halfLength is None:
+        halfLength = rng.uniform(0.12, 0.2) * min(height, width)
+    if angle is None:
+        angle = rng.uniform(-pi / 2, pi / 2)
+    if center is None:
+        center = (width / 2 + rng.uniform(-0.05, 0.05) * width,
+                  height / 2 + rng.uniform(-0.05, 0.05) * height)
+
+    arr = zeros((height, width), dtype=float64) + BACKGROUND
+
+    # clutter: smoothed noise stretched from 0 to clutter above the
+    # background
+    if clutter > 0:
+        smooth = gaussian_filter(rng.normal(size=(height, width)),
+                                 min(height, width) / 16)
+        smooth -= smooth.min()
+        arr += clutter * smooth / max(smooth.max(), 1e-12)
+
+    # distractor blobs: round and too small to be mistaken for the spindle
+    ys, xs = arange(height)[:, None], arange(width)[None, :]
+    for b in range(numBlobs):
+        blobY = rng.uniform(0, height)
+        blobX = rng.uniform(0, width)
+        radius = rng.uniform(1.5, 3)
+        arr += (rng.uniform(0.5, 1) * SPINDLE_BRIGHTNESS
+                * exp(-((ys - blobY)**2 + (xs - blobX)**2)
+                      / (2 * radius**2)))
+
+    # the spindle: points along the curve, blurred by their distance
+    t = linspace(-halfLength, halfLength, int(8 * halfLength) + 2)
+    curveX = center[0] + t * cos(angle) - curve * t**2 * sin(angle)
+    curveY = center[1] + t * sin(angle) + curve * t**2 * cos(angle)
+    isOnCurve = ones((height, width), dtype=bool)
+    inside = ((curveX >= 0) & (curveX <= width - 1) & (curveY >= 0)
+              & (curveY <= height - 1))
+    isOnCurve[rint(curveY[inside]).astype(int),
+              rint(curveX[inside]).astype(int)] = False
+    distance = distance_transform_edt(isOnCurve)
+    arr += SPINDLE_BRIGHTNESS * exp(-distance**2 / (2 * SPINDLE_WIDTH**2))
+
+    arr += rng.normal(0, noise, size=(height, width))
+    frame = clip(rint(arr), 0, 65535).astype(uint16)
+
+    return frame, SyntheticSpindle(center, float(angle), float(halfLength),
+                                   float(curve),
+                                   spindleData(curve, halfLength))
+
+# the spindle curves of a synthetic stack: from nearly straight at the
+# first frame to maxCurve at the last, with alternating sign
+def curveSchedule(numFrames, maxCurve=0.02):
+    curves = linspace(0.001, maxCurve, numFrames)
+    signs = 1 - 2 * (arange(numFrames) % 2)
+    return curves * signs
+
+# makes numFrames synthetic frames, returning (frames array, spindles)
+def syntheticFrames(numFrames, height=256, width=256, noise=NOISE,
+                    clutter=CLUTTER, numBlobs=NUM_BLOBS, maxCurve=0.02,
+                    seed=0):
+    rng = default_rng(seed)
+    frames = []
+    spindles = []
+    for curve in curveSchedule(numFrames, maxCurve):
+        frame, spindle = syntheticFrame(rng, height, width, curve, noise,
+                                        clutter, numBlobs)
+        frames.append(frame)
+        spindles.append(spindle)
+    return stack(frames), spindles
+
+# makes numFrames synthetic frames of a time lapse, where one spindle
+# drifts across the frame and turns a little from each frame to the next
+# (by about drift pixels and turn radians), returning
+# (frames array, spindles). halfLength is half the spindle's length in
+# pixels (by default chosen as in syntheticFrame)
+def timeLapseFrames(numFrames, height=256, width=256, noise=NOISE,
+                    clutter=CLUTTER, numBlobs=NUM_BLOBS, maxCurve=0.02,
+                    drift=2.0, turn=0.03, halfLength=None, seed=0):
+    rng = default_rng(seed)
+    if halfLength is None:
+        halfLength = rng.uniform(0.12, 0.2) * min(height, width)
+    angle = rng.uniform(-pi / 2, pi / 2)
+    center = array((width / 2, height / 2))
+    frames = []
+    spindles = []
+    for curve in curveSchedule(numFrames, maxCurve):
+        frame, spindle = syntheticFrame(rng, height, width, abs(curve),
+                                        noise, clutter, numBlobs,
+                                        halfLength, angle, tuple(center))
+        frames.append(frame)
+        spindles.append(spindle)
+
+        # stay within the middle half of the frame
+        center += rng.normal(0, drift, 2)
+        center = clip(center, (width / 4, height / 4),
+                      (3 * width / 4, 3 * height / 4))
+        angle += rng.normal(0, turn)
+    return stack(frames), spindles
+
+# writes a synthetic multipage 16-bit tiff (uncompressed unless a PIL
+# compression such as "tiff_deflate" is given) and returns its spindles
+def writeSyntheticStack(fileName, numFrames, height=256, width=256,
+                        noise=NOISE, clutter=CLUTTER, numBlobs=NUM_BLOBS,
+                        maxCurve=0.02, seed=0, compression=None):
+    frames, spindles = syntheticFrames(numFrames, height, width, noise,
+                                       clutter, numBlobs, maxCurve, seed)
+    writeFrames(fileName, frames, compression)
+    return spindles
+
+# writes frames to a multipage tiff (see writeSyntheticStack)
+def writeFrames(fileName, frames, compression=None):
+    images = [Image.fromarray(frame) for frame in frames]
+    options = {"compression": compression} if compression else {}
+    images[0].save(fileName, save_all=True, append_images=images[1:],
+                   **options)
@@ -0,0 +1,71 @@
+import argparse
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from numpy import array, abs as npabs, maximum
+import tiffFunctions as tiffF
+import curveFitData as cFD
+import stackAnalysis as stackA
+from benchmarks import syntheticStack as synthS
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Time measuring a synthetic time lapse with and "
+                        "without tracking the spindle from frame to frame, "
+                        "and compare the measurements.")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--length", type=float, default=80,
+                        help="spindle length in pixels (default "
+                             "%(default)s)")
+    parser.add_argument("--thresh", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        fileName = path.join(directory, "tracking.tif")
+        frames, spindles = synthS.timeLapseFrames(
+                args.frames, args.size, args.size,
+                halfLength=args.length / 2, seed=args.seed)
+        synthS.writeFrames(fileName, frames)
+        tiffF.openTiffStack(fileName)
+
+        results = {}
+        perFrame = {}
+        for tracking in (False, True):
+            best = None
+            for r in range(args.repeats):
+                start = perf_counter()
+                results[tracking] = list(stackA.measureStack(
+                        fileName, args.thresh, 1, 4, tracking=tracking))
+                seconds = perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            perFrame[tracking] = 1000 * best / args.frames
+            name = "tracking" if tracking else "whole frame"
+            print(F"{name:>12}: {perFrame[tracking]:.2f} ms per frame")
+        tiffF.closeTiffStack(fileName)
+
+    print(F"     speedup: {perFrame[False] / perFrame[True]:.1f}x")
+
+    found = [full[2] and tracked[2] for full, tracked in
+             zip(results[False], results[True])]
+    print(F"spindle found both ways in {sum(found)} of {args.frames} "
+          F"frames, tracking alone in "
+          F"{sum(t[2] for t in results[True]) - sum(found)}, whole frame "
+          F"alone in {sum(f[2] for f in results[False]) - sum(found)}")
+    full = array([f[1] for f, isFound in zip(results[False], found)
+                  if isFound])
+    tracked = array([t[1] for t, isFound in zip(results[True], found)
+                     if isFound])
+    if not len(full):
+        return
+
+    relative = npabs(tracked - full) / maximum(npabs(full), 1e-12)
+    numDifferent = (relative.max(axis=1) > 1e-9).sum()
+    print(F"frames measured differently: {numDifferent}")
+    for name, values in zip(cFD.DATA_NAMES, relative.T):
+        print(F"{name:>24}: largest relative difference {values.max():.2g}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import json
+import sqlite3
+import zlib
+from hashlib import blake2b
+from importlib import import_module
+from os import environ, getpid, makedirs, path, stat
+from threading import Lock
+from time import time
+from numpy import ascontiguousarray, frombuffer, int32, float64
+import tiffFunctions as tiffF
+import curveFitData as cFD
+import threshFunctions as threshF
+
+# where the result cache is kept unless a file name is given (the
+# environment variable overrides it)
+ENVIRONMENT_VARIABLE = "SPINDLE_CACHE"
+DEFAULT_CACHE_FILE = path.join(path.expanduser("~"), ".cache",
+                               "mitotic-spindle-tool", "results.sqlite")
+
+# default size of the stored results, beyond which the least recently used
+# ones are evicted (down to EVICT_FRACTION of it)
+CACHE_BYTES = 256 * 1024 * 1024
+EVICT_FRACTION = 0.9
+
+# modules whose code decides the results, so changing any of them makes the
+# cached results of the old code unreachable (see analysisVersion)
+ANALYSIS_MODULES = ("threshFunctions", "labelFunctions", "momentFunctions",
+                    "fitFunctions", "metricFunctions", "curveFitData")
+
+# result caches open, by process id and file name. SQLite connections
+# can't be carried across fork(), so a forked process opens its own and
+# leaves those of its parent alone (closing them could checkpoint and
+# remove the parent's write-ahead log)
+openCaches = {}
+openCachesLock = Lock()
+
+# a hash of the source of the ANALYSIS_MODULES
+def analysisVersion():
+    digest = blake2b(digest_size=8)
+    for name in ANALYSIS_MODULES:
+        with open(import_module(name).__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+# analysisVersion, found when the first key is made
+ANALYSIS_VERSION = None
+
+# a hash of the pixels of a frame (and its shape and type)
+def frameHash(imageArr):
+    imageArr = ascontiguousarray(imageArr)
+    digest = blake2b(digest_size=16)
+    digest.update(F"{imageArr.dtype.str}{imageArr.shape}".encode())
+    digest.update(imageArr.data)
+    return digest.hexdigest()
+
+# the analysis inputs of a frame beyond its pixels, as stored in the cache.
+# a spindle tracked from the previous frame depends on where it was there,
+# so track (the cFD.SpindleTrack searched around, None when the whole
+# frame is searched) is part of them
+def resultParams(thresh, gOLI, gOLF, golMode=threshF.GOL_LEGACY,
+                 rotationMode=cFD.ROTATE_RESAMPLE, track=None):
+    return (float(thresh), int(gOLI), int(gOLF), golMode, rotationMode,
+            trackParams(track))
+
+# a SpindleTrack as it is stored in resultParams (None stays None)
+def trackParams(track):
+    if track is None:
+        return None
+    return [[float(c) for c in track.center], [int(b) for b in track.box],
+            float(track.angle), int(track.size)]
+
+# identifies a stack by its file (path, size and change time) and, for a
+# hyperstack, its Z projection, which decides what its frames are. the
+# frames the user added or tossed are recorded under it
+def stackIdentity(stack):
+    info = stat(stack.fileName)
+    projection = stack.projection if stack.isHyperstack() else None
+    return json.dumps([path.abspath(stack.fileName), info.st_size,
+                       info.st_mtime_ns, projection])
+
+# the cache key of the analysis of a frame with resultParams
+def resultKey(frameHashValue, params):
+    global ANALYSIS_VERSION
+    if ANALYSIS_VERSION is None:
+        ANALYSIS_VERSION = analysisVersion()
+    return json.dumps([frameHashValue, *params, ANALYSIS_VERSION])
+
+# the ResultCache of a file shared by everything in this process (the
+# default file without a name)
+def openResultCache(fileName=None):
+    if fileName is None:
+        fileName = environ.get(ENVIRONMENT_VARIABLE, DEFAULT_CACHE_FILE)
+    key = (getpid(), fileName)
+    with openCachesLock:
+        if key not in openCaches:
+            openCaches[key] = ResultCache(fileName)
+        return openCaches[key]
+
+# keeps analyses on disk in an SQLite file, keyed by the frame's pixels,
+# the analysis inputs and the version of the analysis code, so a frame
+# seen before with the same inputs is never analyzed again (in this or any
+# later session, by the GUI or a batch run). it also keeps the frames the
+# user added (with their inputs) or tossed and the frames a batch run
+# measured, by stackIdentity, so a stack that is opened again gets its
+# data table back. any thread may use it
+class ResultCache():
+
+    def __init__(self, fileName, maxBytes=CACHE_BYTES):
+        self.fileName = fileName
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+        directory = path.dirname(path.abspath(fileName))
+        makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(fileName, timeout=30,
+                                           check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS results ("
+                    "key TEXT PRIMARY KEY, summary TEXT, pixels BLOB, "
+                    "size INTEGER, lastUsed REAL)")
+            self._connection.execute(
+                    "CREATE INDEX IF NOT EXISTS resultsLastUsed "
+                    "ON results (lastUsed)")
+
+            # frames recorded before they were kept by stack are dropped
+            columns = [row[1] for row in self._connection.execute(
+                    "PRAGMA table_info(frames)")]
+            if columns and "stack" not in columns:
+                self._connection.execute("DROP TABLE frames")
+            self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS frames ("
+                    "stack TEXT, frameIndex INTEGER, frameHash TEXT, "
+                    "params TEXT, tossed INTEGER, "
+                    "PRIMARY KEY (stack, frameIndex))")
+        self._totalBytes = self.storedBytes()
+
+    # the cached cFD.SpindleAnalysis of a frame, or None
+    def analysis(self, frameHashValue, params):
+        key = resultKey(frameHashValue, params)
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                    "SELECT summary, pixels FROM results WHERE key = ?",
+                    (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._connection.execute(
+                    "UPDATE results SET lastUsed = ? WHERE key = ?",
+                    (time(), key))
+        return decodeAnalysis(*row)
+
+    # the cached analysis of a frame, or the one analyze() returns, which
+    # is then stored
+    def cachedAnalysis(self, imageArr, params, analyze):
+        frameHashValue = frameHash(imageArr)
+        analysis = self.analysis(frameHashValue, params)
+        if analysis is None:
+            analysis = analyze()
+            self.store(frameHashValue, params, analysis)
+        return analysis
+
+    # stores the analysis of a frame, evicting old results if the cache
+    # has grown past maxBytes
+    def store(self, frameHashValue, params, analysis):
+        summary, pixels = encodeAnalysis(analysis)
+        size = len(summary) + len(pixels)
+        with self._lock, self._connection:
+            self._connection.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                    (resultKey(frameHashValue, params), summary, pixels,
+                     size, time()))
+            self._totalBytes += size
+            if self._totalBytes > self.maxBytes:
+                self._evict()
+
+    # removes the least recently used results until the rest fit in
+    # EVICT_FRACTION of maxBytes
+    def _evict(self):
+        self._totalBytes = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        target = EVICT_FRACTION * self.maxBytes
+        rows = self._connection.execute(
+                "SELECT key, size FROM results ORDER BY lastUsed")
+        evicted = []
+        for key, size in rows:
+            if self._totalBytes <= target:
+                break
+            evicted.append((key,))
+            self._totalBytes -= size
+        rows.close()
+        self._connection.executemany("DELETE FROM results WHERE key = ?",
+                                     evicted)
+
+    # bytes of results stored
+    def storedBytes(self):
+        with self._lock:
+            return self._connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    # remembers that the user added the data of frame frameIndex of a
+    # stack (its stackIdentity) measured with params (None to forget it)
+    def recordAdded(self, stack, frameIndex, frameHashValue, params):
+        self.recordAddedFrames(stack, [(frameIndex, frameHashValue, params)])
+
+    # recordAdded for several (frameIndex, frameHashValue, params) at once
+    def recordAddedFrames(self, stack, frames):
+        self._recordFrames(stack, "params",
+                           [(frameIndex, frameHashValue,
+                             None if params is None else json.dumps(params))
+                            for frameIndex, frameHashValue, params in frames])
+
+    # remembers whether the user tossed frame frameIndex of a stack
+    def recordTossed(self, stack, frameIndex, frameHashValue, tossed):
+        self._recordFrames(stack, "tossed",
+                           [(frameIndex, frameHashValue, int(tossed))])
+
+    # frames are (frameIndex, frameHashValue, value of column)
+    def _recordFrames(self, stack, column, frames):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                    "INSERT OR IGNORE INTO frames "
+                    "VALUES (?, ?, NULL, NULL, 0)",
+                    [(stack, frame[0]) for frame in frames])
+            self._connection.executemany(
+                    F"UPDATE frames SET frameHash = ?, {column} = ? "
+                    F"WHERE stack = ? AND frameIndex = ?",
+                    [(frameHashValue, value, stack, frameIndex)
+                     for frameIndex, frameHashValue, value in frames])
+
+    # what was recorded about the frames of a stack (its stackIdentity):
+    # (frameIndex, frameHash, params or None, tossed) for every frame that
+    # was added or tossed, in frame order. the frameHash is of the frame
+    # as it was when it was last recorded
+    def recordedFrames(self, stack):
+        with self._lock:
+            rows = self._connection.execute(
+                    "SELECT frameIndex, frameHash, params, tossed "
+                    "FROM frames WHERE stack = ? AND "
+                    "(params IS NOT NULL OR tossed) ORDER BY frameIndex",
+                    (stack,)).fetchall()
+        return [(frameIndex, frameHashValue,
+                 None if params is None else tuple(json.loads(params)),
+                 bool(tossed))
+                for frameIndex, frameHashValue, params, tossed in rows]
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM results")
+            self._connection.execute("DELETE FROM frames")
+            self._totalBytes = 0
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+# the (summary, pixels) an analysis is stored as: a JSON summary of
+# everything but the spindle's pixels, and the compressed pixels
+def encodeAnalysis(analysis):
+    geometry = analysis.geometry
+    summary = {"doesSpindleExist": analysis.doesSpindleExist,
+               "leftPole": analysis.leftPole,
+               "rightPole": analysis.rightPole,
+               "centerPoint": analysis.centerPoint,
+               "fitParams": analysis.fitParams,
+               "lineParams": analysis.lineParams,
+               "data": analysis.data}
+    pixels = b""
+    if geometry is not None:
+        summary["angle"] = geometry.angle
+        summary["shape"] = [int(n) for n in geometry.shape]
+        summary["numPixels"] = len(geometry.rows)
+        pixels = zlib.compress(
+                geometry.rows.astype(int32).tobytes()
+                + geometry.cols.astype(int32).tobytes()
+                + geometry.intensities.astype(float64).tobytes())
+    return json.dumps(summary), pixels
+
+# the cFD.SpindleAnalysis stored by encodeAnalysis (its rotated image is
+# made from the geometry when it is needed, see cFD.rotatedImage)
+def decodeAnalysis(summary, pixels):
+    summary = json.loads(summary)
+    if not summary["doesSpindleExist"]:
+        xArr = tiffF.threshXArr()
+        xArr.setflags(write=False)
+        return cFD.SpindleAnalysis(xArr, False)
+
+    numPixels = summary["numPixels"]
+    raw = zlib.decompress(pixels)
+    coords = frombuffer(raw, dtype=int32, count=2 * numPixels)
+    intensities = frombuffer(raw, dtype=float64, offset=8 * numPixels)
+    geometry = cFD.SpindleGeometry(coords[:numPixels],
+                                   coords[numPixels:], intensities,
+                                   summary["angle"], tuple(summary["shape"]))
+
+    def point(name):
+        return tuple(summary[name])
+
+    return cFD.SpindleAnalysis(None, True, point("leftPole"),
+                               point("rightPole"), point("centerPoint"),
+                               point("fitParams"), point("lineParams"),
+                               point("data"), geometry)
@@ -1,321 +1,504 @@
-from numpy import zeros, array, arctan, pi, uint64
-from numpy import sum as npsum
+from typing import NamedTuple
+from numpy import (zeros, array, arctan, pi, argmin, where, inf, ndarray,
+                   floor, ceil, clip)
 from numpy import mean as npmean
 from numpy import sqrt as npsqrt
-from numpy.linalg import norm, eig
-from scipy.ndimage import rotate
-from scipy.integrate import quad
-from scipy.optimize import curve_fit
+from numpy.linalg import eig
+from scipy.ndimage import affine_transform
+from scipy.special import cosdg, sindg
 import tiffFunctions as tiffF
+import labelFunctions as labelF
+import momentFunctions as momentF
+import metricFunctions as metricF
+import fitFunctions as fitF
+import instrumentFunctions as instrumentF
 
 # define a constant
 DATA_NAMES = ("Pole Separation (px)", "Arc Length (px)", "Area Metric (px^2)",
              "Max Curvature (px^-1)", "Avg Curvature (px^-1)")
 
+# ways of rotating the spindle onto the x axis before fitting it
+# resample: rotate the spindle image the way scipy's rotate (with reshape)
+#           rotates the whole frame and fit the nonzero pixels of the
+#           result (the original method, see rotatedSpindleImg)
+# coordinates: rotate only the coordinates of the spindle's pixels into
+#              the same frame and fit those, which skips resampling the
+#              spindle image altogether. the measurements differ slightly
+#              because the resampled image spreads every pixel over its
+#              neighbors; on the synthetic benchmark stacks
+#              (python -m benchmarks.rotationBenchmark) the lengths of
+#              spindles over 60 px stay within 5 %, their area within
+#              10 % and their curvatures within 15 % (2 % on a typical
+#              frame). the rotated image is only made when a preview
+#              asks for it (see rotatedImage)
+ROTATE_RESAMPLE = "resample"
+ROTATE_COORDINATES = "coordinates"
+ROTATION_MODES = (ROTATE_RESAMPLE, ROTATE_COORDINATES)
+
+# zero pixels kept around the spindle when it is cropped out of the frame,
+# so the interpolation at the edges of the crop sees the same neighborhood
+# as in the whole frame
+SPINDLE_PADDING = 2
+
+# tracking (see trackSpindle) looks for the spindle in a window around its
+# box in the previous frame, reaching TRACK_MARGIN pixels or
+# TRACK_MARGIN_FRACTION of the box's size past it, whichever is more. the
+# track is lost, and the whole frame searched, when no object in the
+# window has TRACK_SIZE_RATIO of the tracked spindle's pixels, or the one
+# found comes within TRACK_EDGE pixels of the window's edge (where the
+# threshold and the grouping of points can't see past the window)
+TRACK_MARGIN = 32
+TRACK_MARGIN_FRACTION = 0.25
+TRACK_SIZE_RATIO = 0.5
+TRACK_EDGE = labelF.CONSOLIDATION_RADIUS
+
+# the spindle found in a frame
+# rows, cols: coordinates of the spindle's pixels in the frame
+# intensities: the image values of those pixels
+# angle: the rotation (degrees, as given to scipy's rotate) that lines the
+#        spindle's principal axis up with the x axis
+# shape: shape of the frame
+class SpindleGeometry(NamedTuple):
+    rows: ndarray
+    cols: ndarray
+    intensities: ndarray
+    angle: float
+    shape: tuple
+
 # using thresholded image and main image, return the rotated spindle img
-def getSpindleImg(imageArr, arr):
+# (cropped to the spindle, see rotatedSpindleImg)
+def getSpindleImg(imageArr, arr, neighborRadius=labelF.NEIGHBOR_RADIUS,
+                  consolidationRadius=labelF.CONSOLIDATION_RADIUS):
+    geometry = findSpindle(imageArr, arr, neighborRadius,
+                           consolidationRadius)
 
-    # create identical array for manipulation
-    threshArr = zeros(shape=arr.shape)
-    for i in range(0, len(arr)):
-        for j in range(0, len(arr[i])):
-            threshArr[i,j] = arr[i,j]
-    
-    # count the number of points and preallocate vectors
-    totalPoints = int(npsum(threshArr))
-
-    # make these int type to avoid default double assignment later
-    c2 = zeros(totalPoints, dtype=int)
-    r2 = zeros(totalPoints, dtype=int)
-    count = 0
-
-    # list of all x's and y's
-    for r in range(0, len(threshArr)):
-        for c in range(0, len(threshArr[r])):
-            if threshArr[r,c] == 1:
-                r2[count] = r
-                c2[count] = c
-                count += 1
-    
     # Return a white X if there are no points left after thresholding
-    if totalPoints == 0:
-        doesSpindleExist = False
-        return tiffF.threshXArr(), doesSpindleExist
-    else:
-        doesSpindleExist = True
-    
-    # CHECK EACH POINT AND SORT INTO OBJECTS
+    if geometry is None:
+        return tiffF.threshXArr(), False
+    return rotatedSpindleImg(geometry)[0], True
+
+# using thresholded image and main image, return the SpindleGeometry of
+# the spindle, or None if there are no points left after thresholding
+def findSpindle(imageArr, arr, neighborRadius=labelF.NEIGHBOR_RADIUS,
+                consolidationRadius=labelF.CONSOLIDATION_RADIUS):
+    return selectSpindle(imageArr, labelObjects(imageArr, arr,
+                                                neighborRadius,
+                                                consolidationRadius))
+
+# picks the spindle out of the objects of labelObjects (None if there are
+# none), returning its SpindleGeometry
+def selectSpindle(imageArr, objects):
+    if objects is None:
+        return None
+    labelArr, objectSizes, objectBoxes, xComs, yComs = objects
+    numObjects = len(objectSizes)
 
-    # start object list with one object
-    tObjects = [thresholdObject(c2[0], r2[0])]
-
-    # go through each image point
-    for i in range(0, len(c2)):
-        noMatch = True
-
-        # go through each existing object
-        o = 0
-        while noMatch and o < len(tObjects):
-
-            # check each point in the object until it finds a neighbor
-            # or goes through all of them
-            j = len(tObjects[o].xCoords) - 1
-            while noMatch and j >= 0:
-
-                # if it finds a neighbor, add it to the object
-                if (abs(tObjects[o].xCoords[j] - c2[i]) <= 2
-                        and abs(tObjects[o].yCoords[j] - r2[i]) <= 2):
-                    tObjects[o].addPoint(c2[i], r2[i])
-                    noMatch = False
-                else:
-                    # go to next point
-                    j -= 1
-            
-            o += 1
-        
-        # if it goes through all objects without a match,
-        # make a new object
-        if noMatch:
-            tObjects.append(thresholdObject(c2[i], r2[i]))
-
-    # CONSOLIDATE OBJECTS
-
-    # this needs to compare every point on an object with every other
-    # point on other objects (not really EVERY point)
-
-    # sort the objects array from most points to least
-    tObjects.sort(reverse=True)
-
-    # set startLength != len(tObjects) to enter the loop
-    startLength = len(tObjects) + 1
-
-    while startLength != len(tObjects):
-
-        startLength = len(tObjects)
-
-        o1 = 0
-        while o1 < len(tObjects): # going through objects
-            o2 = o1 + 1
-            
-            while o2 < len(tObjects): # comparing with other objects
-                noMatch = True
-                i = len(tObjects[o1].xCoords) - 1 # every point in o1
-
-                while noMatch and i >= 0:
-                    temp1 = tObjects[o2].xCoords
-                    temp2 = tObjects[o2].yCoords
-                    coordTrunc = ((abs(temp1-tObjects[o1].xCoords[i]) < 10)
-                                * (abs(temp2-tObjects[o1].yCoords[i]) < 10))
-
-                    if sum(coordTrunc) > 0:
-                        # if any o1 points are within a radius of 10 of
-                        # any o2 points, consolidate objects
-                        # remove o2 from tObjects
-                        noMatch = False
-                        tObjects[o1].addPoints(temp1, temp2)
-                        tObjects.pop(o2)
-                    
-                    i -= 1
-                o2 += 1
-            o1 += 1
-    
-    # CENTER OF MASS OF EACH OBJECT
-    for o in range(0, len(tObjects)):
-        mass = uint64(0)
-        xsum = uint64(0)
-        ysum = uint64(0)
-        for i in range(0, tObjects[o].numPoints):
-            yC = tObjects[o].yCoords[i]
-            xC = tObjects[o].xCoords[i]
-            mass += imageArr[yC, xC]
-            ysum += imageArr[yC, xC] * tObjects[o].yCoords[i]
-            xsum += imageArr[yC, xC] * tObjects[o].xCoords[i]
-        tObjects[o].com = [xsum/mass, ysum/mass]
-    
     # FIND SPINDLE AUTOMATICALLY
-    xcen = len(threshArr[0]) / 2
-    ycen = len(threshArr) / 2
-
-    if len(tObjects) > 1:
-        numPointsArr = [getattr(o, "numPoints") for o in tObjects]
-        avgObjectSize = npmean(numPointsArr)
-
-        minDist = len(threshArr[0])
-        for o in range(0, len(tObjects)):
-            if (norm(array([xcen, ycen]) 
-                    - array([tObjects[o].com])) < minDist
-                    and tObjects[o].numPoints > avgObjectSize):
-                minDist = norm(array([xcen, ycen])
-                                         - array([tObjects[o].com]))
-                centerObj = o
-        
-        spindle = tObjects[centerObj]
-    else:
-        spindle = tObjects[0]
-    
-    # create array with only the spindle object
-    spindleArr = zeros(threshArr.shape)
-    for i in range(0, spindle.numPoints):
-        spindleArr[spindle.yCoords[i], spindle.xCoords[i]] = 1
+    xcen = len(labelArr[0]) / 2
+    ycen = len(labelArr) / 2
+
+    # pick the object closest to the center among those above the average
+    # size, defaulting to the largest object if none of them qualify
+    centerObj = 0
+    if numObjects > 1:
+        dists = npsqrt((xComs - xcen) ** 2 + (yComs - ycen) ** 2)
+        isCandidate = ((objectSizes > npmean(objectSizes))
+                       & (dists < len(labelArr[0])))
+        if isCandidate.any():
+            centerObj = argmin(where(isCandidate, dists, inf))
+
+    return objectGeometry(imageArr, objects, centerObj)
+
+# groups the points of a thresholded image into objects, returning the
+# label image, the size and bounding box of each object and the intensity
+# weighted (x, y) center of mass of each object, or None if there are no
+# points left after thresholding
+def labelObjects(imageArr, arr, neighborRadius=labelF.NEIGHBOR_RADIUS,
+                 consolidationRadius=labelF.CONSOLIDATION_RADIUS):
+
+    # CHECK EACH POINT AND SORT INTO OBJECTS
+    with instrumentF.stage("label"):
+        labelArr, objectSizes, objectBoxes = labelF.labelThreshArr(
+                arr, neighborRadius, consolidationRadius)
     
-    # multiply original image by the one we just made
-    spindleImg = imageArr * spindleArr
+    if len(objectSizes) == 0:
+        return None
 
-    # FIND MOMENT OF INERTIA VECTORS
-    Ixx = 0
-    Iyy = 0
-    Ixy = 0
+    # CENTER OF MASS OF EACH OBJECT
+    numObjects = len(objectSizes)
+    yC, xC, objectIndex = momentF.labeledPoints(labelArr)
+    xComs, yComs = momentF.centersOfMass(yC, xC, objectIndex, numObjects,
+                                         imageArr[yC, xC])
+    return labelArr, objectSizes, objectBoxes, xComs, yComs
 
-    for y in range(0, len(spindleArr)):
-        for x in range(0, len(spindleArr[y])):
-            Ixx += spindleArr[y,x] * ((x - spindle.com[0]) ** 2)
-            Iyy += spindleArr[y,x] * ((y - spindle.com[1]) ** 2)
-            Ixy += spindleArr[y,x] * (x - spindle.com[0]) * (y - spindle.com[1])
+# the SpindleGeometry of object o of labelObjects. imageArr and the label
+# image may be a window of a frame of shape, whose top left pixel is at
+# origin (row, col) in the frame
+def objectGeometry(imageArr, objects, o, origin=(0, 0), shape=None):
+    labelArr, objectSizes, objectBoxes, xComs, yComs = objects
 
-    tensorMat = array([[Ixx, Ixy],
-                          [Ixy, Iyy]])
+    # the pixels of the spindle object
+    ySpindle, xSpindle = labelF.objectCoords(labelArr, objectBoxes, o)
 
-    # CALCULATE EIGENVECTORS AND ROTATE THE SPINDLE
+    # FIND MOMENT OF INERTIA VECTORS
+    # (about the intensity weighted center of mass of the spindle)
+    mu20, mu11, mu02 = momentF.centralMoments(
+            ySpindle, xSpindle, zeros(len(xSpindle), dtype=int), 1,
+            xComs[o:o + 1], yComs[o:o + 1])
+    tensorMat = momentF.momentTensors(mu20, mu11, mu02)[0]
+
+    # CALCULATE EIGENVECTORS AND THE ROTATION OF THE SPINDLE
     eigenValues, eigenVectors = eig(tensorMat)
     tempIndex = list(eigenValues).index(min(eigenValues))
     mainvector = eigenVectors[:,tempIndex]
 
     rotAngle = - arctan(mainvector[0]/mainvector[1]) * 180 / pi
-    rotImg = rotate(spindleImg, rotAngle, order=1)
-    
-    return rotImg, doesSpindleExist
 
-def spindleMeasurements(imageArr, threshArr):
-    spindleArray, doesSpindleExist = getSpindleImg(imageArr, threshArr)
+    intensities = imageArr[ySpindle, xSpindle]
+    if shape is None:
+        shape = labelArr.shape
+    return SpindleGeometry(ySpindle + origin[0], xSpindle + origin[1],
+                           intensities, float(rotAngle), tuple(shape))
+
+# what tracking carries from the spindle of one frame to the next
+# center: intensity weighted (x, y) center of mass in the frame
+# box: (top, left, bottom, right) of its pixels, bottom and right excluded
+# angle: as in SpindleGeometry
+# size: number of pixels
+class SpindleTrack(NamedTuple):
+    center: tuple
+    box: tuple
+    angle: float
+    size: int
+
+# the SpindleTrack of a spindle found in a frame
+def spindleTrack(geometry):
+    weights = geometry.intensities.astype(float)
+    total = weights.sum()
+    if total > 0:
+        center = (float((geometry.cols * weights).sum() / total),
+                  float((geometry.rows * weights).sum() / total))
+    else:
+        center = (float(geometry.cols.mean()), float(geometry.rows.mean()))
+    return SpindleTrack(center, spindleBox(geometry, 0), geometry.angle,
+                        len(geometry.rows))
+
+# the (top, left, bottom, right) window of a frame of shape that tracking
+# searches for the spindle of track in
+def searchWindow(track, shape):
+    top, left, bottom, right = track.box
+    rowMargin = max(TRACK_MARGIN,
+                    int(TRACK_MARGIN_FRACTION * (bottom - top)))
+    colMargin = max(TRACK_MARGIN,
+                    int(TRACK_MARGIN_FRACTION * (right - left)))
+    return (max(top - rowMargin, 0), max(left - colMargin, 0),
+            min(bottom + rowMargin, shape[0]),
+            min(right + colMargin, shape[1]))
+
+# looks for the spindle of the previous frame's track in the search window
+# of a frame: windowThreshArr is the threshold of just the window (see
+# searchWindow) of imageArr. returns the SpindleGeometry of the object
+# closest to the tracked center with enough pixels, or None if the track
+# is lost (see TRACK_SIZE_RATIO and TRACK_EDGE) and the whole frame has to
+# be searched with findSpindle
+def trackSpindle(imageArr, windowThreshArr, window, track,
+                 neighborRadius=labelF.NEIGHBOR_RADIUS,
+                 consolidationRadius=labelF.CONSOLIDATION_RADIUS):
+    top, left, bottom, right = window
+    windowArr = imageArr[top:bottom, left:right]
+    objects = labelObjects(windowArr, windowThreshArr, neighborRadius,
+                           consolidationRadius)
+    if objects is None:
+        return None
+    labelArr, objectSizes, objectBoxes, xComs, yComs = objects
+
+    dists = npsqrt((xComs + left - track.center[0]) ** 2
+                   + (yComs + top - track.center[1]) ** 2)
+    isCandidate = objectSizes >= TRACK_SIZE_RATIO * track.size
+    if not isCandidate.any():
+        return None
+    o = argmin(where(isCandidate, dists, inf))
+
+    # the spindle may reach out of the window, or be joined to objects
+    # outside of it, unless it keeps away from the window's edges (those
+    # on the frame's edges don't matter)
+    rows, cols = objectBoxes[o]
+    height, width = imageArr.shape
+    if ((top > 0 and rows.start < TRACK_EDGE)
+            or (left > 0 and cols.start < TRACK_EDGE)
+            or (bottom < height and rows.stop > labelArr.shape[0]
+                - TRACK_EDGE)
+            or (right < width and cols.stop > labelArr.shape[1]
+                - TRACK_EDGE)):
+        return None
+
+    return objectGeometry(windowArr, objects, o, (top, left),
+                          imageArr.shape)
+
+# the box around the spindle (with padding) in the frame, as
+# (top, left, bottom, right) with the bottom and right excluded
+def spindleBox(geometry, padding=SPINDLE_PADDING):
+    height, width = geometry.shape
+    return (max(int(geometry.rows.min()) - padding, 0),
+            max(int(geometry.cols.min()) - padding, 0),
+            min(int(geometry.rows.max()) + padding + 1, height),
+            min(int(geometry.cols.max()) + padding + 1, width))
+
+# the rotation scipy's rotate (with reshape) does to the whole frame for
+# the spindle's angle: it samples frame (row, col) = matrix @ output
+# (row, col) + offset for every pixel of an output of outShape
+def frameRotation(geometry):
+    c = cosdg(geometry.angle)
+    s = sindg(geometry.angle)
+    matrix = array([[c, s], [-s, c]])
+
+    inShape = array(geometry.shape)
+    outBounds = matrix @ [[0, 0, inShape[0], inShape[0]],
+                          [0, inShape[1], 0, inShape[1]]]
+    outShape = (outBounds.max(axis=1) - outBounds.min(axis=1)
+                + 0.5).astype(int)
+    offset = (inShape - 1) / 2 - matrix @ ((outShape - 1) / 2)
+    return matrix, offset, outShape
+
+# the spindle rotated onto the x axis, cropped to the spindle: the part of
+# what scipy's rotate would make of the frame-sized spindle image that can
+# be nonzero, and the (x, y) of its top left pixel in that rotated frame.
+# only the spindle's box is filled in and resampled, so the time and
+# memory don't depend on the size of the frame
+def rotatedSpindleImg(geometry):
+    matrix, offset, outShape = frameRotation(geometry)
+    top, left, bottom, right = spindleBox(geometry)
+    spindleImg = zeros((bottom - top, right - left))
+    spindleImg[geometry.rows - top, geometry.cols - left] = (
+            geometry.intensities)
+
+    # output pixels sampling within a pixel of the box
+    corners = matrix.T @ (array([[top - 1, top - 1, bottom, bottom],
+                                 [left - 1, right, left - 1, right]])
+                          - offset[:, None])
+    start = clip(floor(corners.min(axis=1)), 0, outShape).astype(int)
+    stop = clip(ceil(corners.max(axis=1)) + 1, 0, outShape).astype(int)
+
+    with instrumentF.stage("rotate"):
+        rotImg = affine_transform(spindleImg, matrix,
+                                  matrix @ start + offset - (top, left),
+                                  tuple(stop - start), order=1)
+    return rotImg, (int(start[1]), int(start[0]))
+
+# the (x, y) coordinates of the spindle's pixels in the rotated frame of
+# rotatedSpindleImg, without making the image
+def rotatedCoords(geometry):
+    with instrumentF.stage("rotate"):
+        matrix, offset, outShape = frameRotation(geometry)
+        rows = geometry.rows - offset[0]
+        cols = geometry.cols - offset[1]
+
+        # output = matrix^T @ (frame - offset)
+        rotY = matrix[0, 0] * rows + matrix[1, 0] * cols
+        rotX = matrix[0, 1] * rows + matrix[1, 1] * cols
+    return rotX, rotY
+
+# maps an (x, y) point of the rotated frame (e.g. a pole) back to the
+# (x, y) of the frame the spindle was found in
+def framePoint(geometry, point):
+    matrix, offset, outShape = frameRotation(geometry)
+    row, col = matrix @ (point[1], point[0]) + offset
+    return (float(col), float(row))
+
+# the left pole, right pole and center point of an analysis in the frame
+# the spindle was found in
+def framePoles(analysis):
+    return tuple(framePoint(analysis.geometry, point) for point in
+                 (analysis.leftPole, analysis.rightPole,
+                  analysis.centerPoint))
+
+# everything measured about the spindle in one frame
+# rotatedImg: the spindle image rotated to lie along the x axis, cropped
+#             to the spindle (a white X if there is no spindle, None if it
+#             wasn't made; rotatedImage makes it from the geometry)
+# leftPole, rightPole, centerPoint: (x, y) points of the fit curve in the
+#                                   rotated frame (None without a spindle,
+#                                   framePoles maps them onto the frame)
+# fitParams: (a, b, c) of the fit curve a * x^2 + b * x + c
+# lineParams: (slope, intercept) of the straight line fit
+# data: the DATA_NAMES values
+# geometry: the SpindleGeometry of the spindle (None without a spindle)
+# rotatedOrigin: (x, y) of rotatedImg's top left pixel in the rotated frame
+class SpindleAnalysis(NamedTuple):
+    rotatedImg: ndarray
+    doesSpindleExist: bool
+    leftPole: tuple = None
+    rightPole: tuple = None
+    centerPoint: tuple = None
+    fitParams: tuple = None
+    lineParams: tuple = None
+    data: tuple = (0.0, 0.0, 0.0, 0.0, 0.0)
+    geometry: SpindleGeometry = None
+    rotatedOrigin: tuple = (0, 0)
+
+# finds, fits and measures the spindle in one frame
+def analyzeSpindle(imageArr, threshArr, rotationMode=ROTATE_RESAMPLE):
+    return analyzeSpindles([imageArr], [threshArr],
+                           rotationMode=rotationMode)[0]
+
+# finds, fits and measures the spindle in each of several frames, fitting
+# the curves of all the frames together
+# frameKeys are optional (stack, frame index) pairs naming the frames in
+# the instrumentation records (otherwise the caller's frame is used)
+# rotationMode is one of ROTATION_MODES
+def analyzeSpindles(imageArrs, threshArrs, frameKeys=None,
+                    rotationMode=ROTATE_RESAMPLE):
+    geometries = []
+    for i, (imageArr, threshArr) in enumerate(zip(imageArrs, threshArrs)):
+        with frameContext(frameKeys, i):
+            geometries.append(findSpindle(imageArr, threshArr))
+    return analyzeGeometries(geometries, frameKeys, rotationMode)
+
+# the instrumentation frame of frame i of frameKeys (see analyzeSpindles)
+def frameContext(frameKeys, i):
+    if frameKeys is None:
+        return instrumentF.NO_STAGE
+    return instrumentF.frame(*frameKeys[i])
+
+# fits and measures the spindles already found in several frames (their
+# SpindleGeometry, or None where there is no spindle), fitting the curves
+# of all the frames together
+def analyzeGeometries(geometries, frameKeys=None,
+                      rotationMode=ROTATE_RESAMPLE):
+    if rotationMode not in ROTATION_MODES:
+        raise ValueError(F"unknown rotation mode: {rotationMode}")
+
+    rotations = []
+    for i, geometry in enumerate(geometries):
+        with frameContext(frameKeys, i):
+            rotations.append(rotateSpindle(geometry, rotationMode))
+    return measureSpindles(geometries, rotations, fitSpindles(rotations))
+
+# the spindle of a frame rotated onto the x axis
+# spindleArray: the rotated spindle image (see SpindleAnalysis.rotatedImg)
+# origin: (x, y) of its top left pixel in the rotated frame
+# rotX, rotY: coordinates of the spindle's pixels in the rotated frame
+#             (None without a spindle)
+class SpindleRotation(NamedTuple):
+    spindleArray: ndarray
+    origin: tuple
+    rotX: ndarray
+    rotY: ndarray
+
+# rotates the spindle of a frame (its SpindleGeometry, or None if there is
+# no spindle) the way rotationMode says, returning a SpindleRotation
+def rotateSpindle(geometry, rotationMode=ROTATE_RESAMPLE):
 
     # if spindle doesn't exist in the threshold, don't do calculations
-    if not doesSpindleExist:
-        return (0.0, 0.0, 0.0, 0.0, 0.0), doesSpindleExist
+    origin = (0, 0)
+    rotX = rotY = None
+    if geometry is None:
+        spindleArray = tiffF.threshXArr()
+    elif rotationMode == ROTATE_RESAMPLE:
+        spindleArray, origin = rotatedSpindleImg(geometry)
+        rotY, rotX = (spindleArray > 0).nonzero()
+        rotX = rotX + origin[0]
+        rotY = rotY + origin[1]
+    else:
+        spindleArray = None
+        rotX, rotY = rotatedCoords(geometry)
 
-    # FIT CURVE AND FIND POLES
-    numPoints = int(npsum(spindleArray > 0.0))
+    if spindleArray is not None:
+        spindleArray.setflags(write=False)
+    return SpindleRotation(spindleArray, origin, rotX, rotY)
 
-    rotX = zeros(numPoints)
-    rotY = zeros(numPoints)
+# the curves fit to the spindles of several frames (their
+# SpindleRotations) together
+# quadFits, lineFits: fitF.PolynomialFits of the quadratic and straight
+#                     line, with a row for each frame that has a spindle
+# minXs, maxXs: the ends of each of those spindles along the x axis
+class SpindleFits(NamedTuple):
+    quadFits: fitF.PolynomialFit
+    lineFits: fitF.PolynomialFit
+    minXs: ndarray
+    maxXs: ndarray
 
-    rotHeight, rotWidth = spindleArray.shape
+def fitSpindles(rotations):
+    rotXs = [r.rotX for r in rotations if r.rotX is not None]
+    rotYs = [r.rotY for r in rotations if r.rotX is not None]
 
-    count = 0
-    for r in range(0, rotHeight):
-        for c in range(0, rotWidth):
-            if spindleArray[r,c] > 0:
-                rotX[count] = c
-                rotY[count] = r
-                count += 1
-    
-    def quadFunc(x, a, b, c):
-        return a * (x ** 2) + b * x + c
+    with instrumentF.stage("fit"):
 
-    params, covariances  = curve_fit(quadFunc, rotX, rotY)
-    a, b, c = params[0], params[1], params[2]
+        # FIT CURVE AND FIND POLES
+        quadFits = fitF.fitPolynomials(rotXs, rotYs, 2)
 
-    minX = min(rotX)
-    maxX = max(rotX)
+        # STRAIGHT LINE FIT (for the pole separation)
+        lineFits = fitF.fitPolynomials(rotXs, rotYs, 1)
 
-    leftPole = [minX, quadFunc(minX, a, b, c)]
-    rightPole = [maxX, quadFunc(maxX, a, b, c)]
+        minXs = array([min(rotX) for rotX in rotXs], dtype=float)
+        maxXs = array([max(rotX) for rotX in rotXs], dtype=float)
 
-    # POLE SEPARATION
-    params, covariances = curve_fit(lambda x, a, b: a * x + b, rotX, rotY)
-    a2 = params[0]
-    poleSeparation = npsqrt(a2**2 + 1) * (maxX - minX)
+    return SpindleFits(quadFits, lineFits, minXs, maxXs)
 
-    # ARC LENGTH
-    def arcFunc(t):
-        return npsqrt(4 * a**2 * t**2 + 4 * a * b * t + b**2 + 1)
-    arcLength = quad(arcFunc, minX, maxX)[0]
-    
-    # CURVATURE
-
-    # area metric
-    def spindleFunc(x):
-        return a * x**2 + b * x + c
-    
-    x1 = leftPole[0]
-    x2 = rightPole[0]
-    y1 = leftPole[1]
-    y2 = rightPole[1]
-    m1 = (y2 - y1) / (x2 - x1)
-    
-    def poleFunc(x):
-        return m1 * (x - x1) + y1
-    
-    areaCurve = abs(quad(poleFunc, x1, x2)[0] - quad(spindleFunc, x1, x2)[0])
-
-    # maximum and average curvature metrics
-    maxCurve = abs(2*a)
-    
-    def curvatureFunc(x):
-        return (2 * a) / ((4 * a**2 * x**2 + 4 * a * b * x + b**2 + 1)**(3/2))
-    
-    avgCurve = abs(quad(curvatureFunc, x1, x2)[0] / (x2 - x1))
+# the SpindleAnalysis of each frame from its SpindleGeometry (or None),
+# SpindleRotation and the SpindleFits of all of them
+def measureSpindles(geometries, rotations, fits):
+    quadFits, lineFits, minXs, maxXs = fits
 
     # output data
-    data = [poleSeparation, arcLength, areaCurve, maxCurve, avgCurve]
-
-    return data, doesSpindleExist
-
-def spindlePlot(imageArr, threshArr):
-    spindleArray, doesSpindleExist = getSpindleImg(imageArr, threshArr)
-
-    # FIT CURVE AND FIND POLES
-    numPoints = int(npsum(spindleArray > 0.0))
-
-    rotX = zeros(numPoints, dtype=int)
-    rotY = zeros(numPoints, dtype=int)
-
-    rotHeight, rotWidth = spindleArray.shape
-
-    count = 0
-    for r in range(0, rotHeight):
-        for c in range(0, rotWidth):
-            if spindleArray[r,c] > 0:
-                rotX[count] = c
-                rotY[count] = r
-                count += 1
-    
-    def quadFunc(x, a, b, c):
-        return a * (x ** 2) + b * x + c
-
-    params, covariances  = curve_fit(quadFunc, rotX, rotY)
-    a, b, c = params[0], params[1], params[2]
-
-    minX = min(rotX)
-    maxX = max(rotX)
-    centerX = (maxX - minX) / 2 + minX
-
-    def spindleFunc(x):
-        return a * x**2 + b * x + c
-
-    leftPole = (minX, spindleFunc(minX))
-    rightPole = (maxX, spindleFunc(maxX))
-    centerPoint = (centerX, spindleFunc(centerX))
-
-    return (spindleArray, leftPole, rightPole, centerPoint), doesSpindleExist
-
-# a class to represent threshold objects
-class thresholdObject():
-
-    def __init__(self, x0, y0):
-
-        self.xCoords = [x0]
-        self.yCoords = [y0]
-        self.numPoints = 1
-        self.com = []
-    
-    def __lt__(self, other):
-        return self.numPoints < other.numPoints
-
-    def addPoint(self, xCoord, yCoord):
-        self.xCoords.append(xCoord)
-        self.yCoords.append(yCoord)
-        self.numPoints += 1
-    
-    def addPoints(self, x2s, y2s):
-        for i in range(0, len(x2s)):
-            self.addPoint(x2s[i], y2s[i])
+    with instrumentF.stage("metrics"):
+        allData = metricF.spindleMetrics(quadFits.coefficients[:, 0],
+                                         quadFits.coefficients[:, 1],
+                                         lineFits.coefficients[:, 0],
+                                         minXs, maxXs)
+
+    analyses = []
+    fitIndex = 0
+    for geometry, rotation in zip(geometries, rotations):
+        spindleArray = rotation.spindleArray
+        if geometry is None:
+            analyses.append(SpindleAnalysis(spindleArray, False))
+            continue
+
+        a, b, c = (float(p) for p in quadFits.coefficients[fitIndex])
+        a2, b2 = (float(p) for p in lineFits.coefficients[fitIndex])
+        minX = float(minXs[fitIndex])
+        maxX = float(maxXs[fitIndex])
+        centerX = (maxX - minX) / 2 + minX
+
+        def quadFunc(x):
+            return a * (x ** 2) + b * x + c
+
+        leftPole = (minX, quadFunc(minX))
+        rightPole = (maxX, quadFunc(maxX))
+        centerPoint = (centerX, quadFunc(centerX))
+        data = tuple(float(d) for d in allData[fitIndex])
+
+        analyses.append(SpindleAnalysis(spindleArray, True, leftPole,
+                                        rightPole, centerPoint, (a, b, c),
+                                        (a2, b2), data, geometry,
+                                        rotation.origin))
+        fitIndex += 1
+
+    return analyses
+
+def spindleMeasurements(imageArr, threshArr, rotationMode=ROTATE_RESAMPLE):
+    analysis = analyzeSpindle(imageArr, threshArr, rotationMode)
+    return list(analysis.data), analysis.doesSpindleExist
+
+def spindlePlot(imageArr, threshArr, rotationMode=ROTATE_RESAMPLE):
+    return plotResults(analyzeSpindle(imageArr, threshArr, rotationMode))
+
+# the rotated spindle image of an analysis and the (x, y) of its top left
+# pixel in the rotated frame, made from the geometry if the analysis was
+# done without it
+def rotatedImage(analysis):
+    if analysis.rotatedImg is not None:
+        return analysis.rotatedImg, analysis.rotatedOrigin
+    rotImg, origin = rotatedSpindleImg(analysis.geometry)
+    rotImg.setflags(write=False)
+    return rotImg, origin
+
+# the preview inputs of plotSpindle from an analysis, with the points
+# moved into the cropped rotated image
+def plotResults(analysis):
+    rotImg, origin = rotatedImage(analysis)
+    points = [analysis.leftPole, analysis.rightPole, analysis.centerPoint]
+    if analysis.doesSpindleExist:
+        points = [(x - origin[0], y - origin[1]) for x, y in points]
+    return (rotImg, *points), analysis.doesSpindleExist
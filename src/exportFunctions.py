@@ -0,0 +1,242 @@
+import json
+from importlib.util import find_spec
+from datetime import datetime, timezone
+from os import path
+from numpy import (arange, array, column_stack, full, nan, isfinite, isin,
+                   loadtxt, savetxt, savez_compressed, load as npload)
+import curveFitData as cFD
+import instrumentFunctions as instrumentF
+
+# export formats
+# text: the original layout, one column of the data table after another
+#       and then the bad frames (no parameters or metadata)
+# csv, npz, hdf5, parquet: the export table (see exportTable) and the run
+#                          metadata, which load back in one read (see
+#                          readData). hdf5 needs h5py and parquet pyarrow
+EXPORT_TEXT = "text"
+EXPORT_CSV = "csv"
+EXPORT_NPZ = "npz"
+EXPORT_HDF5 = "hdf5"
+EXPORT_PARQUET = "parquet"
+EXPORT_FORMATS = (EXPORT_TEXT, EXPORT_CSV, EXPORT_NPZ, EXPORT_HDF5,
+                  EXPORT_PARQUET)
+
+# the file extension of each format, and the formats of the extensions
+EXPORT_EXTENSIONS = {EXPORT_TEXT: ".txt", EXPORT_CSV: ".csv",
+                     EXPORT_NPZ: ".npz", EXPORT_HDF5: ".h5",
+                     EXPORT_PARQUET: ".parquet"}
+EXTENSION_FORMATS = {".txt": EXPORT_TEXT, ".csv": EXPORT_CSV,
+                     ".npz": EXPORT_NPZ, ".h5": EXPORT_HDF5,
+                     ".hdf5": EXPORT_HDF5, ".parquet": EXPORT_PARQUET}
+
+# packages the formats need beyond numpy
+FORMAT_PACKAGES = {EXPORT_HDF5: "h5py", EXPORT_PARQUET: "pyarrow"}
+
+# the inputs each frame was measured with
+PARAM_NAMES = ("Threshold", "GOL Iterations", "GOL Factor")
+
+# the columns of the export table: the frame number (from 1), whether the
+# frame was tossed and whether it was measured (0 or 1), the data (zeros
+# if there is none) and the inputs it was measured with (nan if it wasn't)
+COLUMN_NAMES = ("Frame", "Tossed", "Measured") + cFD.DATA_NAMES + PARAM_NAMES
+FLAG_COLUMNS = 3
+
+# how each column of the export table is written to CSV files
+CSV_FORMATS = (["%d"] * FLAG_COLUMNS
+               + ["%.10g"] * (len(COLUMN_NAMES) - FLAG_COLUMNS))
+
+# parameters of a stack where no frame is measured yet
+def emptyFrameParams(numFrames):
+    return full((numFrames, len(PARAM_NAMES)), nan)
+
+# the metadata of a run on a stack: the stack, the time of the export and
+# any other settings given (e.g. golMode="legacy"), which have to be JSON
+# serializable
+def runMetadata(fileName, **settings):
+    metadata = {"stack": path.abspath(fileName) if fileName else None,
+                "exported": datetime.now(timezone.utc).isoformat(
+                        timespec="seconds")}
+    metadata.update(settings)
+    return metadata
+
+# the export format of a file name, going by its extension
+def exportFormat(fileName):
+    extension = path.splitext(fileName)[1].lower()
+    if extension not in EXTENSION_FORMATS:
+        raise ValueError(F"unknown export file extension: {extension}")
+    return EXTENSION_FORMATS[extension]
+
+# raises an error for an unknown format or one whose package isn't
+# installed, so a long run can fail before it starts instead of at its end
+def checkFormat(fileFormat):
+    if fileFormat not in EXPORT_FORMATS:
+        raise ValueError(F"unknown export format: {fileFormat}")
+    package = FORMAT_PACKAGES.get(fileFormat)
+    if package is not None and find_spec(package) is None:
+        raise ImportError(F"exporting {fileFormat} files needs {package}")
+
+# the export table (frames, COLUMN_NAMES) of a data table, the tossed frame
+# numbers (from 1) and the parameters of each frame (see emptyFrameParams)
+def exportTable(dataTableArray, tossedFrames, frameParams):
+    numFrames = dataTableArray.shape[0]
+    frames = arange(1, numFrames + 1)
+    return column_stack((frames, isin(frames, list(tossedFrames)),
+                         isfinite(frameParams[:, 0]), dataTableArray,
+                         frameParams))
+
+# writes the data table, tossed frames, per-frame parameters and run
+# metadata in one of EXPORT_FORMATS (by default going by the extension)
+def writeData(fileName, dataTableArray, tossedFrames, frameParams=None,
+              metadata=None, fileFormat=None):
+    if fileFormat is None:
+        fileFormat = exportFormat(fileName)
+    checkFormat(fileFormat)
+    if fileFormat == EXPORT_TEXT:
+        writeDataText(fileName, dataTableArray, tossedFrames)
+        return
+
+    if frameParams is None:
+        frameParams = emptyFrameParams(dataTableArray.shape[0])
+    if metadata is None:
+        metadata = runMetadata(None)
+    table = exportTable(dataTableArray, tossedFrames, frameParams)
+    with instrumentF.stage("export"):
+        TABLE_WRITERS[fileFormat](fileName, table, metadata)
+
+# writes the data table and the tossed (bad) frames to a text file, one
+# column of the table after another, each headed by its data name
+def writeDataText(fileName, dataTableArray, tossedFrames):
+    with instrumentF.stage("export"):
+        with open(fileName, "w", encoding="utf-8") as f:
+
+            for column in range(dataTableArray.shape[1]):
+                f.write(F"{cFD.DATA_NAMES[column]}\n")
+
+                for row in range(dataTableArray.shape[0]):
+                    f.write(F"{dataTableArray[row, column]:.4f}\n")
+
+            f.write("Bad Frames\n")
+            for frame in tossedFrames:
+                f.write(F"{frame}\n")
+
+# CSV files start with the metadata as "# key: JSON value" lines, then a
+# line of column names and a row for every frame
+def writeCsvHeader(f, metadata):
+    for key, value in metadata.items():
+        f.write(F"# {key}: {json.dumps(value)}\n")
+    f.write(",".join(COLUMN_NAMES) + "\n")
+
+def writeTableCsv(fileName, table, metadata):
+    with open(fileName, "w", encoding="utf-8", newline="") as f:
+        writeCsvHeader(f, metadata)
+        savetxt(f, table, fmt=CSV_FORMATS, delimiter=",")
+
+def writeTableNpz(fileName, table, metadata):
+    savez_compressed(fileName, table=table, columns=array(COLUMN_NAMES),
+                     metadata=array(json.dumps(metadata)))
+
+def writeTableHdf5(fileName, table, metadata):
+    import h5py
+    with h5py.File(fileName, "w") as f:
+        dataset = f.create_dataset("table", data=table)
+        dataset.attrs["columns"] = list(COLUMN_NAMES)
+        f.attrs["metadata"] = json.dumps(metadata)
+
+def writeTableParquet(fileName, table, metadata):
+    import pyarrow
+    import pyarrow.parquet
+    columns = {name: (table[:, i].astype(int) if i < FLAG_COLUMNS
+                      else table[:, i])
+               for i, name in enumerate(COLUMN_NAMES)}
+    pyarrow.parquet.write_table(
+            pyarrow.table(columns,
+                          metadata={"metadata": json.dumps(metadata)}),
+            fileName)
+
+TABLE_WRITERS = {EXPORT_CSV: writeTableCsv, EXPORT_NPZ: writeTableNpz,
+                 EXPORT_HDF5: writeTableHdf5,
+                 EXPORT_PARQUET: writeTableParquet}
+
+# reads a file written by writeData (or a CsvStream) in any format but
+# text, returning the export table and the metadata
+def readData(fileName):
+    fileFormat = exportFormat(fileName)
+    if fileFormat == EXPORT_CSV:
+        return readTableCsv(fileName)
+    if fileFormat == EXPORT_NPZ:
+        with npload(fileName) as f:
+            return f["table"], json.loads(str(f["metadata"]))
+    if fileFormat == EXPORT_HDF5:
+        import h5py
+        with h5py.File(fileName, "r") as f:
+            return f["table"][()], json.loads(f.attrs["metadata"])
+    if fileFormat == EXPORT_PARQUET:
+        import pyarrow.parquet
+        parquetTable = pyarrow.parquet.read_table(fileName)
+        return (column_stack([parquetTable.column(name).to_numpy()
+                              for name in COLUMN_NAMES]).astype(float),
+                json.loads(parquetTable.schema.metadata[b"metadata"]))
+    raise ValueError("text exports can't be read back")
+
+def readTableCsv(fileName):
+    metadata = {}
+    with open(fileName, encoding="utf-8") as f:
+        line = f.readline()
+        while line.startswith("#"):
+            key, value = line[1:].split(":", 1)
+            metadata[key.strip()] = json.loads(value)
+            line = f.readline()
+        table = loadtxt(f, delimiter=",", ndmin=2)
+    return table.reshape(-1, len(COLUMN_NAMES)), metadata
+
+# writes the export table of a stack to a CSV file a frame at a time while
+# it is being measured, flushing every row, so a run that dies part way
+# keeps every frame measured until then. frames have to come in order;
+# those passed over (e.g. tossed frames) get rows without data, and the
+# rest are added when the stream is closed after the whole stack was
+# measured (but not when it is left by an exception). the finished file is
+# the same as writeData would write to CSV
+class CsvStream():
+
+    def __init__(self, fileName, numFrames, tossedFrames, metadata):
+        self.numFrames = numFrames
+        self.tossedFrames = set(tossedFrames)
+        self.nextFrame = 0
+        self._file = open(fileName, "w", encoding="utf-8", newline="")
+        writeCsvHeader(self._file, metadata)
+        self._file.flush()
+
+    # adds the row of a measured frame (data is a DATA_NAMES row, params a
+    # PARAM_NAMES row)
+    def writeFrame(self, frameIndex, data, params):
+        self.skipTo(frameIndex)
+        self.writeRow(frameIndex, True, data, params)
+        self._file.flush()
+
+    # adds rows without data for the frames before frameIndex
+    def skipTo(self, frameIndex):
+        while self.nextFrame < frameIndex:
+            self.writeRow(self.nextFrame, False,
+                          (0.0,) * len(cFD.DATA_NAMES),
+                          (nan,) * len(PARAM_NAMES))
+
+    def writeRow(self, frameIndex, measured, data, params):
+        row = ((frameIndex + 1, frameIndex + 1 in self.tossedFrames,
+                measured) + tuple(data) + tuple(params))
+        with instrumentF.stage("export"):
+            savetxt(self._file, [row], fmt=CSV_FORMATS, delimiter=",")
+        self.nextFrame = frameIndex + 1
+
+    # finishes the file with the frames left, or leaves it as it is if
+    # the stack wasn't measured to the end
+    def close(self, complete=True):
+        if complete:
+            self.skipTo(self.numFrames)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close(complete=excType is None)
+        return False
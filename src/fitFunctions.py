@@ -0,0 +1,118 @@
+from math import comb
+from typing import NamedTuple
+from numpy import (asarray, concatenate, repeat, arange, bincount, ones,
+                   zeros, inf, nan, ndarray, float64, intp,
+                   sqrt as npsqrt, where, errstate)
+from numpy.linalg import pinv
+
+# the least squares fit of a polynomial to one or more sets of points
+# coefficients: highest power first, like the a, b, c of a * x^2 + b * x + c
+# covariance: estimated covariance of the coefficients, scaled by the
+#             residual variance like scipy's curve_fit (inf when there are
+#             no more points than coefficients)
+# residual: weighted sum of squared residuals
+# numPoints: number of points fit
+# for a batch of fits every field has one more leading axis, one element
+# per point set
+class PolynomialFit(NamedTuple):
+    coefficients: ndarray
+    covariance: ndarray
+    residual: ndarray
+    numPoints: ndarray
+
+# fits y = polynomial(x) of the given degree to one set of points
+def fitPolynomial(x, y, degree, weights=None):
+    if weights is not None:
+        weights = [weights]
+    fits = fitPolynomials([x], [y], degree, weights)
+    return PolynomialFit(*(field[0] for field in fits))
+
+# fits a polynomial of the given degree to each of several point sets of
+# any length (e.g. one per frame) with a single batched solve of the
+# normal equations. weights (e.g. pixel intensities) default to 1
+def fitPolynomials(xs, ys, degree, weights=None):
+    numSets = len(xs)
+    numCoeffs = degree + 1
+    lengths = asarray([len(x) for x in xs], dtype=intp)
+    setIndex = repeat(arange(numSets), lengths)
+
+    if numSets == 0:
+        return PolynomialFit(zeros((0, numCoeffs)),
+                             zeros((0, numCoeffs, numCoeffs)), zeros(0),
+                             lengths)
+
+    x = concatenate([asarray(x, dtype=float64) for x in xs])
+    y = concatenate([asarray(y, dtype=float64) for y in ys])
+    if weights is None:
+        w = ones(len(x))
+    else:
+        w = concatenate([asarray(w, dtype=float64) for w in weights])
+
+    def setSums(values):
+        return bincount(setIndex, weights=values, minlength=numSets)
+
+    # fit in t = (x - center) / scale, which keeps the normal equations
+    # well conditioned however far the points are from x = 0
+    totalWeight = setSums(w)
+    with errstate(divide="ignore", invalid="ignore"):
+        center = where(totalWeight > 0, setSums(w * x) / totalWeight, 0.0)
+        scale = npsqrt(where(totalWeight > 0,
+                             setSums(w * (x - center[setIndex])**2)
+                             / totalWeight, 0.0))
+    scale = where(scale > 0, scale, 1.0)
+    t = (x - center[setIndex]) / scale[setIndex]
+
+    # normal equations (A^T W A) p = A^T W y, where the columns of A are
+    # t^degree ... t^0, built from the sums of the powers of t
+    powerSums = zeros((numSets, 2 * degree + 1))
+    momentSums = zeros((numSets, numCoeffs))
+    tPower = ones(len(t))
+    for k in range(2 * degree + 1):
+        powerSums[:, k] = setSums(w * tPower)
+        if k <= degree:
+            momentSums[:, degree - k] = setSums(w * tPower * y)
+        tPower = tPower * t
+
+    rows = arange(numCoeffs)
+    normalMat = powerSums[:, 2 * degree - rows[:, None] - rows[None, :]]
+
+    # the pseudo inverse gives a least norm answer instead of failing when
+    # a set has too few distinct x values
+    normalInv = pinv(normalMat)
+    tCoeffs = (normalInv @ momentSums[:, :, None])[:, :, 0]
+
+    # weighted sum of squared residuals
+    fitted = zeros(len(t))
+    for k in range(numCoeffs):
+        fitted = fitted * t + tCoeffs[setIndex, k]
+    residual = setSums(w * (y - fitted)**2)
+
+    # covariance scaled by the residual variance, which can't be
+    # estimated without more points than coefficients
+    dof = lengths - numCoeffs
+    with errstate(divide="ignore", invalid="ignore"):
+        variance = where(dof > 0, residual / dof, 0.0)
+    tCovariance = normalInv * variance[:, None, None]
+
+    # convert the coefficients and covariances from t back to x
+    toX = scaleToX(center, scale, degree)
+    coefficients = (toX @ tCoeffs[:, :, None])[:, :, 0]
+    covariance = toX @ tCovariance @ toX.transpose(0, 2, 1)
+    covariance[dof <= 0] = inf
+
+    coefficients[lengths == 0] = nan
+    return PolynomialFit(coefficients, covariance, residual, lengths)
+
+# returns the matrices that turn polynomial coefficients in
+# t = (x - center) / scale into coefficients in x (highest power first)
+def scaleToX(center, scale, degree):
+    numCoeffs = degree + 1
+    toX = zeros((len(center), numCoeffs, numCoeffs))
+
+    # t^k = sum over j of comb(k, j) x^j (-center)^(k - j) / scale^k
+    for k in range(numCoeffs):
+        for j in range(k + 1):
+            toX[:, degree - j, degree - k] = (comb(k, j)
+                                              * (-center)**(k - j)
+                                              / scale**k)
+    return toX
@@ -0,0 +1,214 @@
+from collections import OrderedDict
+from os import path, stat
+from threading import Lock
+from numpy import (zeros, arange, bincount, cumsum, argmax, where,
+                   rint, clip, uint32, int64, float64, errstate,
+                   isfinite, abs as npabs)
+import tiffFunctions as tiffF
+
+# histograms have one bin per 16-bit value (values outside 0 - 65535, e.g.
+# of float frames, are rounded and clipped into that range)
+HISTOGRAM_MAX_VALUE = 65535
+
+# number of frames whose thresholds are computed at once
+THRESHOLD_BLOCK_FRAMES = 64
+
+# number of frames whose histograms are counted into one full 16-bit block
+# before it is cut down to the values they have
+HISTOGRAM_BLOCK_FRAMES = 64
+
+# number of stacks whose histograms are kept
+CACHED_STACKS = 8
+
+# ways of choosing a threshold from a frame's histogram
+THRESH_OTSU = "otsu"
+THRESH_TRIANGLE = "triangle"
+THRESH_PERCENTILE = "percentile"
+THRESH_METHODS = (THRESH_OTSU, THRESH_TRIANGLE, THRESH_PERCENTILE)
+
+# default percentile of the percentile method (the brightest 1 % of the
+# pixels are kept)
+DEFAULT_PERCENTILE = 99.0
+
+# histograms of the CACHED_STACKS stacks read last, by file and its size
+# and change time, from least to most recently used
+cachedHistograms = OrderedDict()
+cacheLock = Lock()
+
+# the histogram of every frame of a stack
+# counts: (frames, bins) pixel counts, where bin b counts the pixels with
+#         value offset + b. the bins only cover the values that appear in
+#         the stack, so 12-bit data takes 4096 bins instead of 65536
+# offset: value of the first bin
+class StackHistograms():
+
+    def __init__(self, counts, offset):
+        self.counts = counts
+        self.offset = offset
+
+    def __len__(self):
+        return len(self.counts)
+
+    # the value of each bin
+    def values(self):
+        return self.offset + arange(self.counts.shape[1])
+
+    # the thresholds chosen by method for every frame
+    def thresholds(self, method, percentile=DEFAULT_PERCENTILE):
+        return autoThresholds(self, method, percentile)
+
+# returns the histograms of every frame of a stack, reading the stack once
+# the first time and from the cache after that (until the file changes)
+# the frames of a hyperstack are projected as given (see tiffF.PROJECTIONS)
+def stackHistograms(tiffFileName, projection=None):
+    stack = tiffF.openTiffStack(tiffFileName, projection)
+    info = stat(tiffFileName)
+    key = (path.abspath(tiffFileName), info.st_size, info.st_mtime_ns,
+           stack.projection if stack.isHyperstack() else None)
+    with cacheLock:
+        if key in cachedHistograms:
+            cachedHistograms.move_to_end(key)
+            return cachedHistograms[key]
+
+    # the frames are read past the stack's cache, which keeps the frames
+    # on display
+    histograms = computeHistograms(stack.uncachedFrames())
+    with cacheLock:
+        cachedHistograms[key] = histograms
+        while len(cachedHistograms) > CACHED_STACKS:
+            cachedHistograms.popitem(last=False)
+    return histograms
+
+# builds the histograms of a sequence of frames (e.g. a TiffStack or
+# TiffStack.uncachedFrames), reading each frame once in order. the frames
+# are counted HISTOGRAM_BLOCK_FRAMES at a time into one reused 16-bit
+# block, which is cut down to the range of values its frames have, so
+# only the final array covers the range of the whole stack
+def computeHistograms(frames):
+    block = zeros((HISTOGRAM_BLOCK_FRAMES, HISTOGRAM_MAX_VALUE + 1),
+                  dtype=uint32)
+
+    # how far each row of the block was written, so only what is left of
+    # the frame before has to be cleared
+    rowLengths = [0] * HISTOGRAM_BLOCK_FRAMES
+    chunks = []
+    numFrames = 0
+    filled = 0
+    for arr in frames:
+        values = histogramValues(arr).ravel()
+        if filled == 0:
+            lowest = HISTOGRAM_MAX_VALUE
+            highest = 0
+        counts = bincount(values)
+        block[filled, :len(counts)] = counts
+        block[filled, len(counts):rowLengths[filled]] = 0
+        rowLengths[filled] = len(counts)
+        lowest = min(lowest, int(values.min()))
+        highest = max(highest, len(counts))
+        filled += 1
+        numFrames += 1
+
+        if filled == HISTOGRAM_BLOCK_FRAMES:
+            chunks.append((block[:filled, lowest:highest].copy(), lowest))
+            filled = 0
+    if filled:
+        chunks.append((block[:filled, lowest:highest].copy(), lowest))
+
+    if numFrames == 0:
+        return StackHistograms(zeros((0, 1), dtype=uint32), 0)
+
+    offset = min(lowest for counts, lowest in chunks)
+    highest = max(lowest + counts.shape[1] for counts, lowest in chunks)
+    allCounts = zeros((numFrames, highest - offset), dtype=uint32)
+    start = 0
+    for counts, lowest in chunks:
+        allCounts[start:start + len(counts),
+                  lowest - offset:lowest - offset + counts.shape[1]] = counts
+        start += len(counts)
+
+    return StackHistograms(allCounts, offset)
+
+# the 16-bit histogram value of each pixel of a frame
+def histogramValues(arr):
+    if arr.dtype.kind in "ui" and arr.dtype.itemsize <= 2:
+        if arr.dtype.kind == "u" or arr.min() >= 0:
+            return arr
+    return clip(rint(arr), 0, HISTOGRAM_MAX_VALUE).astype(int64)
+
+# the threshold of each frame chosen by method (one of THRESH_METHODS),
+# as an int array. pixels above a frame's threshold are kept, like
+# threshFunctions.applyThreshToArr
+def autoThresholds(histograms, method, percentile=DEFAULT_PERCENTILE):
+    if method == THRESH_OTSU:
+        findBins = otsuBins
+    elif method == THRESH_TRIANGLE:
+        findBins = triangleBins
+    elif method == THRESH_PERCENTILE:
+        if not 0 <= percentile <= 100:
+            raise ValueError("percentile must be between 0 and 100")
+        findBins = lambda counts: percentileBins(counts, percentile)
+    else:
+        raise ValueError(F"unknown threshold method {method!r}, expected "
+                         F"one of {THRESH_METHODS}")
+
+    # a block of frames at a time keeps the float work arrays small
+    numFrames = len(histograms.counts)
+    bins = zeros(numFrames, dtype=int64)
+    for start in range(0, numFrames, THRESHOLD_BLOCK_FRAMES):
+        block = histograms.counts[start:start + THRESHOLD_BLOCK_FRAMES]
+        bins[start:start + len(block)] = findBins(block.astype(float64))
+
+    return histograms.offset + bins
+
+# the bin of each row of counts below which percentile % of the pixels are
+def percentileBins(counts, percentile):
+    cumulative = cumsum(counts, axis=1)
+    target = cumulative[:, -1:] * percentile / 100
+    return argmax(cumulative >= target, axis=1)
+
+# Otsu's method: the bin that splits each row of counts into the two
+# classes with the largest variance between them
+def otsuBins(counts):
+    binValues = arange(counts.shape[1], dtype=float64)
+    total = counts.sum(axis=1, keepdims=True)
+    lowWeight = cumsum(counts, axis=1)
+    lowSum = cumsum(counts * binValues, axis=1)
+    totalSum = lowSum[:, -1:]
+
+    # (total mean * low weight - low sum)^2 / (low weight * high weight)
+    with errstate(divide="ignore", invalid="ignore"):
+        betweenVariance = ((totalSum * lowWeight - total * lowSum)**2
+                           / (lowWeight * (total - lowWeight)))
+    betweenVariance[~isfinite(betweenVariance)] = -1
+    return argmax(betweenVariance, axis=1)
+
+# the triangle method: draw a line from the peak of each row of counts to
+# the end of its longer tail, and pick the bin where the histogram is
+# furthest from the line
+def triangleBins(counts):
+    numRows, numBins = counts.shape
+    rows = arange(numRows)
+    binIndices = arange(numBins)
+
+    peak = argmax(counts, axis=1)
+    peakHeight = counts[rows, peak]
+    hasCounts = counts > 0
+    first = argmax(hasCounts, axis=1)
+    last = numBins - 1 - argmax(hasCounts[:, ::-1], axis=1)
+
+    # the line ends just past the last (or first) counted bin
+    isRightTail = last - peak >= peak - first
+    end = where(isRightTail, last + 1, first - 1).astype(float64)
+    span = (end - peak)[:, None]
+
+    # distances from the line through (peak, peakHeight) and (end, 0) up to
+    # a factor that is the same along a row
+    distance = npabs(span * (counts - peakHeight[:, None])
+                     + peakHeight[:, None] * (binIndices - peak[:, None]))
+    between = where(isRightTail[:, None],
+                    (binIndices >= peak[:, None])
+                    & (binIndices <= last[:, None]),
+                    (binIndices <= peak[:, None])
+                    & (binIndices >= first[:, None]))
+    distance[~between] = -1
+    return argmax(distance, axis=1)
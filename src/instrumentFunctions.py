@@ -0,0 +1,229 @@
+import csv
+import json
+import tracemalloc
+from contextlib import nullcontext
+from os import environ
+from threading import Lock, local
+from time import perf_counter
+
+# environment variable that turns instrumentation on at startup
+# (set it to "memory" to also trace allocations)
+ENVIRONMENT_VARIABLE = "SPINDLE_PROFILE"
+
+# whether stages are recorded, and whether their peak allocations are
+# traced with tracemalloc (which slows everything down noticeably)
+enabled = False
+tracingMemory = False
+
+# what stage() and frame() return while disabled, so an instrumented
+# function only pays for one call and a check of the flag
+NO_STAGE = nullcontext()
+
+# (stack, frame, stage) -> [calls, seconds, peak bytes]
+# frame is None for work that isn't done for one frame (e.g. fitting a
+# batch of frames together), and stack too if it isn't for one stack
+records = {}
+recordsLock = Lock()
+
+# the frame each thread is working on and its open stages
+threadState = local()
+
+# times the code inside it as one call of the named stage of the current
+# frame, e.g.
+#     with instrumentF.stage("rotate"):
+#         rotImg = rotate(...)
+# frame totals add up the stages, so stages shouldn't be nested inside
+# each other if those totals are wanted
+def stage(name):
+    if not enabled:
+        return NO_STAGE
+    return StageTimer(name)
+
+# records the stages inside it under a frame of a stack (any names that
+# identify them, e.g. the file name and frame index)
+def frame(stack, frameIndex):
+    if not enabled:
+        return NO_STAGE
+    return FrameContext(stack, frameIndex)
+
+# starts recording, optionally with the peak allocation of each stage
+def enable(traceMemory=False):
+    global enabled, tracingMemory
+    if traceMemory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracingMemory = traceMemory
+    enabled = True
+
+# stops recording (the records are kept until reset)
+def disable():
+    global enabled, tracingMemory
+    if tracingMemory:
+        tracemalloc.stop()
+    enabled = False
+    tracingMemory = False
+
+# turns recording on if the environment asks for it
+def enableFromEnvironment():
+    value = environ.get(ENVIRONMENT_VARIABLE, "").lower()
+    if value and value not in ("0", "false", "no"):
+        enable(traceMemory=(value == "memory"))
+    return enabled
+
+# forgets everything recorded
+def reset():
+    with recordsLock:
+        records.clear()
+
+class StageTimer():
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        openStages = currentOpenStages()
+        self.peak = 0
+        if tracingMemory:
+            # tracemalloc only has one peak, so the enclosing stages take
+            # theirs before it is reset for this one
+            current, peak = tracemalloc.get_traced_memory()
+            for outer in openStages:
+                outer.peak = max(outer.peak, peak)
+            tracemalloc.reset_peak()
+            self.startMemory = current
+        openStages.append(self)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        seconds = perf_counter() - self.start
+        openStages = currentOpenStages()
+        openStages.pop()
+
+        peakBytes = 0
+        if tracingMemory:
+            peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            peakBytes = max(peak - self.startMemory, 0)
+            for outer in openStages:
+                outer.peak = max(outer.peak, peak)
+
+        stack, frameIndex = getattr(threadState, "frame", (None, None))
+        addRecord(stack, frameIndex, self.name, 1, seconds, peakBytes)
+        return False
+
+class FrameContext():
+
+    def __init__(self, stack, frameIndex):
+        self.frame = (stack, frameIndex)
+
+    def __enter__(self):
+        self.outerFrame = getattr(threadState, "frame", (None, None))
+        threadState.frame = self.frame
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        threadState.frame = self.outerFrame
+        return False
+
+def currentOpenStages():
+    if not hasattr(threadState, "openStages"):
+        threadState.openStages = []
+    return threadState.openStages
+
+def addRecord(stack, frameIndex, name, calls, seconds, peakBytes):
+    key = (stack, frameIndex, name)
+    with recordsLock:
+        record = records.get(key)
+        if record is None:
+            records[key] = [calls, seconds, peakBytes]
+        else:
+            record[0] += calls
+            record[1] += seconds
+            record[2] = max(record[2], peakBytes)
+
+# every record as a dict with stack, frame, stage, calls, seconds and
+# peakBytes, in the order they were first recorded
+def recordRows():
+    with recordsLock:
+        items = list(records.items())
+    return [{"stack": stack, "frame": frameIndex, "stage": name,
+             "calls": calls, "seconds": seconds, "peakBytes": peakBytes}
+            for (stack, frameIndex, name), (calls, seconds, peakBytes)
+            in items]
+
+# calls, seconds and peak bytes of each stage over all frames (or the
+# frames of one stack)
+def stageTotals(stack=None):
+    totals = {}
+    for row in recordRows():
+        if stack is not None and row["stack"] != stack:
+            continue
+        total = totals.setdefault(row["stage"], {"calls": 0, "seconds": 0.0,
+                                                 "peakBytes": 0})
+        total["calls"] += row["calls"]
+        total["seconds"] += row["seconds"]
+        total["peakBytes"] = max(total["peakBytes"], row["peakBytes"])
+    return totals
+
+# stage -> seconds of one frame
+def frameStages(stack, frameIndex):
+    return {row["stage"]: row["seconds"] for row in recordRows()
+            if row["stack"] == stack and row["frame"] == frameIndex}
+
+# the numFrames frames (of all stacks or one) with the most time in their
+# stages, as (stack, frame, seconds, slowest stage) from the slowest
+def slowestFrames(numFrames=5, stack=None):
+    frames = {}
+    for row in recordRows():
+        if row["frame"] is None:
+            continue
+        if stack is not None and row["stack"] != stack:
+            continue
+        frames.setdefault((row["stack"], row["frame"]), {})[
+                row["stage"]] = row["seconds"]
+    slowest = sorted(frames.items(), key=lambda item: -sum(item[1].values()))
+    return [(stack, frameIndex, sum(stages.values()),
+             max(stages, key=stages.get))
+            for (stack, frameIndex), stages in slowest[:numFrames]]
+
+# a one line summary of stage times, slowest first, e.g. for a status bar
+def summaryText(stageSeconds):
+    ordered = sorted(stageSeconds.items(), key=lambda item: -item[1])
+    return "  ".join(F"{name} {1000 * seconds:.1f} ms"
+                     for name, seconds in ordered)
+
+# a table of the stage totals, slowest first
+def breakdownText(stack=None):
+    totals = stageTotals(stack)
+    allSeconds = sum(total["seconds"] for total in totals.values())
+    lines = [F"{'stage':>12} {'calls':>7} {'ms':>10} {'ms/call':>9} "
+             F"{'share':>6} {'peak KiB':>9}"]
+    for name, total in sorted(totals.items(),
+                              key=lambda item: -item[1]["seconds"]):
+        share = total["seconds"] / allSeconds if allSeconds else 0.0
+        peak = F"{total['peakBytes'] / 1024:>9.1f}" if tracingMemory else (
+                F"{'-':>9}")
+        lines.append(F"{name:>12} {total['calls']:>7} "
+                     F"{1000 * total['seconds']:>10.1f} "
+                     F"{1000 * total['seconds'] / total['calls']:>9.3f} "
+                     F"{share:>6.1%} {peak}")
+    return "\n".join(lines)
+
+def writeJson(fileName):
+    with open(fileName, "w", encoding="utf-8") as f:
+        json.dump({"tracingMemory": tracingMemory,
+                   "stages": stageTotals(),
+                   "records": recordRows()}, f, indent=1)
+
+def writeCsv(fileName):
+    fields = ("stack", "frame", "stage", "calls", "seconds", "peakBytes")
+    with open(fileName, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        writer.writerows(recordRows())
+
+# writes the records as JSON or CSV, going by the file extension
+def writeRecords(fileName):
+    if fileName.lower().endswith(".csv"):
+        writeCsv(fileName)
+    else:
+        writeJson(fileName)
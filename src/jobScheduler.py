@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from time import perf_counter
+from PySide6.QtCore import QObject, Signal
+
+# runs slow work off the Qt main thread so the window stays responsive
+# jobs have a kind (e.g. "threshold" or "preview") and only the newest job
+# of each kind matters: submitting a job cancels the previous job of the
+# same kind if it hasn't started, and drops its result if it has
+# results are posted back to the main thread through jobFinished
+# long jobs can be stoppable: they are given one more argument, a function
+# returning True once the job is cancelled, and should check it as they go
+class JobScheduler(QObject):
+
+    # kind, result and the perf_counter time the job was submitted
+    jobFinished = Signal(str, object, float)
+
+    # kind and the exception the job raised
+    jobFailed = Signal(str, object)
+
+    # True while any job that still matters is queued or running
+    busyChanged = Signal(bool)
+
+    # emitted from the worker thread and delivered on the main thread
+    _jobDone = Signal(str, int, object)
+
+    def __init__(self, numThreads=2):
+        super().__init__()
+
+        self._pool = ThreadPoolExecutor(numThreads)
+
+        # kind -> (job id, future, submit time, stop event) of the newest
+        # job
+        self._latestJobs = {}
+        self._nextJobId = 0
+
+        self._jobDone.connect(self._onJobDone)
+
+    def isBusy(self):
+        return len(self._latestJobs) > 0
+
+    # runs func(*args) in a worker thread as the newest job of its kind
+    # (func(*args, isStopped) if it is stoppable)
+    def submit(self, kind, func, *args, stoppable=False):
+        wasBusy = self.isBusy()
+        self.cancel(kind, notify=False)
+
+        self._nextJobId += 1
+        jobId = self._nextJobId
+        stop = Event()
+        if stoppable:
+            args = (*args, stop.is_set)
+        future = self._pool.submit(func, *args)
+        self._latestJobs[kind] = (jobId, future, perf_counter(), stop)
+
+        future.add_done_callback(
+                lambda done: self._jobDone.emit(kind, jobId, done))
+
+        if not wasBusy:
+            self.busyChanged.emit(True)
+
+    # forgets the newest job of a kind, so its result is never posted
+    def cancel(self, kind, notify=True):
+        if kind not in self._latestJobs:
+            return
+
+        jobId, future, submitted, stop = self._latestJobs.pop(kind)
+        future.cancel()
+        stop.set()
+        if notify and not self.isBusy():
+            self.busyChanged.emit(False)
+
+    # stops the stoppable jobs, waits for the running ones and stops the
+    # worker threads
+    def shutdown(self):
+        for kind in list(self._latestJobs):
+            self.cancel(kind)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    # main thread: post the result if the job is still the newest of its kind
+    def _onJobDone(self, kind, jobId, future):
+        if future.cancelled():
+            return
+        latest = self._latestJobs.get(kind)
+        if latest is None or latest[0] != jobId:
+            return
+
+        jobId, future, submitted, stop = self._latestJobs.pop(kind)
+        if not self.isBusy():
+            self.busyChanged.emit(False)
+
+        error = future.exception()
+        if error is not None:
+            self.jobFailed.emit(kind, error)
+        else:
+            self.jobFinished.emit(kind, future.result(), submitted)
@@ -0,0 +1,66 @@
+from numpy import ones, where, bincount, argsort, zeros, arange, int32
+from scipy.ndimage import label, find_objects
+
+# default grouping radii (in pixels) of the original clustering:
+# a point joins an object if it is within NEIGHBOR_RADIUS (inclusive) of
+# one of its points in both x and y, and objects with any two points
+# closer than CONSOLIDATION_RADIUS in both x and y are merged
+NEIGHBOR_RADIUS = 2
+CONSOLIDATION_RADIUS = 10
+
+# groups the points of a thresholded image into objects
+# returns a label image (0 for background, objects numbered from 1 in order
+# of decreasing size), the number of points in each object and the
+# bounding box slices of each object (index o describes label o + 1)
+def labelThreshArr(threshArr, neighborRadius=NEIGHBOR_RADIUS,
+                   consolidationRadius=CONSOLIDATION_RADIUS):
+
+    # the two rules together link any two points that are at most
+    # linkDistance apart in both x and y, and objects are the chains of
+    # linked points
+    linkDistance = max(neighborRadius, consolidationRadius - 1)
+    if linkDistance < 1:
+        raise ValueError("the grouping radii must link adjacent points")
+
+    mask = threshArr > 0
+
+    # grow every point into a square that reaches linkDistance - 1 pixels
+    # right and down. two squares touch exactly when their points are
+    # linked, so the connected regions of the grown image are the objects
+    grownLabels, numObjects = label(growMask(mask, linkDistance),
+                                    structure=ones((3, 3)))
+    labelArr = where(mask, grownLabels, 0).astype(int32)
+
+    if numObjects == 0:
+        return labelArr, zeros(0, dtype=int), []
+
+    # renumber from largest to smallest. label numbers the regions in the
+    # order their first point appears, which breaks ties between objects
+    # of the same size the same way the original clustering did
+    sizes = bincount(labelArr.ravel(), minlength=numObjects + 1)[1:]
+    order = argsort(-sizes, kind="stable")
+    newLabels = zeros(numObjects + 1, dtype=int32)
+    newLabels[order + 1] = arange(1, numObjects + 1, dtype=int32)
+    labelArr = newLabels[labelArr]
+
+    return labelArr, sizes[order], find_objects(labelArr)
+
+# grows each True pixel of a mask into a size x size square extending right
+# and down from it
+def growMask(mask, size):
+    rowGrown = mask.copy()
+    for shift in range(1, size):
+        rowGrown[:, shift:] |= mask[:, :-shift]
+
+    grown = rowGrown.copy()
+    for shift in range(1, size):
+        grown[shift:, :] |= rowGrown[:-shift, :]
+
+    return grown
+
+# returns the row and column coordinates of the points in object o (label
+# o + 1), looking only inside the object's bounding box
+def objectCoords(labelArr, objectBoxes, o):
+    box = objectBoxes[o]
+    yC, xC = (labelArr[box] == o + 1).nonzero()
+    return yC + box[0].start, xC + box[1].start
@@ -0,0 +1,61 @@
+from numpy import (asarray, abs as npabs, sqrt as npsqrt, arcsinh, where,
+                   errstate, stack, float64)
+
+# below this change in slope across the spindle (|2a| * width) the closed
+# forms lose precision to cancellation, and the integrands are so close to
+# constant that the midpoint rule is exact to double precision instead
+FLAT_SLOPE_CHANGE = 1e-6
+
+# computes the DATA_NAMES values of fit curves a * x^2 + b * x + c spanning
+# minX to maxX in closed form (none of them depend on c)
+# lineSlope is the slope of the straight line fit to the same points
+# every argument can be an array with one element per frame, and the
+# result has the five values along its last axis
+def spindleMetrics(a, b, lineSlope, minX, maxX):
+    a = asarray(a, dtype=float64)
+    b = asarray(b, dtype=float64)
+    lineSlope = asarray(lineSlope, dtype=float64)
+    minX = asarray(minX, dtype=float64)
+    maxX = asarray(maxX, dtype=float64)
+
+    width = maxX - minX
+
+    # the slope of the fit curve at each end and in the middle
+    u1 = 2 * a * minX + b
+    u2 = 2 * a * maxX + b
+    uMid = a * (minX + maxX) + b
+    isFlat = npabs(u2 - u1) < FLAT_SLOPE_CHANGE
+
+    # flat curves divide by a (nearly) zero a below, but those results
+    # are replaced by the midpoint rule
+    with errstate(divide="ignore", invalid="ignore"):
+
+        # POLE SEPARATION
+        poleSeparation = npsqrt(lineSlope**2 + 1) * width
+
+        # ARC LENGTH
+        # integral of sqrt(1 + u^2) dx with u = 2ax + b
+        arcLength = where(isFlat, npsqrt(1 + uMid**2) * width,
+                          (arcAntiderivative(u2) - arcAntiderivative(u1))
+                          / (2 * a))
+
+        # CURVATURE
+
+        # area metric: the area between the fit curve and the straight
+        # line through the poles
+        areaCurve = npabs(a) * width**3 / 6
+
+        # maximum and average curvature metrics
+        maxCurve = npabs(2 * a)
+
+        # integral of 2a / (1 + u^2)^(3/2) dx, averaged over the width
+        curveIntegral = where(isFlat, 2 * a * width / (1 + uMid**2)**1.5,
+                              u2 / npsqrt(1 + u2**2) - u1 / npsqrt(1 + u1**2))
+        avgCurve = npabs(curveIntegral / width)
+
+    return stack([poleSeparation, arcLength, areaCurve, maxCurve, avgCurve],
+                 axis=-1)
+
+# antiderivative (with respect to u) of sqrt(1 + u^2)
+def arcAntiderivative(u):
+    return (u * npsqrt(1 + u**2) + arcsinh(u)) / 2
@@ -0,0 +1,66 @@
+from numpy import bincount, ones, array, asarray, float64
+
+# image moments of labeled objects, computed for every object at once from
+# the coordinates of the labeled points (objects are numbered from 1 in the
+# label image and indexed from 0 in every returned array)
+
+# returns the row and column coordinates of every labeled point and the
+# index of the object it belongs to
+def labeledPoints(labelArr):
+    yC, xC = labelArr.nonzero()
+    return yC, xC, labelArr[yC, xC] - 1
+
+# returns the raw moments m00, m10, m01, m20, m11 and m02 of every object,
+# where mpq is the sum of weight * x^p * y^q over the object's points.
+# without weights every point counts once (the moments of the mask)
+def rawMoments(yC, xC, objectIndex, numObjects, weights=None):
+    if weights is None:
+        weights = ones(len(xC))
+    weights = asarray(weights, dtype=float64)
+    xC = asarray(xC, dtype=float64)
+    yC = asarray(yC, dtype=float64)
+
+    def objectSums(values):
+        return bincount(objectIndex, weights=values, minlength=numObjects)
+
+    return (objectSums(weights),
+            objectSums(weights * xC),
+            objectSums(weights * yC),
+            objectSums(weights * xC * xC),
+            objectSums(weights * xC * yC),
+            objectSums(weights * yC * yC))
+
+# returns the center of mass (x, y) of every object, weighted by the image
+# intensity at each point when weights are given
+def centersOfMass(yC, xC, objectIndex, numObjects, weights=None):
+    m00, m10, m01 = rawMoments(yC, xC, objectIndex, numObjects, weights)[:3]
+    return m10 / m00, m01 / m00
+
+# returns the central moments mu20, mu11 and mu02 of every object about the
+# given centers (by default each object's own unweighted center of mass)
+def centralMoments(yC, xC, objectIndex, numObjects, xCenters=None,
+                   yCenters=None, weights=None):
+    if xCenters is None or yCenters is None:
+        xCenters, yCenters = centersOfMass(yC, xC, objectIndex, numObjects,
+                                           weights)
+    if weights is None:
+        weights = ones(len(xC))
+    weights = asarray(weights, dtype=float64)
+
+    # subtracting the centers point by point keeps the sums accurate for
+    # small objects far from the image origin
+    dx = xC - asarray(xCenters, dtype=float64)[objectIndex]
+    dy = yC - asarray(yCenters, dtype=float64)[objectIndex]
+
+    def objectSums(values):
+        return bincount(objectIndex, weights=values, minlength=numObjects)
+
+    return (objectSums(weights * dx * dx),
+            objectSums(weights * dx * dy),
+            objectSums(weights * dy * dy))
+
+# returns the 2x2 second moment tensors [[mu20, mu11], [mu11, mu02]] of
+# every object as an array of shape (numObjects, 2, 2)
+def momentTensors(mu20, mu11, mu02):
+    return array([[mu20, mu11],
+                  [mu11, mu02]], dtype=float64).transpose(2, 0, 1)
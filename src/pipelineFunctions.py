@@ -0,0 +1,204 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple
+from numpy import ndarray
+import threshFunctions as threshF
+import curveFitData as cFD
+import cacheFunctions as cacheF
+
+# default number of outputs each stage of a StageGraph keeps, and bytes of
+# arrays all the stages keep together
+STAGE_CACHE_SIZE = 16
+STAGE_CACHE_BYTES = 128 * 1024 * 1024
+
+# one step of the analysis of a frame
+# name: what the other stages and StageGraph.output call it
+# func: computes the output, given the outputs of the inputs stages
+#       followed by the values of the params, in order
+# inputs: names of the stages whose outputs it needs
+# params: names of the analysis inputs (see stageParams) it needs
+class Stage(NamedTuple):
+    name: str
+    func: object
+    inputs: tuple = ()
+    params: tuple = ()
+
+# the analysis of a frame as a graph of Stages, each keeping its latest
+# outputs keyed by its params and the keys of its inputs, so changing an
+# input recomputes only the stages that depend on it (e.g. a new GOL
+# factor reuses the decoded frame and its threshold mask). each stage
+# keeps at most maxEntries outputs, and the least recently used outputs
+# of any stage are dropped once their arrays take more than maxBytes
+# together. any thread may use it; two threads asking for the same
+# missing output both compute it
+class StageGraph():
+
+    def __init__(self, stages, maxEntries=STAGE_CACHE_SIZE,
+                 maxBytes=STAGE_CACHE_BYTES):
+        self.stages = {stage.name: stage for stage in stages}
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.hits = dict.fromkeys(self.stages, 0)
+        self.misses = dict.fromkeys(self.stages, 0)
+
+        # (stage name, key) -> (output, bytes), from least to most
+        # recently used, and the number of outputs kept of each stage
+        self._outputs = OrderedDict()
+        self._numOutputs = dict.fromkeys(self.stages, 0)
+        self._keptBytes = 0
+        self._lock = Lock()
+
+        for stage in stages:
+            for name in stage.inputs:
+                if name not in self.stages:
+                    raise ValueError(F"stage {stage.name} needs unknown "
+                                     F"stage {name}")
+
+    # what identifies the output of a stage: the params it reads and the
+    # keys of its inputs
+    def key(self, name, params):
+        stage = self.stages[name]
+        return (tuple(params[p] for p in stage.params),
+                tuple(self.key(i, params) for i in stage.inputs))
+
+    # the output of a stage for the analysis inputs in params, computing
+    # it (and whichever of its inputs aren't kept) if needed. with keep
+    # False what is computed isn't kept (e.g. for frames read ahead, which
+    # the caller holds itself)
+    def output(self, name, params, keep=True):
+        outputKey = (name, self.key(name, params))
+        with self._lock:
+            if outputKey in self._outputs:
+                self._outputs.move_to_end(outputKey)
+                self.hits[name] += 1
+                return self._outputs[outputKey][0]
+            self.misses[name] += 1
+
+        stage = self.stages[name]
+        output = stage.func(*(self.output(i, params, keep)
+                              for i in stage.inputs),
+                            *(params[p] for p in stage.params))
+        if keep:
+            self._keep(outputKey, output)
+        return output
+
+    # whether the output of a stage for params is kept (not counted as a
+    # hit or miss)
+    def isCached(self, name, params):
+        outputKey = (name, self.key(name, params))
+        with self._lock:
+            return outputKey in self._outputs
+
+    # keeps an output of a stage computed elsewhere (e.g. an analysis
+    # from the result cache, or a frame read ahead once it is on display)
+    def store(self, name, params, output):
+        self._keep((name, self.key(name, params)), output)
+
+    def _keep(self, outputKey, output):
+        name = outputKey[0]
+        with self._lock:
+            if outputKey in self._outputs:
+                self._forget(outputKey)
+            numBytes = outputBytes(output)
+            self._outputs[outputKey] = (output, numBytes)
+            self._numOutputs[name] += 1
+            self._keptBytes += numBytes
+
+            if self._numOutputs[name] > self.maxEntries:
+                self._forget(next(k for k in self._outputs if k[0] == name))
+
+            # the output just kept stays even if it is over the budget
+            while (self._keptBytes > self.maxBytes
+                   and len(self._outputs) > 1):
+                self._forget(next(iter(self._outputs)))
+
+    # the lock has to be held
+    def _forget(self, outputKey):
+        output, numBytes = self._outputs.pop(outputKey)
+        self._numOutputs[outputKey[0]] -= 1
+        self._keptBytes -= numBytes
+
+    # bytes of arrays kept
+    def keptBytes(self):
+        with self._lock:
+            return self._keptBytes
+
+    # {stage name: (hits, misses)}
+    def counts(self):
+        with self._lock:
+            return {name: (self.hits[name], self.misses[name])
+                    for name in self.stages}
+
+    # forgets every output (the counts are kept)
+    def clear(self):
+        with self._lock:
+            self._outputs.clear()
+            self._numOutputs = dict.fromkeys(self.stages, 0)
+            self._keptBytes = 0
+
+# bytes of the arrays in a stage output (arrays in tuples, e.g. NamedTuples,
+# and lists included)
+def outputBytes(output):
+    if isinstance(output, ndarray):
+        return output.nbytes
+    if isinstance(output, (tuple, list)):
+        return sum(outputBytes(item) for item in output)
+    return 0
+
+# the analysis inputs of a frame of a tiffF.TiffStack, as the params of
+# the frameStages (more, e.g. for stages added by the caller, are passed
+# as keywords)
+def stageParams(stack, frameIndex, thresh, gOLI, gOLF,
+                golMode=threshF.GOL_LEGACY, rotationMode=cFD.ROTATE_RESAMPLE,
+                **others):
+    return {"stack": stack, "frameIndex": frameIndex, "thresh": thresh,
+            "gOLI": gOLI, "gOLF": gOLF, "golMode": golMode,
+            "rotationMode": rotationMode, **others}
+
+# the stages of the analysis of one frame, the same steps as
+# cFD.analyzeSpindle takes (so they measure the same):
+# decode -> threshold -> gol -> labels -> spindle -> rotation -> fit ->
+# metrics (a cFD.SpindleAnalysis) -> render (the cFD.plotResults)
+def frameStages():
+    return (Stage("decode", decodeFrame, (), ("stack", "frameIndex")),
+            Stage("threshold", threshF.threshMask, ("decode",),
+                  ("thresh",)),
+            Stage("gol", threshF.golMask, ("threshold",),
+                  ("gOLI", "gOLF", "golMode")),
+            Stage("labels", cFD.labelObjects, ("decode", "gol")),
+            Stage("spindle", cFD.selectSpindle, ("decode", "labels")),
+            Stage("rotation", cFD.rotateSpindle, ("spindle",),
+                  ("rotationMode",)),
+            Stage("fit", fitFrame, ("rotation",)),
+            Stage("metrics", measureFrame, ("spindle", "rotation", "fit")),
+            Stage("render", cFD.plotResults, ("metrics",)))
+
+def decodeFrame(stack, frameIndex):
+    return stack.frame(frameIndex)
+
+def fitFrame(rotation):
+    return cFD.fitSpindles([rotation])
+
+def measureFrame(geometry, rotation, fits):
+    return cFD.measureSpindles([geometry], [rotation], fits)[0]
+
+# the cFD.SpindleAnalysis of a frame from the metrics stage of a graph of
+# frameStages, looked up in the resultCache (a cacheF.ResultCache) before
+# it is computed, and stored there after
+def frameAnalysis(graph, params, resultCache=None):
+    if resultCache is None or graph.isCached("metrics", params):
+        return graph.output("metrics", params)
+
+    imageArr = graph.output("decode", params)
+    analysis = resultCache.cachedAnalysis(
+            imageArr, cacheF.resultParams(params["thresh"], params["gOLI"],
+                                          params["gOLF"], params["golMode"],
+                                          params["rotationMode"]),
+            lambda: graph.output("metrics", params))
+    graph.store("metrics", params, analysis)
+    return analysis
+
+# the hits and misses of each stage of a graph, on one line
+def countsText(graph):
+    return "  ".join(F"{name} {hits}/{hits + misses}" for name, (hits, misses)
+                     in graph.counts().items() if hits + misses)
@@ -0,0 +1,91 @@
+from PySide6.QtGui import QPixmap, QImage
+from numpy import (zeros, ones, reshape, uint8, uint16, arange, clip, iinfo,
+                   percentile, bincount, ascontiguousarray)
+import tiffFunctions as tiffF
+import histogramFunctions as histF
+import instrumentFunctions as instrumentF
+
+# ways of choosing the range of values that is stretched over the display
+# minmax: the lowest to the highest value of the image (the original look)
+# percentile: the WINDOW_PERCENTILES of the image's values, so a few hot or
+#             dead pixels don't wash out everything else
+WINDOW_MINMAX = "minmax"
+WINDOW_PERCENTILE = "percentile"
+WINDOW_MODES = (WINDOW_MINMAX, WINDOW_PERCENTILE)
+WINDOW_PERCENTILES = (0.5, 99.5)
+
+# the QImage formats arrays of each dtype are shown with
+QIMAGE_FORMATS = {uint8: QImage.Format_Grayscale8,
+                  uint16: QImage.Format_Grayscale16}
+
+# creates a normalized QPixmap from a numpy array
+def pixFromArr(arr, window=WINDOW_MINMAX):
+    return threshPixFromArr(normalizeArr(arr, window))
+
+# the (low, high) values of an array that normalizeArr maps to 0 and 255
+def displayWindow(arr, window=WINDOW_MINMAX):
+    if window == WINDOW_MINMAX:
+        return arr.min(), arr.max()
+    if window == WINDOW_PERCENTILE:
+
+        # a histogram is quicker than sorting the values of 8 and 16 bit
+        # images
+        if arr.dtype in (uint8, uint16):
+            counts = bincount(arr.ravel())[None, :]
+            return tuple(int(histF.percentileBins(counts, p)[0])
+                         for p in WINDOW_PERCENTILES)
+        low, high = percentile(arr, WINDOW_PERCENTILES)
+        return low, high
+    raise ValueError(F"unknown display window: {window}")
+
+# stretches an array to the 0 - 255 range of a uint8 array (this doesn't
+# need Qt, so it can run outside the main thread)
+# values outside the window are clipped to it
+def normalizeArr(arr, window=WINDOW_MINMAX):
+    with instrumentF.stage("normalize"):
+        low, high = displayWindow(arr, window)
+        if not high > low:
+            return zeros(arr.shape, dtype=uint8)
+
+        # 8 and 16 bit images look every pixel up in a table of all the
+        # values they can have, which is much smaller than a large frame
+        if arr.dtype in (uint8, uint16):
+            lut = windowValues(arange(iinfo(arr.dtype).max + 1), low, high)
+            return lut.take(arr)
+        return windowValues(arr, low, high)
+
+# the display values of an array of image values for a window
+def windowValues(values, low, high):
+    scaled = 255 * ((clip(values, low, high) - low) / (high - low))
+    return scaled.astype(uint8)
+
+# enlarges an array by a whole factor in both directions, repeating every
+# pixel (nearest neighbour)
+def upscaleArr(arr, factor):
+    with instrumentF.stage("upscale"):
+        return arr.repeat(factor, axis=0).repeat(factor, axis=1)
+
+# same as pixFromArr, but no normalization (for uint8, uint16 and boolean
+# arrays). the QImage is made on the array's own memory, which is then
+# copied once into the pixmap
+def threshPixFromArr(arr):
+    if arr.dtype == bool:
+        arr = arr.view(uint8) * uint8(255)
+    arr = ascontiguousarray(arr)
+    if arr.dtype.type not in QIMAGE_FORMATS:
+        raise ValueError(F"can't display an array of {arr.dtype}")
+    height, width = arr.shape
+    im = QImage(arr.data, width, height, arr.strides[0],
+                QIMAGE_FORMATS[arr.dtype.type])
+    return QPixmap.fromImage(im)
+
+# turns a tiff file path directly into a QPixmap
+def pixFromTiff(fileName, frameNum):
+    return pixFromArr(tiffF.arrFromTiff(fileName, frameNum))
+
+# returns a grayscale pixmap
+def defaultPix(backShade):
+    array = ones(4, dtype=uint8)
+    array = reshape(array, (2, 2))
+    array *= backShade
+    return threshPixFromArr(array)
@@ -1,7 +1,6 @@
 from PySide6.QtGui import QPainter, QPainterPath, QColorConstants, QPen
 from PySide6.QtCore import QPoint, QPointF
-import tiffFunctions as tiffF
-from numpy import zeros
+import pixFunctions as pixF
 
 # used for plotting the results of the curve fit onto the preview pixmap
 def plotSpindle(fitResults, doesSpindleExist):
@@ -14,31 +13,21 @@ def plotSpindle(fitResults, doesSpindleExist):
     # sf: scale factor (higher value = slower preview)
     sF = 2
 
-    # skip all of this code if I decide to set the scale back to 1
-    if sF > 1:
-        height, width = spindleArray.shape
-        bigSpindleArray = zeros((height * sF, width * sF))
-        for y in range(height):
-            for x in range(width):
-                bigSpindleArray[sF * y : sF * y + sF,
-                                sF * x : sF * x + sF] = spindleArray[y, x]
-        
-        # scale up coordinate values
-        leftPole = (leftPole[0] * sF, leftPole[1] * sF)
-        rightPole = (rightPole[0] * sF, rightPole[1] * sF)
-        centerPoint = (centerPoint[0] * sF, centerPoint[1] * sF)
-
-    controlPoint = calculateBezierPoint(leftPole, centerPoint, rightPole)
-
-    if sF > 1:
-        spindlePix = tiffF.pixFromArr(bigSpindleArray)
-    else:
-        spindlePix = tiffF.pixFromArr(spindleArray)
+    # normalizing before scaling up gives the same pixels for less work
+    spindlePix = pixF.threshPixFromArr(pixF.upscaleArr(
+            pixF.normalizeArr(spindleArray), sF))
 
     # if there is no spindle, don't try to plot
     if not doesSpindleExist:
         return spindlePix
 
+    # scale up coordinate values
+    leftPole = (leftPole[0] * sF, leftPole[1] * sF)
+    rightPole = (rightPole[0] * sF, rightPole[1] * sF)
+    centerPoint = (centerPoint[0] * sF, centerPoint[1] * sF)
+
+    controlPoint = calculateBezierPoint(leftPole, centerPoint, rightPole)
+
     # draw the fit line
     painter = QPainter()
     painter.begin(spindlePix)
@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# default memory budget and maximum number of frames to read ahead
+PREFETCH_BYTES = 128 * 1024 * 1024
+MAX_PREFETCH_DEPTH = 8
+
+# prepares the frames after the one on display in a background thread, so
+# stepping to the next frame doesn't have to wait for it
+# prepareFrame(frameIndex, params) does the work and returns a tuple of
+# arrays. params are the inputs it depends on (e.g. the threshold
+# settings); frames prepared with other params are never handed out
+class FramePrefetcher():
+
+    def __init__(self, prepareFrame, numFrames, memoryBytes=PREFETCH_BYTES,
+                 maxDepth=MAX_PREFETCH_DEPTH):
+
+        self._prepareFrame = prepareFrame
+        self.numFrames = numFrames
+        self.memoryBytes = memoryBytes
+        self.maxDepth = maxDepth
+
+        # read ahead in the direction the user is stepping, further the
+        # longer they keep stepping one frame at a time that way
+        self.direction = 1
+        self.depth = 1
+        self._lastFrame = None
+
+        # size of one prepared frame, known after the first one
+        self._frameBytes = None
+
+        # frameIndex -> (params, future)
+        self._jobs = {}
+        self._pool = ThreadPoolExecutor(1)
+
+    # called whenever frameIndex is put on display or params change
+    def update(self, frameIndex, params):
+        if self._lastFrame is not None and frameIndex != self._lastFrame:
+            step = 1 if frameIndex > self._lastFrame else -1
+            if (step == self.direction
+                    and abs(frameIndex - self._lastFrame) == 1):
+                self.depth = min(2 * self.depth, self.maxDepth)
+            else:
+                self.direction = step
+                self.depth = 1
+        self._lastFrame = frameIndex
+
+        depth = min(self.depth, self.budgetDepth())
+        wanted = [frameIndex + self.direction * k
+                  for k in range(1, depth + 1)
+                  if 0 <= frameIndex + self.direction * k < self.numFrames]
+
+        # drop frames that are no longer ahead or were made with old inputs
+        for f in list(self._jobs):
+            jobParams, future = self._jobs[f]
+            if f not in wanted or jobParams != params:
+                future.cancel()
+                del self._jobs[f]
+
+        for f in wanted:
+            if f not in self._jobs:
+                self._jobs[f] = (params, self._pool.submit(self._prepare, f,
+                                                           params))
+
+    # returns the prepared arrays for a frame and params, waiting for them
+    # if they are being prepared, or None if they were never requested
+    def take(self, frameIndex, params):
+        job = self._jobs.pop(frameIndex, None)
+        if job is None:
+            return None
+
+        jobParams, future = job
+        if jobParams != params:
+            future.cancel()
+            return None
+        if future.cancelled() or future.exception() is not None:
+            # the caller prepares the frame itself and sees any error
+            return None
+        return future.result()
+
+    # number of frames that fit in the memory budget
+    def budgetDepth(self):
+        if not self._frameBytes:
+            return 1
+        return max(1, self.memoryBytes // self._frameBytes)
+
+    # drops everything that was read ahead
+    def clear(self):
+        for params, future in self._jobs.values():
+            future.cancel()
+        self._jobs.clear()
+
+    def shutdown(self):
+        self.clear()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _prepare(self, frameIndex, params):
+        prepared = self._prepareFrame(frameIndex, params)
+        self._frameBytes = sum(arr.nbytes for arr in prepared)
+        return prepared
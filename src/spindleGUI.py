@@ -1,17 +1,45 @@
 import sys
+import sqlite3
 from PySide6.QtWidgets import (QApplication, QMainWindow, QPushButton, QLabel,
                                QSpinBox, QTableView, QWidget, QVBoxLayout,
                                QHBoxLayout, QGridLayout, QSizePolicy,
                                QFileDialog, QSplitter, QFrame, QSplitterHandle,
-                               QAbstractItemView)
+                               QAbstractItemView, QProgressBar, QDialog,
+                               QComboBox)
 from PySide6.QtGui import (QPixmap, QFont, QPainter, QBrush, QGradient,
-                           QTransform)
-from PySide6.QtCore import Qt, QDir, QAbstractTableModel, QEvent
+                           QTransform, QColor)
+from PySide6.QtCore import Qt, QDir, QAbstractTableModel, QEvent, Signal
 import tiffFunctions as tiffF
+import pixFunctions as pixF
 import threshFunctions as threshF
 import curveFitData as cFD
 import plotSpindle as pS
-from numpy import zeros
+import exportFunctions as exportF
+import jobScheduler as jobS
+import prefetchFunctions as prefetchF
+import sweepFunctions as sweepF
+import histogramFunctions as histF
+import stackAnalysis as stackA
+import instrumentFunctions as instrumentF
+import cacheFunctions as cacheF
+import pipelineFunctions as pipeF
+from numpy import zeros, arange, linspace, unique, isnan
+from os import environ, makedirs, path
+from time import perf_counter
+
+# where the per-frame profile records are written when the window closes
+# with instrumentation on (the environment variable overrides it, a name
+# ending in .csv writes CSV)
+PROFILE_VARIABLE = "SPINDLE_PROFILE_OUT"
+PROFILE_FILE = path.join(path.expanduser("~"), ".cache",
+                         "mitotic-spindle-tool", "gui-profile.json")
+
+# file dialog filters of the export formats, in exportF.EXPORT_FORMATS order
+EXPORT_FILTERS = ("Text (*.txt);;CSV (*.csv);;NumPy (*.npz);;HDF5 (*.h5);;"
+                  "Parquet (*.parquet)")
+
+# the stages of the frameGraph a frame read ahead is prepared up to
+PREPARED_STAGES = ("decode", "display", "threshold", "gol")
 
 # subclass QMainWindow to create a custom MainWindow
 class MainWindow(QMainWindow):
@@ -27,12 +55,51 @@ class MainWindow(QMainWindow):
         # Update the version for new releases
         versionNumber = "v1.0.1"
         
-        # keep track of the open file name
+        # keep track of the open file name and its frames
         self.fileName = None
+        self.tiffStack = None
+
+        # reads ahead of the frame on display (created for each file)
+        self.framePrefetcher = None
 
         # bad frames reported by the user
         self.tossedFrames = []
 
+        # the threshold inputs each added frame was measured with
+        self.frameParams = None
+
+        # analyses kept on disk across sessions, along with the frames the
+        # user added or tossed (None if the cache file can't be opened)
+        try:
+            self.resultCache = cacheF.openResultCache()
+        except (OSError, sqlite3.Error):
+            self.resultCache = None
+
+        # the stages of the analysis of a frame (plus the display image),
+        # shared by the threshold, preview and add buttons and the frames
+        # read ahead, so changing an input only reruns the stages after it.
+        # it keeps no more than the frames read ahead may take
+        self.frameGraph = pipeF.StageGraph(
+                pipeF.frameStages()
+                + (pipeF.Stage("display", pixF.normalizeArr, ("decode",),
+                               ("window",)),),
+                maxBytes=prefetchF.PREFETCH_BYTES)
+
+        # thresholds and previews are computed in the background
+        self.jobScheduler = jobS.JobScheduler()
+
+        # histograms of the open stack and the automatic threshold of each
+        # frame, computed when an automatic threshold is chosen
+        self.stackHistograms = None
+        self.autoThreshs = None
+
+        # parameter sweep panel, created the first time it is opened
+        self.sweepDialog = None
+
+        # the threshold inputs (see thresholdKey) of the threshold image
+        # on display, None while it is being computed
+        self.threshKey = None
+
         # record whether it is starting in light or dark mode
         self.isDarkMode = self.isComputerDarkMode()   
         
@@ -42,6 +109,13 @@ class MainWindow(QMainWindow):
         # create accessible widgets
         self.importLabel = QLabel("Single Z")
         self.tiffButton = QPushButton(".tiff")
+        self.displayLabel = QLabel("Display")
+        self.displayValue = QComboBox()
+        self.displayValue.addItems(("Min/Max", "Percentile"))
+        self.projectionLabel = QLabel("Z Projection")
+        self.projectionValue = QComboBox()
+        self.projectionValue.addItems(("Max", "Mean", "Best Focus"))
+        self.projectionValue.setEnabled(False)
 
         self.totalFrameLabel = QLabel("# of Frames")
         self.totalFrameValue = QLabel("0")
@@ -60,6 +134,11 @@ class MainWindow(QMainWindow):
         self.threshValue.setMaximum(65535)
         self.threshValue.setValue(1000)
 
+        self.autoThreshLabel = QLabel("Auto Threshold")
+        self.autoThreshValue = QComboBox()
+        self.autoThreshValue.addItems(("Manual", "Otsu", "Triangle",
+                                       "Percentile"))
+
         self.gOLIterationsLabel = QLabel("GOL Iterations")
         self.gOLIterationsValue = QSpinBox()
         self.gOLIterationsValue.setAlignment(Qt.AlignRight)
@@ -79,6 +158,7 @@ class MainWindow(QMainWindow):
         self.tossButton.setSizePolicy(QSizePolicy.Maximum,
                                            QSizePolicy.Maximum)
         self.exportButton = QPushButton("Export")
+        self.sweepButton = QPushButton("Sweep")
 
         self.dataTableView = QTableView()
         self.dataTableView.setSelectionMode(QAbstractItemView.NoSelection)
@@ -87,17 +167,17 @@ class MainWindow(QMainWindow):
         self.backShade = self.dataTableView.palette().base().color().value()
 
         imageLabel = QLabel("Source")
-        imageMap = QPixmap(tiffF.defaultPix(self.backShade))
+        imageMap = QPixmap(pixF.defaultPix(self.backShade))
         self.imagePixLabel = PixLabel()
         self.imagePixLabel.setPixmap(imageMap)
 
         thresholdImageLabel = QLabel("Threshold")
-        threshMap = QPixmap(tiffF.defaultPix(self.backShade))
+        threshMap = QPixmap(pixF.defaultPix(self.backShade))
         self.threshPixLabel = PixLabel()
         self.threshPixLabel.setPixmap(threshMap)
 
         previewImageLabel = QLabel("Preview")
-        previewMap = QPixmap(tiffF.defaultPix(self.backShade))
+        previewMap = QPixmap(pixF.defaultPix(self.backShade))
         self.previewPixLabel = PixLabel()
         self.previewPixLabel.setPixmap(previewMap)
 
@@ -159,6 +239,10 @@ class MainWindow(QMainWindow):
         tempVertical.addWidget(importTitle)
         tempGrid.addWidget(self.importLabel, 0, 0)
         tempGrid.addWidget(self.tiffButton, 0, 1)
+        tempGrid.addWidget(self.displayLabel, 1, 0)
+        tempGrid.addWidget(self.displayValue, 1, 1)
+        tempGrid.addWidget(self.projectionLabel, 2, 0)
+        tempGrid.addWidget(self.projectionValue, 2, 1)
         importWidget.setLayout(tempGrid)
         tempGrid = QGridLayout()
         tempVertical.addWidget(importWidget)
@@ -171,10 +255,12 @@ class MainWindow(QMainWindow):
         tempGrid.addWidget(self.frameValue, 1, 1)
         tempGrid.addWidget(self.threshLabel, 2, 0)
         tempGrid.addWidget(self.threshValue, 2, 1)
-        tempGrid.addWidget(self.gOLIterationsLabel, 3, 0)
-        tempGrid.addWidget(self.gOLIterationsValue, 3, 1)
-        tempGrid.addWidget(self.gOLFactorLabel, 4, 0)
-        tempGrid.addWidget(self.gOLFactorValue, 4, 1)
+        tempGrid.addWidget(self.autoThreshLabel, 3, 0)
+        tempGrid.addWidget(self.autoThreshValue, 3, 1)
+        tempGrid.addWidget(self.gOLIterationsLabel, 4, 0)
+        tempGrid.addWidget(self.gOLIterationsValue, 4, 1)
+        tempGrid.addWidget(self.gOLFactorLabel, 5, 0)
+        tempGrid.addWidget(self.gOLFactorValue, 5, 1)
         thresholdWidget.setLayout(tempGrid)
         tempGrid = QGridLayout()
         tempVertical.addWidget(thresholdWidget)
@@ -185,6 +271,7 @@ class MainWindow(QMainWindow):
         tempGrid.addWidget(self.previewButton, 0, 1)
         tempGrid.addWidget(self.tossButton, 1, 0)
         tempGrid.addWidget(self.exportButton, 1, 1)
+        tempGrid.addWidget(self.sweepButton, 2, 0)
         bottomLeftWidget.setLayout(tempGrid)
         tempVertical.addWidget(bottomLeftWidget)
         tempVertical.addStretch()
@@ -229,18 +316,42 @@ class MainWindow(QMainWindow):
 
         self.setCentralWidget(centralWidget)
 
+        # status bar with a busy indicator and the latest input-to-display
+        # latency of background jobs
+        self.busyBar = QProgressBar()
+        self.busyBar.setRange(0, 0)
+        self.busyBar.setMaximumWidth(80)
+        self.busyBar.setVisible(False)
+        self.latencyLabel = QLabel()
+        self.latencyLabel.setStyleSheet("color:#777777")
+
+        # time spent in each stage on the current frame, shown when
+        # instrumentation is on (see instrumentFunctions)
+        self.profileLabel = QLabel()
+        self.profileLabel.setStyleSheet("color:#777777")
+        self.profileLabel.setVisible(instrumentF.enabled)
+        self.statusBar().addWidget(self.profileLabel)
+        self.statusBar().addPermanentWidget(self.latencyLabel)
+        self.statusBar().addPermanentWidget(self.busyBar)
+
         # set fixed button sizes
         self.tiffButton.setFixedSize(defaultSize)
         self.previewButton.setFixedSize(defaultSize)
         self.addButton.setFixedSize(defaultSize)
         self.tossButton.setFixedSize(defaultSize)
         self.exportButton.setFixedSize(defaultSize)
+        self.sweepButton.setFixedSize(defaultSize)
         
         # connect signals to slots
         self.tiffButton.clicked.connect(self.onInputTiffClicked)
+        self.displayValue.currentIndexChanged.connect(self.onDisplayChanged)
+        self.projectionValue.currentIndexChanged.connect(
+                self.onProjectionChanged)
 
         self.frameValue.textChanged.connect(self.onFrameUpdate)
         self.threshValue.textChanged.connect(self.applyThreshold)
+        self.autoThreshValue.currentIndexChanged.connect(
+                self.onAutoThreshChanged)
         self.gOLIterationsValue.textChanged.connect(self.applyThreshold)
         self.gOLFactorValue.textChanged.connect(self.applyThreshold)
 
@@ -248,6 +359,11 @@ class MainWindow(QMainWindow):
         self.addButton.clicked.connect(self.onAddDataClicked)
         self.tossButton.clicked.connect(self.onTossDataClicked)
         self.exportButton.clicked.connect(self.onExportDataClicked)
+        self.sweepButton.clicked.connect(self.onSweepClicked)
+
+        self.jobScheduler.jobFinished.connect(self.onJobFinished)
+        self.jobScheduler.jobFailed.connect(self.onJobFailed)
+        self.jobScheduler.busyChanged.connect(self.busyBar.setVisible)
 
         # center window on the desktop
         def centerApplication(xSize, ySize):
@@ -269,39 +385,92 @@ class MainWindow(QMainWindow):
         
         # if the user selected a file successfully
         if fileName:
-            self.fileName = fileName
-            self.clearThreshAndPreview()
-            self.frameValue.setValue(1)
-            self.onFrameUpdate()
-            numFrames = tiffF.framesInTiff(self.fileName)
-            self.frameValue.setMaximum(numFrames)
-            self.totalFrameValue.setText(str(numFrames))
-            
-            # create the data array and place it in the QTableView
-            self.dataTableArray = zeros((numFrames, len(cFD.DATA_NAMES)))
-            self.dataTableModel = (
-                    ImageTableModel(cFD.DATA_NAMES, self.dataTableArray))
-            self.dataTableView.setModel(self.dataTableModel)
-            self.dataTableView.resizeColumnsToContents()
-
-            # reset the tossed frames for the new image
-            self.tossedFrames = []
-
-            # reset input values
-            self.frameValue.setValue(1)
-            self.threshValue.setValue(1000)
-            self.gOLIterationsValue.setValue(1)
-            self.gOLFactorValue.setValue(4)
+            self.openStack(fileName)
+
+    # opens a stack (or the open one again with another Z projection),
+    # starting over with an empty data table
+    def openStack(self, fileName):
+        # nothing may read the old stack once it is closed
+        self.jobScheduler.cancel("histogram")
+        self.jobScheduler.cancel("restore")
+        if self.framePrefetcher:
+            self.framePrefetcher.shutdown()
+        if self.fileName and self.fileName != fileName:
+            tiffF.closeTiffStack(self.fileName)
+        self.fileName = fileName
+        self.tiffStack = tiffF.openTiffStack(fileName, self.projection())
+        self.showDimensions()
+        self.frameGraph.clear()
+        self.stackHistograms = None
+        self.autoThreshs = None
+        self.framePrefetcher = prefetchF.FramePrefetcher(
+                prepareFrameFunc(self.frameGraph, self.tiffStack),
+                self.tiffStack.numFrames)
+        self.clearThreshAndPreview()
+        self.frameValue.setValue(1)
+        self.onFrameUpdate()
+        numFrames = self.tiffStack.numFrames
+        self.frameValue.setMaximum(numFrames)
+        self.totalFrameValue.setText(str(numFrames))
+
+        # create the data array and place it in the QTableView
+        self.dataTableArray = zeros((numFrames, len(cFD.DATA_NAMES)))
+        self.dataTableModel = (
+                ImageTableModel(cFD.DATA_NAMES, self.dataTableArray))
+        self.dataTableView.setModel(self.dataTableModel)
+        self.dataTableView.resizeColumnsToContents()
+
+        # reset the tossed frames for the new image
+        self.tossedFrames = []
+        self.frameParams = exportF.emptyFrameParams(numFrames)
+
+        # reset input values
+        self.frameValue.setValue(1)
+        self.threshValue.setValue(1000)
+        self.gOLIterationsValue.setValue(1)
+        self.gOLFactorValue.setValue(4)
+
+        # find the automatic thresholds of the new stack
+        self.onAutoThreshChanged()
+
+        # bring back the frames added or tossed when the stack was
+        # last open
+        if self.resultCache is not None:
+            self.jobScheduler.submit("restore", restoreJob,
+                                     self.resultCache, self.tiffStack,
+                                     stoppable=True)
 
     # handle update of the frame number scroller
     def onFrameUpdate(self):
         self.clearThreshAndPreview()
-
-        self.imagePixLabel.setPixmap(
-                tiffF.pixFromTiff(self.fileName, self.frameValue.value() - 1))
-        self.imagePixLabel.setImageArr(
-                tiffF.arrFromTiff(self.fileName, self.frameValue.value() - 1))
-        self.applyThreshold(cleared=True)
+        self.showAutoThreshold()
+
+        # use the frame prepared in the background if there is one
+        key = self.thresholdKey()
+        frameIndex = key[1]
+        prepared = self.framePrefetcher.take(frameIndex,
+                                             self.prefetchParams())
+        params = self.stageParams(key)
+        if prepared is None:
+            with instrumentF.frame(self.fileName, frameIndex):
+                arr = self.frameGraph.output("decode", params)
+                displayArr = self.frameGraph.output("display", params)
+        else:
+            # the graph keeps the frame only now it is on display
+            for name, output in zip(PREPARED_STAGES, prepared):
+                self.frameGraph.store(name, params, output)
+            arr, displayArr, _, threshArr = prepared
+
+        # the display array is already normalized
+        self.imagePixLabel.setPixmap(pixF.threshPixFromArr(displayArr))
+        self.imagePixLabel.setImageArr(arr)
+
+        if prepared is None:
+            self.applyThreshold(cleared=True)
+        else:
+            self.jobScheduler.cancel("threshold")
+            self.showThreshold(key, threshArr)
+            self.framePrefetcher.update(frameIndex, self.prefetchParams())
 
     # handle applying the threshold
     def applyThreshold(self, text="", cleared=False):
@@ -309,39 +478,199 @@ class MainWindow(QMainWindow):
             self.clearThreshAndPreview()
 
         if self.fileName:
-            arr = threshF.applyThreshToArr(self.imagePixLabel.imageArr,
-                                            self.threshValue.value(),
-                                            self.gOLIterationsValue.value(),
-                                            self.gOLFactorValue.value())
-            self.threshPixLabel.setPixmap(tiffF.threshPixFromArr(arr))
-            self.threshPixLabel.setImageArr(arr)
-    
+            key = self.thresholdKey()
+            self.jobScheduler.submit("threshold", thresholdJob,
+                                     self.frameGraph, key,
+                                     self.stageParams(key))
+
+            # read ahead with the new inputs
+            self.framePrefetcher.update(key[1], self.prefetchParams())
+
+    # the display window of the source image (one of pixF.WINDOW_MODES)
+    def displayWindow(self):
+        return pixF.WINDOW_MODES[self.displayValue.currentIndex()]
+
+    # redraw the source image with the chosen display window
+    def onDisplayChanged(self):
+        if self.fileName:
+            frameIndex = self.frameValue.value() - 1
+            with instrumentF.frame(self.fileName, frameIndex):
+                self.imagePixLabel.setPixmap(pixF.pixFromArr(
+                        self.imagePixLabel.imageArr, self.displayWindow()))
+            self.framePrefetcher.update(frameIndex, self.prefetchParams())
+
+    # the Z projection chosen for hyperstacks (one of tiffF.PROJECTIONS)
+    def projection(self):
+        return tiffF.PROJECTIONS[self.projectionValue.currentIndex()]
+
+    # shows whether the open stack has Z slices, which can only be
+    # projected differently if it does
+    def showDimensions(self):
+        dimensions = self.tiffStack.dimensions
+        if self.tiffStack.isHyperstack():
+            self.importLabel.setText(F"{dimensions.sizeZ} Z")
+        else:
+            self.importLabel.setText("Single Z")
+        self.projectionValue.setEnabled(self.tiffStack.isHyperstack())
+
+    # measure the open hyperstack with another Z projection (the frames
+    # change, so the data table starts over)
+    def onProjectionChanged(self):
+        if self.fileName and self.tiffStack.isHyperstack():
+            self.openStack(self.fileName)
+
+    # the automatic threshold method chosen (one of histF.THRESH_METHODS),
+    # or None for a manual threshold
+    def autoThreshMethod(self):
+        index = self.autoThreshValue.currentIndex()
+        if index <= 0:
+            return None
+        return histF.THRESH_METHODS[index - 1]
+
+    # handle a change of the automatic threshold method
+    def onAutoThreshChanged(self):
+        method = self.autoThreshMethod()
+
+        # the threshold is only typed in for manual thresholds
+        self.threshValue.setEnabled(method is None)
+        self.autoThreshs = None
+        if method is None or not self.fileName:
+            return
+
+        # the histograms are read once per stack, in the background
+        if self.stackHistograms is None:
+            self.jobScheduler.submit("histogram", histogramJob,
+                                     self.fileName)
+            return
+
+        self.autoThreshs = tuple(int(t) for t in
+                                 self.stackHistograms.thresholds(method))
+        if self.showAutoThreshold():
+            self.applyThreshold()
+
+    # puts the current frame's automatic threshold in the threshold box
+    # (without thresholding), returning whether it changed
+    def showAutoThreshold(self):
+        if self.autoThreshMethod() is None or self.autoThreshs is None:
+            return False
+
+        thresh = self.autoThreshs[self.frameValue.value() - 1]
+        if thresh == self.threshValue.value():
+            return False
+        self.threshValue.blockSignals(True)
+        self.threshValue.setValue(thresh)
+        self.threshValue.blockSignals(False)
+        return True
+
+    # the inputs frames are read ahead with: the threshold (or the
+    # automatic threshold of every frame), GOL iterations, GOL factor and
+    # display window
+    def prefetchParams(self):
+        thresh = self.threshValue.value()
+        if self.autoThreshMethod() is not None and self.autoThreshs:
+            thresh = self.autoThreshs
+        return (thresh, self.gOLIterationsValue.value(),
+                self.gOLFactorValue.value(), self.displayWindow())
+
+    # display a threshold image computed for the given threshold inputs
+    def showThreshold(self, key, threshArr):
+        self.threshKey = key
+        self.threshPixLabel.setPixmap(pixF.threshPixFromArr(threshArr))
+        self.threshPixLabel.setImageArr(threshArr)
+
+    # the threshold inputs, which identify the threshold of a frame
+    def thresholdKey(self):
+        return (self.fileName, self.frameValue.value() - 1,
+                self.threshValue.value(), self.gOLIterationsValue.value(),
+                self.gOLFactorValue.value())
+
+    # the analysis inputs of the frameGraph (see pipeF.stageParams) for
+    # threshold inputs
+    def stageParams(self, key):
+        return pipeF.stageParams(self.tiffStack, *key[1:],
+                                 window=self.displayWindow())
+
+    # returns the analysis of the current frame with the current inputs,
+    # which is only computed the first time it is needed (only the stages
+    # whose inputs changed since are rerun)
+    def currentAnalysis(self):
+        return pipeF.frameAnalysis(self.frameGraph,
+                                   self.stageParams(self.thresholdKey()),
+                                   self.resultCache)
+
     # handle the preview button press
     def onPreviewClicked(self):
         if self.fileName:
-            spindlePlotData, doesSpindleExist = (
-                    cFD.spindlePlot(self.imagePixLabel.imageArr, 
-                                    self.threshPixLabel.imageArr))
-            self.previewPixLabel.setPixmap(pS.plotSpindle(spindlePlotData,
-                                                          doesSpindleExist))
-            self.isPreviewCleared = False
+            key = self.thresholdKey()
+            params = self.stageParams(key)
+
+            # a preview drawn before with the same inputs is shown at once
+            if self.frameGraph.isCached("render", params):
+                self.showPreview(key, self.frameGraph.output("render",
+                                                             params))
+                return
+            self.jobScheduler.submit("preview", previewJob,
+                                     self.frameGraph, self.resultCache, key,
+                                     params)
+
+    # draw the plot of a preview (the output of the render stage)
+    def showPreview(self, key, rendered):
+        spindlePlotData, doesSpindleExist = rendered
+        with instrumentF.frame(*key[:2]):
+            self.previewPixLabel.setPixmap(pS.plotSpindle(
+                    spindlePlotData, doesSpindleExist))
+        self.isPreviewCleared = False
+
+    # show the results of background jobs that are still current
+    def onJobFinished(self, kind, result, submitted):
+        key, output = result
+        if kind == "histogram":
+            if key == self.fileName:
+                self.stackHistograms = output
+                self.onAutoThreshChanged()
+            return
+        if kind == "restore":
+            if key == self.fileName:
+                self.restoreFrames(output)
+            return
+
+        if key != self.thresholdKey():
+            return
+
+        if kind == "threshold":
+            self.showThreshold(key, output)
+        elif kind == "preview":
+            self.showPreview(key, output)
+
+        latency = 1000 * (perf_counter() - submitted)
+        self.latencyLabel.setText(F"{kind.capitalize()}: {latency:.0f} ms")
+        if instrumentF.enabled:
+            self.profileLabel.setText(
+                    instrumentF.summaryText(instrumentF.frameStages(
+                            *key[:2]))
+                    + "  |  hits " + pipeF.countsText(self.frameGraph))
+
+    # report background jobs that raised an error
+    def onJobFailed(self, kind, error):
+        self.statusBar().showMessage(F"{kind.capitalize()} failed: {error}",
+                                     5000)
     
     # handle the add data button press
     def onAddDataClicked(self):
 
         if self.fileName:
-            data, doesSpindleExist = (cFD.spindleMeasurements(
-                                            self.imagePixLabel.imageArr,
-                                            self.threshPixLabel.imageArr))
+            analysis = self.currentAnalysis()
+            data = analysis.data
+            doesSpindleExist = analysis.doesSpindleExist
 
             if doesSpindleExist:
-                # add the row of data to the data table
-                self.dataTableModel.beginResetModel()
+                # add the row of data to the data table (only that row of
+                # the table view is redrawn)
                 frameIndex = self.frameValue.value() - 1
-                for i in range(len(data)):
-                    self.dataTableArray[frameIndex, i] = data[i]
-                # update the table view
-                self.dataTableModel.endResetModel()
+                self.dataTableModel.setRow(frameIndex, data)
+                self.frameParams[frameIndex] = self.thresholdKey()[2:]
+                self.recordFrame(frameIndex, params=cacheF.resultParams(
+                        *self.thresholdKey()[2:]))
 
                 indexOfData = self.dataTableModel.createIndex(frameIndex, 0)
                 self.dataTableView.scrollTo(indexOfData)
@@ -355,11 +684,13 @@ class MainWindow(QMainWindow):
             self.tossedFrames.append(tossedFrame)
             self.tossedFrames.sort()
             self.dataTableModel.addTossedRow(tossedFrame)
+            self.recordFrame(tossedFrame - 1, tossed=True)
             self.onAddDataClicked() # this follows previous lab standard
         elif (tossedFrame in self.tossedFrames and self.fileName):
             # "un-tosses" the frame
             self.tossedFrames.remove(tossedFrame)
             self.dataTableModel.removeTossedRow(tossedFrame)
+            self.recordFrame(tossedFrame - 1, tossed=False)
             self.onAddDataClicked()
 
         if self.fileName:
@@ -368,6 +699,47 @@ class MainWindow(QMainWindow):
             indexOfData = self.dataTableModel.createIndex(tossedFrame - 1, 0)
             self.dataTableView.scrollTo(indexOfData)
     
+    # remembers in the result cache that the frame on display was added
+    # with params or was tossed (or un-tossed)
+    def recordFrame(self, frameIndex, params=None, tossed=None):
+        if self.resultCache is None:
+            return
+        frameHash = cacheF.frameHash(self.imagePixLabel.imageArr)
+        try:
+            stack = cacheF.stackIdentity(self.tiffStack)
+            if params is not None:
+                self.resultCache.recordAdded(stack, frameIndex, frameHash,
+                                             params)
+            if tossed is not None:
+                self.resultCache.recordTossed(stack, frameIndex, frameHash,
+                                              tossed)
+        except (OSError, sqlite3.Error) as e:
+            self.statusBar().showMessage(F"Cache failed: {e}", 5000)
+
+    # fills the data table with the frames a restoreJob found, leaving
+    # those the user added or tossed since the stack was opened
+    def restoreFrames(self, restored):
+        dataRows = []
+        dataFrames = []
+        tossedFrames = []
+        for frameIndex, data, params, tossed in restored:
+            if data is not None and isnan(self.frameParams[frameIndex, 0]):
+                dataRows.append(data)
+                dataFrames.append(frameIndex)
+                self.frameParams[frameIndex] = params[:3]
+            if tossed and frameIndex + 1 not in self.tossedFrames:
+                tossedFrames.append(frameIndex + 1)
+
+        # the table is filled in one go
+        self.dataTableModel.setRows(dataFrames, dataRows)
+        self.dataTableModel.addTossedRows(tossedFrames)
+        self.tossedFrames = sorted(self.tossedFrames + tossedFrames)
+        restoredFrames = set(dataFrames).union(f - 1 for f in tossedFrames)
+        if restoredFrames:
+            self.statusBar().showMessage(
+                    F"Restored {len(restoredFrames)} frames from the cache",
+                    5000)
+
     # write the data to a textfile
     def onExportDataClicked(self):
         if self.fileName:
@@ -375,33 +747,68 @@ class MainWindow(QMainWindow):
             # prompt the user for the save location and file name
             fileName, filter = QFileDialog.getSaveFileName(
                     parent=self, caption='Export Image Data',
-                    dir=QDir.homePath(), filter="*.txt")
+                    dir=QDir.homePath(), filter=EXPORT_FILTERS)
             if not fileName:
                 return None # cancel the export
-            
-            with open(fileName, "w", encoding="utf-8") as f:
-
-                for column in range(self.dataTableArray.shape[1]):
-                    f.write(F"{cFD.DATA_NAMES[column]}\n")
-
-                    for row in range(self.dataTableArray.shape[0]):
-                        f.write(F"{self.dataTableArray[row, column]:.4f}\n")
-                
-                f.write("Bad Frames\n")
-                for frame in self.tossedFrames:
-                    f.write(F"{frame}\n")
+
+            # a name without a known extension is saved in the chosen
+            # filter's format
+            fileFormat = exportF.EXTENSION_FORMATS.get(
+                    path.splitext(fileName)[1].lower())
+            if fileFormat is None:
+                filters = EXPORT_FILTERS.split(";;")
+                fileFormat = exportF.EXPORT_FORMATS[
+                        filters.index(filter) if filter in filters else 0]
+                fileName += exportF.EXPORT_EXTENSIONS[fileFormat]
+
+            settings = {"autoThreshold": self.autoThreshMethod()}
+            if self.tiffStack.isHyperstack():
+                settings["projection"] = self.tiffStack.projection
+            metadata = exportF.runMetadata(
+                    self.fileName, golMode=threshF.GOL_LEGACY,
+                    rotationMode=cFD.ROTATE_RESAMPLE, **settings)
+            try:
+                exportF.writeData(fileName, self.dataTableArray,
+                                  self.tossedFrames, self.frameParams,
+                                  metadata, fileFormat)
+            except (ImportError, OSError) as e:
+                self.statusBar().showMessage(F"Export failed: {e}", 5000)
     
+    # open the parameter sweep panel for the current frame and inputs
+    def onSweepClicked(self):
+        if self.fileName:
+            if self.sweepDialog is None:
+                self.sweepDialog = SweepDialog(self)
+                self.sweepDialog.settingsChosen.connect(
+                        self.onSweepSettingsChosen)
+            self.sweepDialog.setStack(self.tiffStack,
+                                      self.frameValue.value() - 1,
+                                      self.threshValue.value(),
+                                      self.gOLIterationsValue.value(),
+                                      self.gOLFactorValue.value())
+            self.sweepDialog.show()
+            self.sweepDialog.raise_()
+
+    # use the threshold inputs picked in the sweep panel
+    def onSweepSettingsChosen(self, thresh, gOLI, gOLF):
+        self.autoThreshValue.setCurrentIndex(0)
+        self.threshValue.setValue(thresh)
+        self.gOLIterationsValue.setValue(gOLI)
+        self.gOLFactorValue.setValue(gOLF)
+
     # slot called anytime the inputs are modified
     def clearThreshAndPreview(self):
         if self.fileName:
-            self.threshPixLabel.setPixmap(tiffF.defaultPix(self.backShade))
-            self.previewPixLabel.setPixmap(tiffF.defaultPix(self.backShade))
+            self.jobScheduler.cancel("preview")
+            self.threshKey = None
+            self.threshPixLabel.setPixmap(pixF.defaultPix(self.backShade))
+            self.previewPixLabel.setPixmap(pixF.defaultPix(self.backShade))
             self.isPreviewCleared = True
 
     # changes default pixmap color when computer switches color mode
     def changeDefaultPixmaps(self):
         self.backShade = QTableView().palette().base().color().value()
-        newPix = tiffF.defaultPix(self.backShade)
+        newPix = pixF.defaultPix(self.backShade)
         if self.fileName and self.isPreviewCleared:
             # image and thresh have images but not preview
             self.previewPixLabel.setPixmap(newPix)
@@ -417,6 +824,17 @@ class MainWindow(QMainWindow):
         return (aLabel.palette().color(aLabel.backgroundRole()).black() 
               > aLabel.palette().color(aLabel.foregroundRole()).black())
 
+    # stop the background jobs with the window
+    def closeEvent(self, event):
+        self.jobScheduler.shutdown()
+        if instrumentF.enabled:
+            writeProfile()
+        if self.sweepDialog:
+            self.sweepDialog.close()
+        if self.framePrefetcher:
+            self.framePrefetcher.shutdown()
+        super().closeEvent(event)
+
     # detects when the computer switches to dark or light mode
     def changeEvent(self, event):
         if event.type() == QEvent.ThemeChange:
@@ -426,6 +844,94 @@ class MainWindow(QMainWindow):
                 self.changeDefaultPixmaps()
         super().changeEvent(event)
         
+# writes the instrumentation records of the session (see PROFILE_FILE)
+def writeProfile():
+    fileName = environ.get(PROFILE_VARIABLE, PROFILE_FILE)
+    try:
+        makedirs(path.dirname(path.abspath(fileName)), exist_ok=True)
+        instrumentF.writeRecords(fileName)
+    except OSError:
+        pass
+
+# background job: thresholds a frame through the stages of a
+# pipeF.StageGraph, returning (key, threshold array)
+def thresholdJob(frameGraph, key, params):
+    with instrumentF.frame(*key[:2]):
+        return key, frameGraph.output("gol", params)
+
+# background job: analyzes a frame for the preview, returning (key, the
+# output of the render stage). only the stages whose inputs changed since
+# the frame was last analyzed are run
+def previewJob(frameGraph, resultCache, key, params):
+    with instrumentF.frame(*key[:2]):
+        pipeF.frameAnalysis(frameGraph, params, resultCache)
+        return key, frameGraph.output("render", params)
+
+# background job: looks up what the result cache recorded about the frames
+# of a stack, returning (file name, [(frameIndex, data or None, params,
+# tossed)]). data is None for frames that were only tossed or whose
+# analysis has since been evicted. only the recorded frames are read (past
+# the stack's cache), to check they haven't changed, and it stops early
+# when isStopped() says the job was cancelled
+def restoreJob(resultCache, tiffStack, isStopped):
+    restored = []
+    for frameIndex, frameHash, params, tossed in resultCache.recordedFrames(
+            cacheF.stackIdentity(tiffStack)):
+        if isStopped():
+            return tiffStack.fileName, []
+        if frameIndex >= tiffStack.numFrames:
+            continue
+        arr = tiffStack.frame(frameIndex, useCache=False)
+        if cacheF.frameHash(arr) != frameHash:
+            continue
+
+        data = None
+        if params is not None:
+            analysis = resultCache.analysis(frameHash, params)
+            if analysis is not None and analysis.doesSpindleExist:
+                data = analysis.data
+        if data is not None or tossed:
+            restored.append((frameIndex, data, params, tossed))
+    return tiffStack.fileName, restored
+
+# background job: reads the histograms of every frame of a stack,
+# returning (file name, histF.StackHistograms)
+def histogramJob(fileName):
+    return fileName, histF.stackHistograms(fileName)
+
+# returns a function that prepares a frame of a stack in the background:
+# prepareFrame(frameIndex, (thresh, gOLI, gOLF, window)) returns the
+# outputs of the PREPARED_STAGES of frameGraph for it: the frame, its
+# normalized display array, its threshold mask and its threshold after
+# GOL. thresh is one threshold or one per frame (see stackA.frameThresh).
+# frameGraph doesn't keep them, the prefetcher does (within its memory
+# budget) until the frame is on display
+def prepareFrameFunc(frameGraph, tiffStack):
+    def prepareFrame(frameIndex, params):
+        thresh, gOLI, gOLF, window = params
+        stageParams = pipeF.stageParams(tiffStack, frameIndex,
+                                        stackA.frameThresh(thresh,
+                                                           frameIndex),
+                                        gOLI, gOLF, window=window)
+        with instrumentF.frame(tiffStack.fileName, frameIndex):
+            return tuple(frameGraph.output(name, stageParams, keep=False)
+                         for name in PREPARED_STAGES)
+    return prepareFrame
+
+# background job: sweeps the threshold inputs over frames of a stack,
+# returning a sweepF.SweepResult
+def sweepJob(tiffStack, frameIndices, thresholds, iterations, factors):
+    imageArrs = [tiffStack.frame(f) for f in frameIndices]
+    return sweepF.sweepFrames(imageArrs, thresholds, iterations, factors)
+
+# returns numSamples frame indices spread evenly over a stack, or just the
+# current frame for one sample
+def sampleFrameIndices(numFrames, currentFrame, numSamples):
+    if numSamples <= 1:
+        return [currentFrame]
+    return [int(f) for f in unique(linspace(0, numFrames - 1, numSamples)
+                                   .round())]
+
 # QLabel for keeping the contained pixmap scaled correctly
 class PixLabel(QLabel):
 
@@ -508,31 +1014,77 @@ class GradientSplitterHandle(QSplitterHandle):
         painter.end()
 
 # BOILERPLATE TABLE MODEL
+# the data table of a stack, one row per frame. rows are changed through
+# setRow and setRows so the view only redraws those rows, and the text of
+# a row is formatted once, the first time it is shown after it changed
 class ImageTableModel(QAbstractTableModel):
     def __init__(self, dataNames, data):
         super().__init__()
 
         self._dataNames = dataNames
         self._data = data
-        self._tossedRows = []
+
+        # frame numbers (from 1) of the tossed rows
+        self._tossedRows = set()
+
+        # row -> the text of each of its cells
+        self._rowTexts = {}
+
+        self._alignment = Qt.AlignVCenter + Qt.AlignRight
+        self._tossedBrush = QBrush(Qt.darkGray)
+
+    # replaces the data of a row (a frame index)
+    def setRow(self, row, values):
+        self._data[row] = values
+        self._rowTexts.pop(row, None)
+        self.rowsChanged(row, row)
+
+    # replaces the data of many rows at once (e.g. a whole stack measured
+    # at once), redrawing the rows they span once
+    def setRows(self, rows, values):
+        rows = list(rows)
+        if not rows:
+            return
+        self._data[rows] = values
+        for row in rows:
+            self._rowTexts.pop(row, None)
+        self.rowsChanged(min(rows), max(rows))
 
     def addTossedRow(self, row):
-        self._tossedRows.append(row)
-    
+        self.addTossedRows([row])
+
     def removeTossedRow(self, row):
-        self._tossedRows.remove(row)
+        self._tossedRows.discard(row)
+        self.rowsChanged(row - 1, row - 1, [Qt.BackgroundRole])
+
+    # marks frame numbers (from 1) as tossed
+    def addTossedRows(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        self._tossedRows.update(rows)
+        self.rowsChanged(min(rows) - 1, max(rows) - 1, [Qt.BackgroundRole])
+
+    # tells the view to redraw rows first to last (the roles given, or all)
+    def rowsChanged(self, first, last, roles=()):
+        self.dataChanged.emit(self.index(first, 0),
+                              self.index(last, self._data.shape[1] - 1),
+                              list(roles))
 
     def data(self, index, role):
         if role == Qt.DisplayRole:
-            if self._data[index.row(), index.column()] == 0.0:
-                return ""
-            else:
-                return "%.4f" % self._data[index.row(), index.column()]
+            row = index.row()
+            texts = self._rowTexts.get(row)
+            if texts is None:
+                texts = ["" if value == 0.0 else "%.4f" % value
+                         for value in self._data[row].tolist()]
+                self._rowTexts[row] = texts
+            return texts[index.column()]
         if role == Qt.TextAlignmentRole:
-            return Qt.AlignVCenter + Qt.AlignRight
+            return self._alignment
         if role == Qt.BackgroundRole:
             if (index.row() + 1) in self._tossedRows:
-                return QBrush(Qt.darkGray)
+                return self._tossedBrush
     
     def rowCount(self, index):
         return self._data.shape[0]
@@ -549,8 +1101,220 @@ class ImageTableModel(QAbstractTableModel):
             if orientation == Qt.Vertical:
                 return str(section + 1)
 
+# panel that measures a frame (or a sample of frames) with a grid of
+# thresholds, GOL iterations and GOL factors, and shows one of the
+# measurements or the number of objects as a heat map of thresholds by
+# GOL factors. clicking a cell picks its inputs for the main window
+class SweepDialog(QDialog):
+
+    # threshold, GOL iterations and GOL factor of the clicked cell
+    settingsChosen = Signal(int, int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Parameter Sweep")
+
+        self.tiffStack = None
+        self.frameIndex = 0
+        self.result = None
+
+        # sweeps run in their own worker so they don't hold up the
+        # threshold and preview jobs
+        self.jobScheduler = jobS.JobScheduler(1)
+
+        self.threshFromValue = self.spinBox(0, 65535, 50)
+        self.threshToValue = self.spinBox(0, 65535, 50)
+        self.threshStepValue = self.spinBox(1, 65535, 50)
+        self.gOLIFromValue = self.spinBox(1, 5)
+        self.gOLIToValue = self.spinBox(1, 5)
+        self.gOLFFromValue = self.spinBox(0, 8)
+        self.gOLFToValue = self.spinBox(0, 8)
+        self.framesValue = self.spinBox(1, 1)
+        self.runButton = QPushButton("Run")
+
+        self.metricValue = QComboBox()
+        self.metricValue.addItems(("Object Count",) + cFD.DATA_NAMES)
+        self.gOLIValue = QComboBox()
+
+        self.sweepTableView = QTableView()
+        self.sweepTableView.setSelectionMode(QAbstractItemView.NoSelection)
+        self.statusLabel = QLabel("Click a cell to use its inputs")
+        self.statusLabel.setStyleSheet("color:#777777")
+
+        tempGrid = QGridLayout()
+        tempGrid.addWidget(QLabel("Threshold"), 0, 0)
+        tempGrid.addWidget(self.threshFromValue, 0, 1)
+        tempGrid.addWidget(self.threshToValue, 0, 2)
+        tempGrid.addWidget(QLabel("Step"), 0, 3, Qt.AlignRight)
+        tempGrid.addWidget(self.threshStepValue, 0, 4)
+        tempGrid.addWidget(QLabel("GOL Iterations"), 1, 0)
+        tempGrid.addWidget(self.gOLIFromValue, 1, 1)
+        tempGrid.addWidget(self.gOLIToValue, 1, 2)
+        tempGrid.addWidget(QLabel("GOL Factor"), 2, 0)
+        tempGrid.addWidget(self.gOLFFromValue, 2, 1)
+        tempGrid.addWidget(self.gOLFToValue, 2, 2)
+        tempGrid.addWidget(QLabel("Frames"), 3, 0)
+        tempGrid.addWidget(self.framesValue, 3, 1)
+        tempGrid.addWidget(self.runButton, 3, 4)
+        tempGrid.addWidget(QLabel("Show"), 4, 0)
+        tempGrid.addWidget(self.metricValue, 4, 1, 1, 2)
+        tempGrid.addWidget(QLabel("at GOL Iterations"), 4, 3, Qt.AlignRight)
+        tempGrid.addWidget(self.gOLIValue, 4, 4)
+
+        tempVertical = QVBoxLayout()
+        tempVertical.addLayout(tempGrid)
+        tempVertical.addWidget(self.sweepTableView, stretch=1)
+        tempVertical.addWidget(self.statusLabel)
+        self.setLayout(tempVertical)
+        self.resize(520, 420)
+
+        self.runButton.clicked.connect(self.onRunClicked)
+        self.metricValue.currentIndexChanged.connect(self.showResult)
+        self.gOLIValue.currentIndexChanged.connect(self.showResult)
+        self.sweepTableView.clicked.connect(self.onCellClicked)
+        self.jobScheduler.jobFinished.connect(self.onJobFinished)
+        self.jobScheduler.jobFailed.connect(self.onJobFailed)
+
+    # a right aligned spin box
+    def spinBox(self, minimum, maximum, step=1):
+        box = QSpinBox()
+        box.setAlignment(Qt.AlignRight)
+        box.setRange(minimum, maximum)
+        box.setSingleStep(step)
+        return box
+
+    # sweep the given stack, with ranges around the current inputs
+    def setStack(self, tiffStack, frameIndex, thresh, gOLI, gOLF):
+        if tiffStack is not self.tiffStack:
+            self.jobScheduler.cancel("sweep")
+            self.result = None
+            self.showResult()
+            self.threshFromValue.setValue(max(thresh - 500, 0))
+            self.threshToValue.setValue(thresh + 500)
+            self.threshStepValue.setValue(100)
+            self.gOLIFromValue.setValue(1)
+            self.gOLIToValue.setValue(gOLI)
+            self.gOLFFromValue.setValue(max(gOLF - 2, 0))
+            self.gOLFToValue.setValue(min(gOLF + 2, 8))
+            self.framesValue.setValue(1)
+        self.tiffStack = tiffStack
+        self.frameIndex = frameIndex
+        self.framesValue.setMaximum(tiffStack.numFrames)
+
+    # handle the run button press
+    def onRunClicked(self):
+        thresholds = arange(self.threshFromValue.value(),
+                            self.threshToValue.value() + 1,
+                            self.threshStepValue.value())
+        iterations = arange(self.gOLIFromValue.value(),
+                            self.gOLIToValue.value() + 1)
+        factors = arange(self.gOLFFromValue.value(),
+                         self.gOLFToValue.value() + 1)
+        if not (len(thresholds) and len(iterations) and len(factors)):
+            self.statusLabel.setText("Each range needs a from <= to")
+            return
+
+        frameIndices = sampleFrameIndices(self.tiffStack.numFrames,
+                                          self.frameIndex,
+                                          self.framesValue.value())
+        self.statusLabel.setText(
+                F"Measuring {len(frameIndices)} frame(s) x "
+                F"{len(thresholds) * len(iterations) * len(factors)} "
+                F"settings...")
+        self.jobScheduler.submit("sweep", sweepJob, self.tiffStack,
+                                 frameIndices, thresholds, iterations,
+                                 factors)
+
+    def onJobFinished(self, kind, result, submitted):
+        self.result = result
+        currentIteration = self.gOLIValue.currentText()
+        self.gOLIValue.blockSignals(True)
+        self.gOLIValue.clear()
+        self.gOLIValue.addItems([str(it) for it in result.iterations])
+        self.gOLIValue.setCurrentIndex(max(
+                self.gOLIValue.findText(currentIteration), 0))
+        self.gOLIValue.blockSignals(False)
+        self.showResult()
+
+        seconds = perf_counter() - submitted
+        self.statusLabel.setText(F"Done in {seconds:.1f} s. Click a cell to "
+                                 F"use its inputs")
+
+    def onJobFailed(self, kind, error):
+        self.statusLabel.setText(F"Sweep failed: {error}")
+
+    # show the chosen value at the chosen GOL iterations as a heat map
+    def showResult(self):
+        if self.result is None:
+            self.sweepTableView.setModel(None)
+            return
+
+        grid = sweepF.sweepGrid(self.result, self.metricValue.currentIndex()
+                                - 1)
+        self.sweepTableModel = SweepTableModel(
+                grid[:, max(self.gOLIValue.currentIndex(), 0), :],
+                self.result.thresholds, self.result.factors)
+        self.sweepTableView.setModel(self.sweepTableModel)
+        self.sweepTableView.resizeColumnsToContents()
+
+    # pick the inputs of the clicked cell
+    def onCellClicked(self, index):
+        if self.result is None:
+            return
+        self.settingsChosen.emit(
+                int(self.result.thresholds[index.row()]),
+                int(self.result.iterations[
+                        max(self.gOLIValue.currentIndex(), 0)]),
+                int(self.result.factors[index.column()]))
+
+    def closeEvent(self, event):
+        self.jobScheduler.cancel("sweep")
+        super().closeEvent(event)
+
+# heat map of one swept value, thresholds down and GOL factors across
+class SweepTableModel(QAbstractTableModel):
+    def __init__(self, grid, thresholds, factors):
+        super().__init__()
+
+        self._grid = grid
+        self._thresholds = thresholds
+        self._factors = factors
+        self._colors = sweepF.heatColors(grid)
+
+    def data(self, index, role):
+        value = self._grid[index.row(), index.column()]
+        if role == Qt.DisplayRole:
+            if value != value: # nan: no spindle in any frame
+                return ""
+            return "%.4g" % value
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignVCenter + Qt.AlignRight
+        if role == Qt.BackgroundRole:
+            red, green, blue = self._colors[index.row(), index.column()]
+            return QBrush(QColor(int(red), int(green), int(blue)))
+        if role == Qt.ForegroundRole:
+            # dark text on the light end of the color map
+            if self._colors[index.row(), index.column()].mean() > 150:
+                return QBrush(Qt.black)
+            return QBrush(Qt.white)
+
+    def rowCount(self, index):
+        return self._grid.shape[0]
+
+    def columnCount(self, index):
+        return self._grid.shape[1]
+
+    def headerData(self, section, orientation, role):
+        if role == Qt.DisplayRole:
+            if orientation == Qt.Horizontal:
+                return F"Factor {self._factors[section]}"
+
+            if orientation == Qt.Vertical:
+                return str(self._thresholds[section])
+
 # create and display the application if this file is being run
 if __name__ == "__main__":
+    instrumentF.enableFromEnvironment()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,218 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+from os import cpu_count
+from numpy import isscalar
+import tiffFunctions as tiffF
+import threshFunctions as threshF
+import curveFitData as cFD
+import cacheFunctions as cacheF
+import instrumentFunctions as instrumentF
+
+# number of frames whose curves measureStack fits in one batch
+FIT_BATCH_FRAMES = 16
+
+# how the worker processes of measureStackParallel are started. they must
+# not be forked from a process that has the stack (or the result cache)
+# open, or they would all read through its file handle (and write through
+# its SQLite connection), so they start from a clean process
+WORKER_START_METHOD = ("forkserver" if "forkserver" in
+                       get_all_start_methods() else "spawn")
+
+# thresholds and measures one frame, returning the data row and whether a
+# spindle was found (taking the analysis from the resultCache, a
+# cacheFunctions.ResultCache, if it has it and storing it there if not)
+def measureFrame(imageArr, thresh, gOLI, gOLF, golMode=threshF.GOL_LEGACY,
+                 rotationMode=cFD.ROTATE_RESAMPLE, resultCache=None):
+    def analyze():
+        threshArr = threshF.applyThreshToArr(imageArr, thresh, gOLI, gOLF,
+                                             golMode)
+        return cFD.analyzeSpindle(imageArr, threshArr, rotationMode)
+
+    if resultCache is None:
+        analysis = analyze()
+    else:
+        analysis = resultCache.cachedAnalysis(
+                imageArr, cacheF.resultParams(thresh, gOLI, gOLF, golMode,
+                                              rotationMode), analyze)
+    return list(analysis.data), analysis.doesSpindleExist
+
+# the threshold of a frame, where thresh is either one threshold for every
+# frame or a sequence of thresholds, one per frame (e.g. from
+# histogramFunctions.autoThresholds)
+def frameThresh(thresh, frameIndex):
+    if isscalar(thresh):
+        return thresh
+    return thresh[frameIndex]
+
+# returns the indices (from 0) of the frames to measure, leaving out the
+# skipped frame numbers (from 1, like the GUI)
+def framesToMeasure(numFrames, skipFrames=()):
+    skipFrames = set(skipFrames)
+    return [f for f in range(numFrames) if f + 1 not in skipFrames]
+
+# measures the frames of a stack in order, yielding
+# (frameIndex, data, doesSpindleExist) for every frame that is not skipped
+# the curves of fitBatchFrames frames at a time are fit together
+# thresh is one threshold or one per frame (see frameThresh)
+# frames the resultCache (a cacheFunctions.ResultCache) has already seen
+# with the same inputs (including the track they were searched around)
+# are taken from it, the rest are stored in it, and
+# the frames with a spindle are recorded in it as added (see
+# ResultCache.recordAdded) so the GUI brings them back
+# the frames of a hyperstack are its time points projected over Z (see
+# tiffF.PROJECTIONS)
+# tracking looks for the spindle of each frame near the one of the frame
+# before it (see trackFrame), searching the whole frame only for the
+# first frame and when the track is lost
+def measureStack(fileName, thresh, gOLI, gOLF, skipFrames=(),
+                 golMode=threshF.GOL_LEGACY, fitBatchFrames=FIT_BATCH_FRAMES,
+                 rotationMode=cFD.ROTATE_RESAMPLE, resultCache=None,
+                 projection=None, tracking=False):
+    stack = tiffF.openTiffStack(fileName, projection)
+    frameIndices = framesToMeasure(stack.numFrames, skipFrames)
+    if resultCache is not None:
+        stackKey = cacheF.stackIdentity(stack)
+
+    track = None
+    for start in range(0, len(frameIndices), fitBatchFrames):
+        batchIndices = frameIndices[start:start + fitBatchFrames]
+        analyses = {}
+        frameKeys = []
+        geometries = []
+        cacheKeys = []
+        frameCacheKeys = {}
+        for f in batchIndices:
+            with instrumentF.frame(fileName, f):
+                imageArr = stack.frame(f)
+                if resultCache is not None:
+                    with instrumentF.stage("cache"):
+                        cacheKey = (cacheF.frameHash(imageArr),
+                                    cacheF.resultParams(
+                                            frameThresh(thresh, f), gOLI,
+                                            gOLF, golMode, rotationMode,
+                                            track))
+                        analyses[f] = resultCache.analysis(*cacheKey)
+                    frameCacheKeys[f] = cacheKey
+                    if analyses[f] is not None:
+                        if tracking:
+                            track = (cFD.spindleTrack(analyses[f].geometry)
+                                     if analyses[f].doesSpindleExist
+                                     else None)
+                        continue
+                    cacheKeys.append(cacheKey)
+
+                geometry = None
+                if track is not None:
+                    geometry = trackFrame(imageArr, track,
+                                          frameThresh(thresh, f), gOLI,
+                                          gOLF, golMode)
+                if geometry is None:
+                    threshArr = threshF.applyThreshToArr(
+                            imageArr, frameThresh(thresh, f), gOLI, gOLF,
+                            golMode)
+                    geometry = cFD.findSpindle(imageArr, threshArr)
+                if tracking:
+                    track = (None if geometry is None
+                             else cFD.spindleTrack(geometry))
+            frameKeys.append((fileName, f))
+            geometries.append(geometry)
+
+        # the batched fit is recorded for the stack rather than a frame
+        if geometries:
+            with instrumentF.frame(fileName, None):
+                fitted = cFD.analyzeGeometries(geometries, frameKeys,
+                                               rotationMode)
+            for (stackName, f), analysis in zip(frameKeys, fitted):
+                analyses[f] = analysis
+            for cacheKey, analysis in zip(cacheKeys, fitted):
+                with instrumentF.stage("cache"):
+                    resultCache.store(*cacheKey, analysis)
+
+        if resultCache is not None:
+            with instrumentF.stage("cache"):
+                resultCache.recordAddedFrames(
+                        stackKey, [(f, *frameCacheKeys[f])
+                                   for f in batchIndices
+                                   if analyses[f].doesSpindleExist])
+
+        for frameIndex in batchIndices:
+            analysis = analyses[frameIndex]
+            yield frameIndex, list(analysis.data), analysis.doesSpindleExist
+
+# tracking: thresholds only the search window of a frame around the
+# spindle of the previous frame and looks for the spindle in it, returning
+# its SpindleGeometry or None if the track is lost (see cFD.trackSpindle)
+def trackFrame(imageArr, track, thresh, gOLI, gOLF,
+               golMode=threshF.GOL_LEGACY):
+    window = cFD.searchWindow(track, imageArr.shape)
+    top, left, bottom, right = window
+    windowThreshArr = threshF.applyThreshToArr(
+            imageArr[top:bottom, left:right], thresh, gOLI, gOLF, golMode)
+    return cFD.trackSpindle(imageArr, windowThreshArr, window, track)
+
+# runs in a worker process: reads the frame from the worker's own open
+# stack (memory mapped when possible) so no pixels are sent between
+# processes, and returns only the small data row. each worker opens the
+# result cache file itself if one is given, and records the frame in it
+# like measureStack does
+def measureFrameInWorker(fileName, frameIndex, thresh, gOLI, gOLF, golMode,
+                         rotationMode, cacheFileName=None, projection=None):
+    stack = tiffF.openTiffStack(fileName, projection)
+    imageArr = stack.frame(frameIndex)
+    resultCache = None
+    if cacheFileName is not None:
+        resultCache = cacheF.openResultCache(cacheFileName)
+    data, doesSpindleExist = measureFrame(imageArr, thresh, gOLI, gOLF,
+                                          golMode, rotationMode,
+                                          resultCache)
+    if resultCache is not None and doesSpindleExist:
+        resultCache.recordAdded(cacheF.stackIdentity(stack), frameIndex,
+                                cacheF.frameHash(imageArr),
+                                cacheF.resultParams(thresh, gOLI, gOLF,
+                                                    golMode, rotationMode))
+    return [float(d) for d in data], doesSpindleExist
+
+# measures the frames of a stack in numWorkers processes, yielding the same
+# (frameIndex, data, doesSpindleExist) tuples as measureStack in frame
+# order. at most maxInFlight frames are queued or running at once, so
+# memory stays bounded however long the stack is
+def measureStackParallel(fileName, thresh, gOLI, gOLF, skipFrames=(),
+                         golMode=threshF.GOL_LEGACY, numWorkers=None,
+                         maxInFlight=None, rotationMode=cFD.ROTATE_RESAMPLE,
+                         resultCache=None, projection=None):
+    if numWorkers is None:
+        numWorkers = cpu_count() or 1
+    if maxInFlight is None:
+        maxInFlight = 2 * numWorkers
+    if numWorkers < 1 or maxInFlight < 1:
+        raise ValueError("numWorkers and maxInFlight must be at least 1")
+
+    frameIndices = framesToMeasure(
+            tiffF.openTiffStack(fileName, projection).numFrames, skipFrames)
+    cacheFileName = None
+    if resultCache is not None:
+        cacheFileName = resultCache.fileName
+
+    with ProcessPoolExecutor(
+            numWorkers, mp_context=get_context(WORKER_START_METHOD)) as pool:
+        pending = deque()
+        try:
+            for frameIndex in frameIndices:
+                pending.append((frameIndex, pool.submit(
+                        measureFrameInWorker, fileName, frameIndex,
+                        frameThresh(thresh, frameIndex), gOLI, gOLF,
+                        golMode, rotationMode, cacheFileName, projection)))
+
+                # hand back the oldest frame before queueing more
+                if len(pending) >= maxInFlight:
+                    doneIndex, future = pending.popleft()
+                    yield (doneIndex, *future.result())
+
+            while pending:
+                doneIndex, future = pending.popleft()
+                yield (doneIndex, *future.result())
+        finally:
+            # stop queued frames if the caller gives up early
+            for doneIndex, future in pending:
+                future.cancel()
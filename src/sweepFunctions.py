@@ -0,0 +1,127 @@
+from typing import NamedTuple
+from numpy import (asarray, argsort, searchsorted, arange, zeros, full, nan,
+                   ndarray, float64, uint8, where, isnan, errstate, linspace,
+                   interp, rint)
+from numpy import nanmean
+import threshFunctions as threshF
+import labelFunctions as labelF
+import curveFitData as cFD
+
+# the results of a parameter sweep
+# thresholds, iterations, factors: the values swept, in the order given
+# numObjects: number of objects left after thresholding, with shape
+#             (frames, thresholds, iterations, factors)
+# data: the DATA_NAMES values, with one more axis of length 5
+#       (zeros where there is no spindle, like the GUI table)
+# doesSpindleExist: whether a spindle was found, shaped like numObjects
+class SweepResult(NamedTuple):
+    thresholds: ndarray
+    iterations: ndarray
+    factors: ndarray
+    numObjects: ndarray
+    data: ndarray
+    doesSpindleExist: ndarray
+
+# thresholds, plays game of life and measures one or more frames with every
+# combination of the given thresholds, GOL iterations and GOL factors
+# all the thresholds of a frame are played together as one stack, each GOL
+# factor is played once up to the largest number of iterations (measuring
+# on the way), and the curves of all the thresholds are fit together
+def sweepFrames(imageArrs, thresholds, iterations, factors,
+                golMode=threshF.GOL_LEGACY):
+    thresholds = asarray(thresholds)
+    iterations = asarray(iterations, dtype=int)
+    factors = asarray(factors, dtype=int)
+    if len(set(iterations.tolist())) != len(iterations):
+        raise ValueError("the GOL iterations must not repeat")
+    if len(iterations) and iterations.min() < 0:
+        raise ValueError("the GOL iterations must not be negative")
+
+    shape = (len(imageArrs), len(thresholds), len(iterations), len(factors))
+    numObjects = zeros(shape, dtype=int)
+    data = zeros(shape + (len(cFD.DATA_NAMES),))
+    doesSpindleExist = zeros(shape, dtype=bool)
+
+    iterationIndex = {int(it): i for i, it in enumerate(iterations)}
+    maxIterations = max(iterationIndex, default=-1)
+
+    for n, imageArr in enumerate(imageArrs):
+        threshMasks = thresholdStack(imageArr, thresholds)
+
+        for f, factor in enumerate(factors):
+            masks = threshMasks.copy()
+            for it in range(maxIterations + 1):
+                if it > 0:
+                    threshF.golStep(masks, int(factor), golMode)
+                if it not in iterationIndex:
+                    continue
+
+                i = iterationIndex[it]
+                for t, mask in enumerate(masks):
+                    numObjects[n, t, i, f] = len(labelF.labelThreshArr(
+                            mask)[1])
+
+                analyses = cFD.analyzeSpindles([imageArr] * len(masks),
+                                               list(masks))
+                for t, analysis in enumerate(analyses):
+                    data[n, t, i, f] = analysis.data
+                    doesSpindleExist[n, t, i, f] = analysis.doesSpindleExist
+
+    return SweepResult(thresholds, iterations, factors, numObjects, data,
+                       doesSpindleExist)
+
+# the thresholded image for each threshold as a (thresholds, H, W) stack,
+# with the outsides set to False like applyThreshToArr
+# each pixel is looked up once among the sorted thresholds: it is above the
+# first `level` of them, and the stack is read off those levels
+def thresholdStack(imageArr, thresholds):
+    thresholds = asarray(thresholds)
+    order = argsort(thresholds, kind="stable")
+    levels = searchsorted(thresholds[order], imageArr, side="left")
+
+    masks = zeros((len(thresholds),) + imageArr.shape, dtype=bool)
+    masks[order] = levels[None] > arange(len(thresholds))[:, None, None]
+    threshF.clearBorders(masks)
+    return masks
+
+# a (thresholds, iterations, factors) grid of one of the swept values,
+# averaged over the frames
+# metric is -1 for the object count or an index into DATA_NAMES, which is
+# only averaged over the frames with a spindle (nan if there are none)
+def sweepGrid(result, metric):
+    if metric < 0:
+        return result.numObjects.mean(axis=0)
+
+    values = where(result.doesSpindleExist, result.data[..., metric], nan)
+    grid = full(values.shape[1:], nan, dtype=float64)
+    hasSpindle = ~isnan(values).all(axis=0)
+    with errstate(invalid="ignore"):
+        grid[hasSpindle] = nanmean(values[:, hasSpindle], axis=0)
+    return grid
+
+# colors of a heat map, from dark blue (lowest) through teal to yellow
+# (highest), and of the cells without a value
+HEAT_COLORS = ((68, 1, 84), (33, 145, 140), (253, 231, 37))
+MISSING_COLOR = (128, 128, 128)
+
+# the uint8 RGB color of each value of a grid, with the colors along a new
+# last axis
+def heatColors(grid):
+    grid = asarray(grid, dtype=float64)
+    hasValue = ~isnan(grid)
+    colors = zeros(grid.shape + (3,), dtype=uint8)
+    colors[:] = MISSING_COLOR
+    if not hasValue.any():
+        return colors
+
+    lowest = grid[hasValue].min()
+    highest = grid[hasValue].max()
+    scaled = zeros(grid.shape)
+    if highest > lowest:
+        scaled[hasValue] = (grid[hasValue] - lowest) / (highest - lowest)
+
+    anchors = linspace(0, 1, len(HEAT_COLORS))
+    for c in range(3):
+        channel = interp(scaled, anchors, [color[c] for color in HEAT_COLORS])
+        colors[..., c] = where(hasValue, rint(channel), MISSING_COLOR[c])
+    return colors
@@ -1,26 +1,128 @@
-from numpy import sum as npsum
+from numpy import arange, where, logical_not, take_along_axis, intp
+from numpy import maximum as npmaximum
+import instrumentFunctions as instrumentF
 
-# applies a threshold to an image array
-def applyThreshToArr(arr, thresh, gOLI, gOLF):
+# game of life update modes
+# legacy: cells are updated in place in row-major order, so each cell sees
+#         the already-updated cells above and to the left of it
+# synchronous: every cell is updated from the previous iteration's values
+GOL_LEGACY = "legacy"
+GOL_SYNCHRONOUS = "synchronous"
+GOL_MODES = (GOL_LEGACY, GOL_SYNCHRONOUS)
+
+# applies a threshold to an image array (or a stack of image arrays
+# with frames along the first axis)
+def applyThreshToArr(arr, thresh, gOLI, gOLF, mode=GOL_LEGACY):
+
+    if mode not in GOL_MODES:
+        raise ValueError(F"unknown game of life mode: {mode}")
+
+    # apply the initial threshold
+    output = threshMask(arr, thresh)
+
+    # play game of life with the thresholded image (which nothing else
+    # holds, so it isn't copied)
+    return golMask(output, gOLI, gOLF, mode, copy=False)
+
+# the first half of applyThreshToArr: the image array thresholded, with
+# its outsides cleared
+def threshMask(arr, thresh):
+    with instrumentF.stage("threshold"):
+        output = arr > thresh
+        clearBorders(output)
+    return output
+
+# the second half of applyThreshToArr: gOLI game of life iterations
+# played on a copy of a threshMask (or on the mask itself without copy)
+def golMask(mask, gOLI, gOLF, mode=GOL_LEGACY, copy=True):
+
+    if mode not in GOL_MODES:
+        raise ValueError(F"unknown game of life mode: {mode}")
+
+    with instrumentF.stage("gol"):
+        output = mask.copy() if copy else mask
+        playGol(output, gOLI, gOLF, mode)
+    return output
+
+# plays gOLI game of life iterations in place on a thresholded image (or
+# a stack of them) whose outsides are False
+def playGol(output, gOLI, gOLF, mode=GOL_LEGACY):
 
     # game of life factor and number of iterations
     gOLFactor = gOLF
     gOLIterations = gOLI
 
-    # apply the initial threshold
-    output = arr > thresh
+    for i in range(0, gOLIterations):
+        golStep(output, gOLFactor, mode)
 
-    # set the outsides of the image to False
-    output[0, :] = False
-    output[:, 0] = False
-    output[len(output) - 1, :] = False
-    output[:, len(output[0]) - 1] = False
+# sets the outsides of an image (or of each image in a stack) to False
+def clearBorders(output):
+    output[..., 0, :] = False
+    output[..., :, 0] = False
+    output[..., -1, :] = False
+    output[..., :, -1] = False
 
-    # play game of life with the thresholded image
-    for i in range(0, gOLIterations):
-        for r in range(1, len(output) - 1):
-            for c in range(1, len(output[r]) - 1):
-                if (npsum(output[r-1:r+2, c-1:c+2]) < gOLFactor):
-                    output[r][c] = False
+# plays one game of life iteration in place on a thresholded image (or a
+# stack of them) whose outsides are False
+def golStep(output, gOLF, mode=GOL_LEGACY):
+
+    # images too small to have an inside are left as they are
+    if output.shape[-2] < 3 or output.shape[-1] < 3:
+        return
+
+    if mode == GOL_LEGACY:
+        golLegacyStep(output, gOLF)
+    else:
+        golSynchronousStep(output, gOLF)
+
+# counts the live cells in the 3x3 neighborhood (center included) of every
+# inside cell, returning an array two smaller in each image dimension
+def neighborCounts(output):
+    rows = output.shape[-2]
+    cols = output.shape[-1]
+
+    # sum three shifted copies along the columns, then along the rows
+    colSums = (output[..., :, 0:cols - 2].astype(intp)
+               + output[..., :, 1:cols - 1]
+               + output[..., :, 2:cols])
+    return (colSums[..., 0:rows - 2, :] + colSums[..., 1:rows - 1, :]
+            + colSums[..., 2:rows, :])
+
+# one game of life iteration where every cell updates at the same time
+def golSynchronousStep(output, gOLFactor):
+    output[..., 1:-1, 1:-1] &= neighborCounts(output) >= gOLFactor
+
+# one game of life iteration that matches the original per-pixel loop,
+# which cleared cells in place while scanning the image row by row
+def golLegacyStep(output, gOLFactor):
+    cols = output.shape[-1]
+    insideIndex = arange(0, cols - 2)
+
+    for r in range(1, output.shape[-2] - 1):
+        # row r-1 has already been updated and row r+1 has not, so their
+        # contributions to each neighborhood are fixed
+        above = output[..., r - 1, :].astype(intp)
+        below = output[..., r + 1, :]
+        row = output[..., r, :]
+        fixed = (above[..., 0:cols - 2] + above[..., 1:cols - 1]
+                 + above[..., 2:cols] + below[..., 0:cols - 2]
+                 + below[..., 1:cols - 1] + below[..., 2:cols]
+                 + row[..., 1:cols - 1] + row[..., 2:cols])
+
+        # the only unknown is the left neighbor, which may have just been
+        # cleared. if it started out dead, or the cell dies (or lives)
+        # either way, the outcome is decided without it
+        leftAlive = row[..., 0:cols - 2]
+        diesIfLeftDead = fixed < gOLFactor
+        diesIfLeftAlive = fixed + 1 < gOLFactor
+        decided = logical_not(leftAlive) | (diesIfLeftDead == diesIfLeftAlive)
+        dies = diesIfLeftDead & decided
+
+        # otherwise the cell dies exactly when its left neighbor did, so
+        # carry the last decided outcome to the right (column 0 is always
+        # dead, so the first inside cell is always decided)
+        lastDecided = where(decided, insideIndex, 0)
+        npmaximum.accumulate(lastDecided, axis=-1, out=lastDecided)
+        dies = take_along_axis(dies, lastDecided, axis=-1)
 
-    return output
\ No newline at end of file
+        output[..., r, 1:cols - 1] &= logical_not(dies)
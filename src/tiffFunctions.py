@@ -1,66 +1,368 @@
-from PIL import Image, ImageQt, ImageSequence
-from PySide6.QtGui import QPixmap
-from numpy import array, zeros, ones, reshape, uint8
+import re
+from collections import OrderedDict
+from os import path
+from threading import Lock
+from typing import NamedTuple
+from xml.etree import ElementTree
+from PIL import Image
+from numpy import (array, zeros, uint8, memmap, maximum, float32, float64,
+                   int64, rint, issubdtype, integer)
+from numpy import dtype as npdtype
+import instrumentFunctions as instrumentF
 
-# returns the number of frames in a tiff image
-def framesInTiff(tiffFileName):
+# default memory budget for the decoded frames kept by a TiffStack
+FRAME_CACHE_BYTES = 256 * 1024 * 1024
+
+# ways of projecting the Z slices of each time point of a hyperstack into
+# the one frame that is measured
+# max: the brightest value of each pixel over Z
+# mean: the average of each pixel over Z (rounded for integer images)
+# focus: the slice that is most in focus (with the largest variance of its
+#        Laplacian), unchanged
+PROJECT_MAX = "max"
+PROJECT_MEAN = "mean"
+PROJECT_FOCUS = "focus"
+PROJECTIONS = (PROJECT_MAX, PROJECT_MEAN, PROJECT_FOCUS)
+
+# stacks shared by everything that reads the same file
+openStacks = {}
+
+# numpy types of uncompressed pixels by (SampleFormat, BitsPerSample)
+MEMMAP_TYPES = {(1, 8): "u1", (1, 16): "u2", (1, 32): "u4",
+                (2, 8): "i1", (2, 16): "i2", (2, 32): "i4",
+                (3, 32): "f4", (3, 64): "f8"}
+
+# the sizes of the time, Z and channel dimensions of a stack's pages, and
+# the number of pages between neighbours along each (so the page of time
+# point t, slice z and channel c is t * tStep + z * zStep + c * cStep)
+class StackDimensions(NamedTuple):
+    sizeT: int
+    sizeZ: int
+    sizeC: int
+    tStep: int
+    zStep: int
+    cStep: int
+
+    def page(self, t, z=0, c=0):
+        return t * self.tStep + z * self.zStep + c * self.cStep
+
+# dimensions of a stack whose every page is a time point
+def flatDimensions(numPages):
+    return StackDimensions(numPages, 1, 1, 1, 0, 0)
+
+# finds the dimensions of a stack from the ImageDescription of its first
+# page, written by ImageJ (pages in CZT order) or as OME-XML (in the
+# DimensionOrder it gives). stacks without either, or whose sizes don't
+# add up to the number of pages, are taken to be flat
+def stackDimensions(description, numPages):
+    if description.startswith("ImageJ="):
+        dimensions = imageJDimensions(description)
+    elif "<OME" in description:
+        dimensions = omeDimensions(description)
+    else:
+        dimensions = None
+
+    if (dimensions is None
+            or dimensions.sizeT * dimensions.sizeZ * dimensions.sizeC
+            != numPages):
+        return flatDimensions(numPages)
+    return dimensions
+
+def imageJDimensions(description):
+    values = dict(re.findall(r"^(\w+)=(.*)$", description, re.MULTILINE))
+
+    def size(name):
+        return int(values.get(name, 1))
+
+    try:
+        sizeC, sizeZ = size("channels"), size("slices")
+        sizeT = size("frames")
+        if "frames" not in values:
+            sizeT = size("images") // (sizeC * sizeZ)
+    except ValueError:
+        return None
+    return StackDimensions(sizeT, sizeZ, sizeC, sizeZ * sizeC, sizeC, 1)
+
+def omeDimensions(description):
+    try:
+        root = ElementTree.fromstring(description)
+    except ElementTree.ParseError:
+        return None
+    pixels = next((e for e in root.iter() if e.tag.endswith("}Pixels")
+                   or e.tag == "Pixels"), None)
+    if pixels is None:
+        return None
+
+    # the dimensions after X and Y, from the one whose pages follow each
+    # other to the one that changes slowest
+    order = pixels.get("DimensionOrder", "XYZCT")[2:]
+    try:
+        sizes = {d: int(pixels.get("Size" + d, 1)) for d in order}
+    except ValueError:
+        return None
+    steps = {}
+    step = 1
+    for d in order:
+        steps[d] = step
+        step *= sizes[d]
+    return StackDimensions(sizes["T"], sizes["Z"], sizes["C"], steps["T"],
+                           steps["Z"], steps["C"])
+
+# a multipage tiff kept open for random access to its frames
+# uncompressed pages are read as memory mapped views onto the file, and
+# any other pages are decoded by PIL into a least recently used cache
+# the frames of a hyperstack (with Z slices, see stackDimensions) are its
+# time points, each projected over Z as it is read, one slice at a time
+# (only the channel given is read from stacks with several)
+class TiffStack():
+
+    def __init__(self, fileName, cacheBytes=FRAME_CACHE_BYTES,
+                 useMemmap=True, projection=PROJECT_MAX, channel=0):
+
+        if projection not in PROJECTIONS:
+            raise ValueError(F"unknown Z projection: {projection}")
+        self.fileName = fileName
+        self.cacheBytes = cacheBytes
+        self.projection = projection
+
+        # PIL records the offset of every page it walks past, so counting
+        # the pages once indexes the file and later seeks are direct
+        self._image = Image.open(fileName)
+        self.numPages = getattr(self._image, "n_frames", 1)
+        self._image.seek(0)
+        self.dimensions = stackDimensions(
+                str(self._image.tag_v2.get(270, "")), self.numPages)
+        self.numFrames = self.dimensions.sizeT
+        self.channel = min(channel, self.dimensions.sizeC - 1)
+
+        # find where the pixels of each uncompressed page sit in the file
+        self._fileMap = None
+        self._pageLayouts = [None] * self.numPages
+        if useMemmap:
+            for pageNum in range(self.numPages):
+                self._image.seek(pageNum)
+                self._pageLayouts[pageNum] = self._pageLayout()
+            if any(self._pageLayouts):
+                self._fileMap = memmap(fileName, dtype=uint8, mode="r")
+
+        # True when every frame is read without decoding
+        self.isMemmapped = all(self._pageLayouts)
+
+        # decoded frames from least to most recently used
+        self._cache = OrderedDict()
+        self._cachedBytes = 0
+
+        # the PIL image can only decode one frame at a time
+        self._lock = Lock()
+
+    def __len__(self):
+        return self.numFrames
+
+    def __getitem__(self, frameNum):
+        return self.frame(frameNum)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    # True for stacks with more than one Z slice per time point
+    def isHyperstack(self):
+        return self.dimensions.sizeZ > 1
+
+    # returns frame frameNum (counting from 0) as a read-only array
+    # frames read with useCache False are not added to the cache (nor
+    # moved up in it), for passes over the whole stack that shouldn't push
+    # out the frames in use
+    def frame(self, frameNum, useCache=True):
+        if frameNum < 0 or frameNum >= self.numFrames:
+            raise IndexError(F"frame {frameNum} is not in {self.fileName}, "
+                             F"which has {self.numFrames} frames")
 
-    # turn the file into a PIL Image
-    tiffImage = Image.open(tiffFileName)
+        if not self.isHyperstack():
+            pageNum = self.dimensions.page(frameNum, 0, self.channel)
+            if self._pageLayouts[pageNum] is not None:
+                return self._mappedPage(pageNum)
 
-    return getattr(tiffImage, "n_frames", 1)
+        with self._lock:
+            if frameNum in self._cache:
+                if useCache:
+                    self._cache.move_to_end(frameNum)
+                return self._cache[frameNum]
+
+            if not self.isHyperstack():
+                arr = self._decodePage(pageNum)
+                if useCache:
+                    self._addToCache(frameNum, arr)
+                return arr
+
+        # the slices are read without holding the lock (decoding takes it
+        # for each slice)
+        arr = self._project(frameNum)
+        arr.setflags(write=False)
+        if useCache:
+            with self._lock:
+                self._addToCache(frameNum, arr)
+        return arr
+
+    # the frames in order, read without caching them (see frame)
+    def uncachedFrames(self):
+        for frameNum in range(self.numFrames):
+            yield self.frame(frameNum, useCache=False)
+
+    # returns page pageNum of the file (a time point, slice or channel) as
+    # a read-only array, without caching it
+    def page(self, pageNum):
+        if self._pageLayouts[pageNum] is not None:
+            return self._mappedPage(pageNum)
+        with self._lock:
+            return self._decodePage(pageNum)
+
+    def _mappedPage(self, pageNum):
+        offset, dtype, shape = self._pageLayouts[pageNum]
+        return (self._fileMap[offset:offset + dtype.itemsize * shape[0]
+                              * shape[1]].view(dtype).reshape(shape))
+
+    # the lock has to be held
+    def _decodePage(self, pageNum):
+        with instrumentF.stage("decode"):
+            self._image.seek(pageNum)
+            arr = array(self._image)
+        arr.setflags(write=False)
+        return arr
+
+    # the projection of the Z slices of time point frameNum, keeping only
+    # the running result and the slice being read. only the arithmetic is
+    # recorded as "project", reading the slices is recorded as "decode"
+    def _project(self, frameNum):
+        pageNums = [self.dimensions.page(frameNum, z, self.channel)
+                    for z in range(self.dimensions.sizeZ)]
+
+        if self.projection == PROJECT_MAX:
+            arr = array(self.page(pageNums[0]))
+            for pageNum in pageNums[1:]:
+                zSlice = self.page(pageNum)
+                with instrumentF.stage("project"):
+                    maximum(arr, zSlice, out=arr)
+            return arr
+
+        if self.projection == PROJECT_MEAN:
+            first = self.page(pageNums[0])
+            isInteger = issubdtype(first.dtype, integer)
+            total = first.astype(int64 if isInteger else float64)
+            for pageNum in pageNums[1:]:
+                zSlice = self.page(pageNum)
+                with instrumentF.stage("project"):
+                    total += zSlice
+            with instrumentF.stage("project"):
+                mean = total / len(pageNums)
+                if isInteger:
+                    mean = rint(mean)
+                return mean.astype(first.dtype)
+
+        bestScore = -1.0
+        for pageNum in pageNums:
+            arr = self.page(pageNum)
+            with instrumentF.stage("project"):
+                score = focusScore(arr)
+            if score > bestScore:
+                best, bestScore = arr, score
+        return array(best)
+
+    # forget all decoded frames
+    def clearCache(self):
+        with self._lock:
+            self._cache.clear()
+            self._cachedBytes = 0
+
+    def close(self):
+        self.clearCache()
+        self._image.close()
+
+        # views that are still in use keep the mapping open
+        self._fileMap = None
+        self._pageLayouts = [None] * self.numPages
+
+    # returns (offset, dtype, shape) of the current page's pixels if they
+    # are stored uncompressed in one contiguous block, otherwise None
+    def _pageLayout(self):
+        tags = self._image.tag_v2
+
+        def tagValue(tag, default):
+            value = tags.get(tag, default)
+            return value[0] if isinstance(value, tuple) else value
+
+        # compression, samples per pixel, fill order and tiling
+        if (tagValue(259, 1) != 1 or tagValue(277, 1) != 1
+                or tagValue(266, 1) != 1 or 322 in tags):
+            return None
+
+        typeCode = MEMMAP_TYPES.get((tagValue(339, 1), tagValue(258, 1)))
+        offsets = tags.get(273)
+        byteCounts = tags.get(279)
+        if typeCode is None or not offsets or not byteCounts:
+            return None
+        dtype = npdtype(tags._endian + typeCode)
+        shape = (tagValue(257, 0), tagValue(256, 0))
+
+        # the strips have to follow each other directly in the file
+        for i in range(len(offsets) - 1):
+            if offsets[i] + byteCounts[i] != offsets[i + 1]:
+                return None
+        if sum(byteCounts) < dtype.itemsize * shape[0] * shape[1]:
+            return None
+
+        return offsets[0], dtype, shape
+
+    # store a decoded frame, dropping the least recently used frames to
+    # stay within the memory budget
+    def _addToCache(self, frameNum, arr):
+        if arr.nbytes > self.cacheBytes:
+            return
+
+        self._cache[frameNum] = arr
+        self._cachedBytes += arr.nbytes
+        while self._cachedBytes > self.cacheBytes:
+            oldFrame, oldArr = self._cache.popitem(last=False)
+            self._cachedBytes -= oldArr.nbytes
+
+# how sharp a slice is: the variance of its Laplacian
+def focusScore(arr):
+    arr = arr.astype(float32)
+    laplacian = (arr[:-2, 1:-1] + arr[2:, 1:-1] + arr[1:-1, :-2]
+                 + arr[1:-1, 2:] - 4 * arr[1:-1, 1:-1])
+    return float(laplacian.var()) if laplacian.size else 0.0
+
+# returns the shared TiffStack for a file, opening it if needed
+# a hyperstack open with a different projection is opened again with the
+# one given (None keeps the one it has, PROJECT_MAX for a new stack)
+def openTiffStack(tiffFileName, projection=None):
+    key = path.abspath(tiffFileName)
+    stack = openStacks.get(key)
+    if (stack is not None and projection is not None
+            and stack.isHyperstack() and stack.projection != projection):
+        closeTiffStack(tiffFileName)
+        stack = None
+    if stack is None:
+        stack = TiffStack(tiffFileName,
+                          projection=projection or PROJECT_MAX)
+        openStacks[key] = stack
+    return stack
+
+# closes the shared TiffStack for a file if it is open
+def closeTiffStack(tiffFileName):
+    stack = openStacks.pop(path.abspath(tiffFileName), None)
+    if stack is not None:
+        stack.close()
+
+# returns the number of frames in a tiff image
+def framesInTiff(tiffFileName):
+    return openTiffStack(tiffFileName).numFrames
 
 # takes a .tiff file path and turns the image into an array
 def arrFromTiff(tiffFileName, frameNum):
-
-    # turn the file into a PIL Image
-    tiffImage = Image.open(tiffFileName)
-
-    # select the frame of the tiff using frameNum
-    ims = ImageSequence.Iterator(tiffImage)
-    im = ims[frameNum]
-
-    # create the array
-    return array(im)
-
-# creates a normalized QPixmap from a numpy array
-def pixFromArr(arr):
-    # normalize the array
-    temp = zeros(arr.shape, dtype = uint8)
-    lowest = 100000
-    highest = 0
-    for i in range(0, arr.shape[0]):
-        for j in range(0, arr.shape[1]):
-            if arr[i][j] < lowest:
-                lowest = arr[i][j]
-            if arr[i][j] > highest:
-                highest = arr[i][j]
-
-    for i in range(0, arr.shape[0]):
-        for j in range(0, arr.shape[1]):        
-            temp[i][j] = int(255 *
-                    ( (arr[i][j] - lowest) / (highest - lowest) ))
-
-    im = Image.fromarray(temp)
-    im = ImageQt.ImageQt(im)
-    return QPixmap.fromImage(im)
-
-# same as pixFromArr, but no normalization
-def threshPixFromArr(arr):
-    im = Image.fromarray(arr)
-    im = ImageQt.ImageQt(im)
-    return QPixmap.fromImage(im)
-
-# turns a tiff file path directly into a QPixmap
-def pixFromTiff(fileName, frameNum):
-    return pixFromArr(arrFromTiff(fileName, frameNum))
-
-# returns a grayscale pixmap
-def defaultPix(backShade):
-    array = ones(4, dtype=uint8)
-    array = reshape(array, (2, 2))
-    array *= backShade
-    return threshPixFromArr(array)
+    return openTiffStack(tiffFileName).frame(frameNum)
 
 # returns a black array with a white X for thresholds with no objects
 def threshXArr():